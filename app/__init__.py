@@ -4,6 +4,8 @@ from flask_cors import CORS
 from app.config import Config
 from app.extensions import db, migrate, make_celery
 from app.routes.video_routes import video_blueprint
+from app.routes.metrics_routes import metrics_blueprint
+from app.services.metrics import init_request_metrics
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -53,6 +55,10 @@ def create_app(config_class=Config):
 
     # Register blueprints
     app.register_blueprint(video_blueprint)
+    app.register_blueprint(metrics_blueprint)
+
+    # Latency and database queries of every request, exposed on /metrics
+    init_request_metrics(app)
 
     @app.after_request
     def after_request(response):
@@ -8,10 +8,93 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis')
+
+    # Jobs run on video_fast, video_standard or video_heavy depending on their estimated cost, each
+    # consumed by its own workers. Acknowledging late and prefetching one job at a time keeps a
+    # worker busy with a long encode from holding queued jobs that another worker could start
+    CELERY_ACKS_LATE = True
+    CELERYD_PREFETCH_MULTIPLIER = int(os.environ.get('CELERYD_PREFETCH_MULTIPLIER', 1))
+    # Estimated seconds of encoding below which a job is fast, and above which it is heavy
+    FAST_QUEUE_MAX_COST = float(os.environ.get('FAST_QUEUE_MAX_COST', 120))
+    HEAVY_QUEUE_MIN_COST = float(os.environ.get('HEAVY_QUEUE_MIN_COST', 1800))
+
+    # Caption jobs run on their own queue, consumed by workers that keep a Whisper model loaded.
+    # WHISPER_MODEL is a model name or the path of a local checkpoint; WHISPER_PRELOAD loads it when
+    # a worker process starts instead of on its first job
+    WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'small')
+    WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE')
+    WHISPER_PRELOAD = os.environ.get('WHISPER_PRELOAD', 'false').lower() == 'true'
+    # 30 second audio windows decoded together in one batch
+    CAPTION_BATCH_SIZE = int(os.environ.get('CAPTION_BATCH_SIZE', 8))
+    # TrueType font of burned-in captions
+    CAPTION_FONT = os.environ.get('CAPTION_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf')
+
+    # Redis used for job progress events and the response cache
+    REDIS_URL = os.environ.get('REDIS_URL', CELERY_BROKER_URL)
+    # Seconds a cached API response is kept; entries are also dropped as soon as a job changes them
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+    # Port on which every Celery worker exports its metrics for Prometheus; 0 disables the exporter.
+    # The API serves its own metrics on /metrics
+    WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 9808))
+    # Seconds between keep-alive comments on an idle event stream
+    EVENT_STREAM_HEARTBEAT = int(os.environ.get('EVENT_STREAM_HEARTBEAT', 15))
     
     # Use absolute paths for Docker volumes
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
     LOGO_FOLDER = os.environ.get('LOGO_FOLDER', '/app/logos')
+    # Caption files for burn_captions, and the bitmaps rendered from them in a bitmaps subfolder
+    CAPTIONS_FOLDER = os.environ.get('CAPTIONS_FOLDER', '/app/captions')
     PROCESSED_FOLDER = os.environ.get('PROCESSED_FOLDER', '/app/processed_videos')
+    # Downloads are handed to nginx with X-Accel-Redirect to this internal location, which serves
+    # PROCESSED_FOLDER. Without nginx in front, set USE_X_ACCEL_REDIRECT=false to send files from Flask
+    USE_X_ACCEL_REDIRECT = os.environ.get('USE_X_ACCEL_REDIRECT', 'true').lower() == 'true'
+    X_ACCEL_PROCESSED_PREFIX = os.environ.get('X_ACCEL_PROCESSED_PREFIX', '/protected/processed/')
+    # Public URL under which nginx serves the HLS folder of PROCESSED_FOLDER as static files
+    HLS_URL_PREFIX = os.environ.get('HLS_URL_PREFIX', '/hls/')
+    # Public URL of the previews folder (posters, sprite sheets and proxies), also served by nginx
+    PREVIEWS_URL_PREFIX = os.environ.get('PREVIEWS_URL_PREFIX', '/previews/')
     
     ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
+
+    # Upper bound for the per_page argument of the listing endpoints
+    MAX_PER_PAGE = int(os.environ.get('MAX_PER_PAGE', 100))
+
+    # Largest file accepted by the chunked upload API (bytes)
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 ** 3))
+    # Chunked uploads without a new chunk for this many seconds are abandoned and their data removed
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+
+    # Whole-video encodes (change_aspect_ratio, add_logo) of sources at least this long are split
+    # into segments of about SEGMENT_DURATION seconds that are encoded as parallel subtasks
+    SEGMENT_ENCODE_MIN_DURATION = float(os.environ.get('SEGMENT_ENCODE_MIN_DURATION', 600))
+    SEGMENT_DURATION = float(os.environ.get('SEGMENT_DURATION', 120))
+
+    # Clip requests whose start/end are within this many seconds of a keyframe are remuxed without re-encoding
+    CLIP_KEYFRAME_TOLERANCE = float(os.environ.get('CLIP_KEYFRAME_TOLERANCE', 0.5))
+
+    # Number of ffmpeg encoders a single task may run at once. The default shares the machine's cores
+    # between the worker processes started with --concurrency
+    CELERY_WORKER_CONCURRENCY = int(os.environ.get('CELERY_WORKER_CONCURRENCY', 12))
+    ENCODER_POOL_SIZE = int(os.environ.get('ENCODER_POOL_SIZE', max(1, (os.cpu_count() or 1) // CELERY_WORKER_CONCURRENCY)))
+    # Threads of every libx264 encoder, by default one encoder's share of the cores when every worker
+    # process runs a full pool, so pooled tasks do not start more threads than there are cores
+    ENCODER_THREADS = int(os.environ.get('ENCODER_THREADS', max(1, (os.cpu_count() or 1) // (CELERY_WORKER_CONCURRENCY * ENCODER_POOL_SIZE))))
+
+    # Encoder settings selectable per request with the encoding_profile key of the operations.
+    # balanced matches the libx264/AAC defaults; at peak load DEFAULT_ENCODING_PROFILE=fast_preview
+    # trades quality for throughput. A profile may set its own threads instead of ENCODER_THREADS
+    ENCODING_PROFILES = {
+        'fast_preview': {
+            'video_codec': 'libx264', 'preset': 'veryfast', 'crf': 28, 'pix_fmt': 'yuv420p',
+            'audio_codec': 'aac', 'audio_bitrate': '96k',
+        },
+        'balanced': {
+            'video_codec': 'libx264', 'preset': 'medium', 'crf': 23, 'pix_fmt': 'yuv420p',
+            'audio_codec': 'aac', 'audio_bitrate': '128k',
+        },
+        'archival': {
+            'video_codec': 'libx264', 'preset': 'slow', 'crf': 18, 'pix_fmt': 'yuv420p',
+            'audio_codec': 'aac', 'audio_bitrate': '192k',
+        },
+    }
+    DEFAULT_ENCODING_PROFILE = os.environ.get('DEFAULT_ENCODING_PROFILE', 'balanced')
@@ -0,0 +1,185 @@
+# app/controllers/upload_controller.py
+
+from app.models.video import UploadSession
+from app.extensions import db
+from app.controllers.video_controller import parse_operations, save_logo, save_captions, inspect_upload, enqueue_video_processing
+from app.services.storage import hash_file, move_content_addressed, sha256_start, sha256_update, sha256_hexdigest, CHUNK_SIZE
+from flask import jsonify, current_app
+from werkzeug.utils import secure_filename
+import os
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+def upload_part_path(upload_session):
+    """Location of a partially uploaded file; chunks are written here directly."""
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    return os.path.join(upload_folder, f"{upload_session.id}.part")
+
+
+def upload_session_data(upload_session):
+    return {
+        'upload_id': upload_session.id,
+        'filename': upload_session.filename,
+        'size': upload_session.total_size,
+        'offset': upload_session.received,
+        'status': upload_session.status,
+        'video_id': upload_session.video_id,
+    }
+
+
+def expire_upload_sessions():
+    """
+    Remove uploads that received no chunk for UPLOAD_SESSION_TTL seconds, with their partial data.
+
+    Runs whenever an upload starts, so abandoned uploads never pile up on disk.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['UPLOAD_SESSION_TTL'])
+    expired = UploadSession.query.filter(UploadSession.status == UploadSession.STATUS_UPLOADING,
+                                         UploadSession.updated_at < cutoff).all()
+    for upload_session in expired:
+        part_path = upload_part_path(upload_session)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        db.session.delete(upload_session)
+    if expired:
+        db.session.commit()
+        current_app.logger.info(f"Expired {len(expired)} abandoned uploads")
+
+
+def create_upload_session_controller(request):
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    size = data.get('size')
+
+    if filename == '':
+        return jsonify({'error': 'No filename provided'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'A positive file size is required'}), 400
+    if size > current_app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'error': 'File is too large'}), 413
+
+    expire_upload_sessions()
+
+    upload_session = UploadSession(id=str(uuid.uuid4()), filename=filename, total_size=size, received=0,
+                                   status=UploadSession.STATUS_UPLOADING, hash_state=sha256_start())
+
+    # Create the empty target file that chunks are written into
+    Path(os.path.abspath(current_app.config['UPLOAD_FOLDER'])).mkdir(parents=True, exist_ok=True)
+    open(upload_part_path(upload_session), 'wb').close()
+
+    db.session.add(upload_session)
+    db.session.commit()
+
+    return jsonify(upload_session_data(upload_session)), 201
+
+
+def get_upload_session_controller(upload_id):
+    upload_session = UploadSession.query.get_or_404(upload_id)
+    return jsonify(upload_session_data(upload_session)), 200
+
+
+def upload_chunk_controller(request, upload_id):
+    """
+    Write the raw request body at the given offset of the upload.
+
+    Chunks must be sent in order: the offset has to match the bytes received so far, which a client
+    reads back from the session after a dropped connection. Bytes that arrived before a disconnect
+    are kept, so the client only resends what is missing.
+    """
+    logger = current_app.logger
+    upload_session = UploadSession.query.get_or_404(upload_id)
+
+    if upload_session.status != UploadSession.STATUS_UPLOADING:
+        return jsonify({'error': 'Upload is already finalized'}), 409
+
+    offset = request.args.get('offset', type=int)
+    if offset != upload_session.received:
+        return jsonify({'error': 'Chunk offset does not match the uploaded size',
+                        'offset': upload_session.received}), 409
+
+    part_path = upload_part_path(upload_session)
+    if not os.path.exists(part_path):
+        return jsonify({'error': 'Upload data not found'}), 404
+
+    written = 0
+    too_large = False
+    # Chunks are hashed as they arrive, so finalizing does not read the whole file again
+    hash_state = upload_session.hash_state
+    try:
+        # Read the body straight from the WSGI stream so it is not spooled to a temporary file first
+        with open(part_path, 'r+b') as part_file:
+            part_file.seek(offset)
+            while True:
+                chunk = request.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if offset + written + len(chunk) > upload_session.total_size:
+                    too_large = True
+                    break
+                part_file.write(chunk)
+                written += len(chunk)
+                if hash_state is not None:
+                    hash_state = sha256_update(hash_state, chunk)
+    except Exception as e:
+        logger.warning(f"Upload {upload_id} interrupted after {written} bytes: {e}")
+    finally:
+        # Only advance if no other request moved the offset in the meantime
+        updated = UploadSession.query.filter_by(id=upload_id, received=offset).update(
+            {'received': offset + written, 'hash_state': hash_state, 'updated_at': datetime.utcnow()})
+        db.session.commit()
+
+    if too_large:
+        return jsonify({'error': 'Chunk exceeds the announced file size', 'offset': offset + written}), 413
+    if not updated:
+        db.session.refresh(upload_session)
+        return jsonify({'error': 'Concurrent chunk upload', 'offset': upload_session.received}), 409
+
+    db.session.refresh(upload_session)
+    return jsonify(upload_session_data(upload_session)), 200
+
+
+def complete_upload_controller(request, upload_id):
+    """
+    Finalize an upload: move it to its content-addressed location and queue its processing.
+    """
+    logger = current_app.logger
+    upload_session = UploadSession.query.get_or_404(upload_id)
+
+    if upload_session.status != UploadSession.STATUS_UPLOADING:
+        return jsonify({'error': 'Upload is already finalized', 'video_id': upload_session.video_id}), 409
+    if upload_session.received != upload_session.total_size:
+        return jsonify({'error': 'Upload is incomplete', 'offset': upload_session.received}), 400
+
+    operations, error = parse_operations(request.form.get('operations'))
+    if error:
+        return jsonify({'error': error}), 400
+    steps = operations if isinstance(operations, list) else [operations]
+
+    logo_folder = os.path.abspath(current_app.config['LOGO_FOLDER'])
+    save_logo(request, logo_folder, steps)
+    save_captions(request, os.path.abspath(current_app.config['CAPTIONS_FOLDER']), steps)
+
+    # Reject before the upload is moved so the client can retry with fixed operations
+    part_path = upload_part_path(upload_session)
+    # Uploads started without a hash state, e.g. where libcrypto could not be loaded, are hashed here
+    if upload_session.hash_state is not None:
+        content_hash = sha256_hexdigest(upload_session.hash_state)
+    else:
+        content_hash = hash_file(part_path)
+    error = inspect_upload(content_hash, part_path, operations)
+    if error:
+        return jsonify({'error': error}), 400
+
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    extension = os.path.splitext(upload_session.filename)[1].lower()
+    content_hash, upload_path = move_content_addressed(part_path, upload_folder, extension, content_hash)
+    logger.info(f"Finalized upload {upload_id} to: {upload_path}")
+
+    response, status_code = enqueue_video_processing(upload_session.filename, content_hash, upload_path, operations)
+
+    upload_session.status = UploadSession.STATUS_COMPLETED
+    upload_session.video_id = response.get_json().get('video_id')
+    db.session.commit()
+
+    return response, status_code
@@ -1,10 +1,23 @@
 # app/controllers/video_controller.py
 
 from app.models.video import Video, VideoOperation
-from app.extensions import db
-from app.tasks.video_tasks import process_video_task
-from flask import jsonify, current_app
+from app.extensions import db, redis_client
+from app.tasks.video_tasks import process_video_task, generate_previews_task, link_previews
+from app.services.videos.previews import find_previews
+from app.services.videos.pipeline import validate_pipeline, validate_logo_options, validate_aspect_ratio_options
+from app.services.videos.package_hls import validate_hls_steps, split_hls_step
+from app.services.videos.ffmpeg_utils import encoding_profile, requested_profile_name
+from app.services.storage import save_content_addressed
+from app.services.result_cache import find_cached_result, find_running_job, operations_key, upload_in_use
+from app.services.media_probe import probe_media, get_media_probe, validate_timestamps, validate_captions
+from app.services.job_routing import job_queue, QUEUE_FAST
+from app.services.pagination import keyset_page
+from app.services.response_cache import invalidate_video
+from app.services.downloads import output_paths, processed_relative_path, download_response, hls_url, preview_url
+from app.services.progress import publish_event, last_event, PROGRESS_CHANNEL, FINAL_EVENTS, EVENT_COMPLETED, EVENT_FAILED, EVENT_ABORTED
+from flask import jsonify, current_app, Response, stream_with_context, url_for
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
 import os
 import json
 from pathlib import Path
@@ -19,15 +32,10 @@ def upload_video_controller(request):
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    operations = request.form.get('operations')
-    if not operations:
-        return jsonify({'error': 'No operations provided'}), 400
-    
-    try:
-        logger.info(operations)
-        operations = json.loads(operations)
-    except json.JSONDecodeError:
-        return jsonify({'error': 'Invalid operations format'}), 400
+    operations, error = parse_operations(request.form.get('operations'))
+    if error:
+        return jsonify({'error': error}), 400
+    steps = operations if isinstance(operations, list) else [operations]
     
     # Ensure upload and logo directories exist
     upload_folder = current_app.config['UPLOAD_FOLDER']
@@ -45,122 +53,400 @@ def upload_video_controller(request):
     Path(logo_folder).mkdir(parents=True, exist_ok=True)
     logger.info(f"Logo folder created/exists: {os.path.exists(logo_folder)}")
 
-    # Save uploaded file
+    # Save uploaded file under its content hash, hashing while it is written
     filename = secure_filename(file.filename)
-    upload_path = os.path.join(upload_folder, filename)
-    file.save(upload_path)
+    content_hash, upload_path = save_content_addressed(file.stream, upload_folder, os.path.splitext(filename)[1].lower())
     logger.info(f"Saved uploaded file to: {upload_path}")
 
     # Handle logo file if present
-    if 'logo' in request.files:
-        logo_file = request.files['logo']
-        if logo_file.filename != '':
-            logo_filename = secure_filename(logo_file.filename)
-            logo_path = os.path.join(logo_folder, logo_filename)
-            logo_file.save(logo_path)
-            logger.info(f"Saved logo file to: {logo_path}")
-            
-            if operations.get('name') == 'add_logo':
-                operations['logo_filename'] = logo_filename
-                logger.info(f"Updated operations with logo path: {logo_path}")
+    logo_path = save_logo(request, logo_folder, steps)
+    save_captions(request, os.path.abspath(current_app.config['CAPTIONS_FOLDER']), steps)
 
     # Log current working directory and final paths
     logger.info(f"Current working directory: {os.getcwd()}")
     logger.info(f"Upload folder config: {current_app.config['UPLOAD_FOLDER']}")
     logger.info(f"Logo folder config: {current_app.config['LOGO_FOLDER']}")
     logger.info(f"Final upload path: {upload_path}")
-    logger.info(f"Final logo path: {logo_path if 'logo' in request.files and logo_file.filename != '' else 'No logo uploaded'}")
+    logger.info(f"Final logo path: {logo_path or 'No logo uploaded'}")
 
     # Verify file existence
     if not os.path.exists(upload_path):
         logger.error(f"Uploaded file not found: {upload_path}")
         return jsonify({'error': f'Uploaded file not found: {upload_path}'}), 404
 
-    if 'logo' in request.files and logo_file.filename != '' and not os.path.exists(logo_path):
+    if logo_path and not os.path.exists(logo_path):
         logger.error(f"Logo file not found: {logo_path}")
         return jsonify({'error': f'Logo file not found: {logo_path}'}), 404
 
-    # Save record to the database
-    video = Video(filename=filename, status=Video.STATUS_QUEUED)
+    error = inspect_upload(content_hash, upload_path, operations)
+    if error:
+        # Nothing will process this upload, unless another job shares the same content
+        if os.path.exists(upload_path) and not upload_in_use(content_hash):
+            os.remove(upload_path)
+        return jsonify({'error': error}), 400
+
+    return enqueue_video_processing(filename, content_hash, upload_path, operations)
+
+
+def parse_operations(raw_operations):
+    """
+    Parse the operations form field: a single operation or an ordered list applied in one pass.
+
+    Returns:
+        Tuple (operations, error) where error is a message if the field is missing or invalid.
+    """
+    if not raw_operations:
+        return None, 'No operations provided'
+
+    try:
+        current_app.logger.info(raw_operations)
+        operations = json.loads(raw_operations)
+    except json.JSONDecodeError:
+        return None, 'Invalid operations format'
+
+    steps = operations if isinstance(operations, list) else [operations]
+    if not steps or not all(isinstance(step, dict) for step in steps):
+        return None, 'Invalid operations format'
+    return operations, None
+
+
+def save_logo(request, logo_folder, steps):
+    """
+    Store the optional logo file of a request and point the add_logo steps at it.
+
+    Returns:
+        The path of the stored logo, or None when no logo was uploaded.
+    """
+    logger = current_app.logger
+    logo_file = request.files.get('logo')
+    if not logo_file or logo_file.filename == '':
+        return None
+
+    Path(logo_folder).mkdir(parents=True, exist_ok=True)
+    logo_extension = os.path.splitext(secure_filename(logo_file.filename))[1].lower()
+    _, logo_path = save_content_addressed(logo_file.stream, logo_folder, logo_extension)
+    logo_filename = os.path.basename(logo_path)
+    logger.info(f"Saved logo file to: {logo_path}")
+
+    for step in steps:
+        if step.get('name') == 'add_logo':
+            step['logo_filename'] = logo_filename
+            logger.info(f"Updated operations with logo path: {logo_path}")
+    return logo_path
+
+
+def save_captions(request, captions_folder, steps):
+    """
+    Store the optional SRT/VTT file of a request and point the burn_captions steps at it.
+
+    Returns:
+        The path of the stored caption file, or None when no caption file was uploaded.
+    """
+    captions_file = request.files.get('captions')
+    if not captions_file or captions_file.filename == '':
+        return None
+
+    Path(captions_folder).mkdir(parents=True, exist_ok=True)
+    captions_extension = os.path.splitext(secure_filename(captions_file.filename))[1].lower()
+    _, captions_path = save_content_addressed(captions_file.stream, captions_folder, captions_extension)
+    current_app.logger.info(f"Saved caption file to: {captions_path}")
+
+    for step in steps:
+        if step.get('name') == 'burn_captions':
+            step['captions_filename'] = os.path.basename(captions_path)
+    return captions_path
+
+
+def inspect_upload(content_hash, path, operations):
+    """
+    Probe an upload once and check the requested operations against it.
+
+    The probe is stored by content hash for the worker, so invalid requests are rejected here
+    instead of failing in the task.
+
+    Returns:
+        An error message, or None if the upload can be processed.
+    """
+    steps = operations if isinstance(operations, list) else [operations]
+    try:
+        resolve_encoding_profile(steps)
+        validate_hls_steps(steps)
+        video_steps, _ = split_hls_step(steps)
+        if len(video_steps) > 1:
+            validate_pipeline(video_steps)
+        for step in steps:
+            if step.get('name') == 'add_logo':
+                validate_logo_options(step)
+            if step.get('name') == 'change_aspect_ratio':
+                validate_aspect_ratio_options(step)
+    except Exception as e:
+        return str(e)
+
+    try:
+        media_probe = probe_media(content_hash, path)
+    except Exception as e:
+        current_app.logger.warning(f"Could not probe upload {path}: {e}")
+        return 'The uploaded file is not a readable video'
+
+    try:
+        validate_timestamps(steps, media_probe.duration)
+        validate_captions(steps, media_probe, current_app.config['CAPTIONS_FOLDER'])
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def resolve_encoding_profile(steps):
+    """
+    Check the requested encoding profile and record it on every step, the default one if none was asked for.
+
+    The job then encodes with the profile of the request even if the default changes while it is
+    queued, and results of different profiles are cached apart.
+    """
+    profile = encoding_profile(requested_profile_name(steps))
+    for step in steps:
+        step['encoding_profile'] = profile['name']
+
+
+def enqueue_video_processing(filename, content_hash, upload_path, operations):
+    """
+    Create the video record for a stored upload and queue its processing.
+
+    The upload must have been checked with inspect_upload. When the same content was already
+    processed with the same operations, the stored result is returned immediately instead of
+    queuing the work again. When such a job is still queued or running, e.g. for a client that
+    retried its request, the new video is attached to it and completes with it.
+    """
+    logger = current_app.logger
+
+    cached_result = find_cached_result(content_hash, operations)
+    if cached_result:
+        video = Video(filename=filename, content_hash=content_hash, status=Video.STATUS_COMPLETED,
+                      processed_path=cached_result.processed_path)
+        db.session.add(video)
+        db.session.commit()
+        queue_previews(video, upload_path)
+        invalidate_video(video.id)
+        logger.info(f"Reused processed result {cached_result.id} for video {video.id}")
+
+        # The upload itself is not needed unless another job is still working on the same content
+        if os.path.exists(upload_path) and not upload_in_use(content_hash, video.id):
+            os.remove(upload_path)
+        return jsonify({'message': 'File already processed', 'video_id': video.id, 'task_id': None,
+                        'processed_path': video.processed_path, 'cached': True}), 200
+
+    # The video claims the job for this content and operation spec; the unique index on active
+    # claims turns away an identical request that raced past the lookup
+    running_job = find_running_job(content_hash, operations)
+    if running_job is None:
+        video = Video(filename=filename, content_hash=content_hash, status=Video.STATUS_QUEUED,
+                      operations_key=operations_key(operations))
+        db.session.add(video)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            running_job = find_running_job(content_hash, operations)
+            if running_job is None:
+                raise
+    if running_job is not None:
+        return attach_to_running_job(filename, content_hash, upload_path, running_job)
+
+    queue_previews(video, upload_path)
+    invalidate_video(video.id)
+
+    # Assign the task to the captioning queue or the Celery queue matching its estimated cost
+    media_probe = get_media_probe(content_hash)
+    queue = job_queue(operations, media_probe.duration)
+    result = process_video_task.apply_async(args=(video.id, upload_path, operations), queue=queue)
+    video.task_id = result.id
+    # Identical requests attached before the task was sent abort through the same task
+    Video.query.filter_by(job_video_id=video.id).update({'task_id': result.id})
+    db.session.commit()
+
+    logger.info(f"Video processing task created with ID: {result.id} on queue {queue}")
+
+    return jsonify({'message': 'File uploaded successfully', 'video_id': video.id, 'task_id': result.id}), 201
+
+
+def attach_to_running_job(filename, content_hash, upload_path, running_job):
+    """
+    Create the video of a request identical to a queued or running job and attach it to that job.
+
+    The job updates the status of every attached video and completes them with its result, so
+    nothing is queued and the shared output is written once.
+    """
+    video = Video(filename=filename, content_hash=content_hash, status=running_job.status,
+                  task_id=running_job.task_id, job_video_id=running_job.id)
     db.session.add(video)
     db.session.commit()
 
-    # Assign the task to Celery
-    result = process_video_task.delay(video.id, upload_path, operations)
+    # The job may have finished between the lookup and the insert, before it could see this video
+    if running_job.status not in Video.ACTIVE_STATUSES:
+        video.status = running_job.status
+        video.processed_path = running_job.processed_path
+        db.session.commit()
+    queue_previews(video, upload_path)
+    invalidate_video(video.id)
+    current_app.logger.info(f"Attached video {video.id} to the job of video {running_job.id}")
 
-    logger.info(f"Video processing task created with ID: {result.id}")
+    return jsonify({'message': 'File is already being processed', 'video_id': video.id,
+                    'task_id': video.task_id}), 201
 
-    return jsonify({'message': 'File uploaded successfully', 'video_id': video.id, 'task_id': result.id}), 201
 
+def queue_previews(video, upload_path):
+    """
+    Link the scrubbing previews of a new video, queuing a preview job when its content has none yet.
+
+    The preview job decodes keyframes only, so it runs on the fast queue and is usually done long
+    before the processing job.
+    """
+    previews = find_previews(video.content_hash)
+    if previews:
+        link_previews(video, previews)
+        db.session.commit()
+        return
+
+    video.preview_status = Video.STATUS_QUEUED
+    db.session.commit()
+    generate_previews_task.apply_async(args=(video.id, upload_path), queue=QUEUE_FAST)
+
+
+def clamp_per_page(per_page):
+    """Keep the page size between 1 and the configured maximum."""
+    return max(1, min(per_page, current_app.config['MAX_PER_PAGE']))
+
+
+def video_listing_query(status=None):
+    """
+    Videos together with their operation count and last operation in a single statement.
+
+    The count and the id of the last operation are correlated subqueries, which Postgres evaluates
+    per row of the page only, and the last operation is outer joined on its primary key.
+    """
+    operations_count = db.session.query(db.func.count(VideoOperation.id)).filter(
+        VideoOperation.video_id == Video.id).correlate(Video).scalar_subquery()
+    last_operation_id = db.session.query(db.func.max(VideoOperation.id)).filter(
+        VideoOperation.video_id == Video.id).correlate(Video).scalar_subquery()
+    last_operation = db.aliased(VideoOperation)
+
+    query = db.session.query(
+        Video,
+        operations_count.label('operations_count'),
+        last_operation.status.label('last_operation_status'),
+        last_operation.error_message.label('last_operation_error'),
+    ).outerjoin(last_operation, last_operation.id == last_operation_id)
 
-def get_all_videos_controller(status=None, page=1, per_page=10):
-    query = Video.query
-    
     if status:
-        query = query.filter_by(status=status)
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    
-    videos = pagination.items
-    total_videos = pagination.total
-    total_pages = pagination.pages
-    current_page = pagination.page
-    
-    videos_data = []
-    
-    for video in videos:
-        # Get the number of operations performed on this video
-        operations_count = VideoOperation.query.filter_by(video_id=video.id).count()
+        query = query.filter(Video.status == status)
+    return query
 
-        # If the video failed, we might want to include the error message from the last failed operation
-        last_operation = VideoOperation.query.filter_by(video_id=video.id).order_by(VideoOperation.id.desc()).first()
-        error_message = last_operation.error_message if last_operation and last_operation.status == 'failed' else None
 
-        # Prepare video data
-        video_info = {
-            'video_id': video.id,
-            'filename': video.filename,
-            'status': video.status,
-            'created_at': video.created_at.isoformat(),
-            'updated_at': video.updated_at.isoformat(),
-            'processed_path': video.processed_path,
-            'operations_count': operations_count,
-            'error_message': error_message  # Include error message if available
+def video_list_item(video, operations_count, last_operation_status, last_operation_error):
+    # If the video failed, we might want to include the error message from the last failed operation
+    error_message = last_operation_error if last_operation_status == 'failed' else None
+
+    return {
+        'video_id': video.id,
+        'filename': video.filename,
+        'status': video.status,
+        'created_at': video.created_at.isoformat(),
+        'updated_at': video.updated_at.isoformat(),
+        'processed_path': video.processed_path,
+        'operations_count': operations_count,
+        'error_message': error_message  # Include error message if available
+    }
+
+
+def get_all_videos_controller(status=None, page=1, per_page=10, after=None, include_total=False):
+    """
+    List videos by page number, or by cursor when 'after' is given.
+
+    In cursor mode an empty 'after' returns the first page and the response carries the token of the
+    next one. The total count is only computed when include_total is set, so walking the whole table
+    never pays for a COUNT(*) per page.
+    """
+    per_page = clamp_per_page(per_page)
+
+    count_query = Video.query
+    if status:
+        count_query = count_query.filter_by(status=status)
+
+    if after is not None:
+        try:
+            rows, next_cursor = keyset_page(video_listing_query(status), Video.id, after, per_page,
+                                            item_id=lambda row: row[0].id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        response = {
+            'videos': [video_list_item(*row) for row in rows],
+            'next_cursor': next_cursor,
+            'per_page': per_page
         }
+        if include_total:
+            response['total_videos'] = count_query.count()
+        return jsonify(response), 200
 
-        videos_data.append(video_info)
+    page = max(1, page)
+    total_videos = count_query.count()
+    total_pages = (total_videos + per_page - 1) // per_page
+
+    rows = video_listing_query(status).order_by(Video.id.asc()).offset((page - 1) * per_page).limit(per_page).all()
 
     return jsonify({
-        'videos': videos_data,
+        'videos': [video_list_item(*row) for row in rows],
         'total_videos': total_videos,
         'total_pages': total_pages,
-        'current_page': current_page,
+        'current_page': page,
         'per_page': per_page
     }), 200
 
 
-def get_video_operations_controller(video_id, page=1, per_page=10):
+def video_operation_item(operation):
+    return {
+        'operation_name': operation.operation_name,
+        'status': operation.status,
+        'start_time': operation.start_time.isoformat() if operation.start_time else None,
+        'end_time': operation.end_time.isoformat() if operation.end_time else None,
+        'duration': operation.duration,
+        'result_path': operation.result_path,
+        'error_message': operation.error_message
+    }
+
+
+def get_video_operations_controller(video_id, page=1, per_page=10, after=None, include_total=False):
+    per_page = clamp_per_page(per_page)
     video = Video.query.get_or_404(video_id)
 
     # Get all operations for the given video
-    query = VideoOperation.query.filter_by(video_id=video_id).order_by(VideoOperation.id.asc())
-    
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    query = VideoOperation.query.filter_by(video_id=video_id)
+
+    if after is not None:
+        try:
+            operations, next_cursor = keyset_page(query, VideoOperation.id, after, per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        response = {
+            'video_id': video.id,
+            'filename': video.filename,
+            'operations': [video_operation_item(operation) for operation in operations],
+            'next_cursor': next_cursor,
+            'per_page': per_page
+        }
+        if include_total:
+            response['total_operations'] = query.count()
+        return jsonify(response), 200
+
+    pagination = query.order_by(VideoOperation.id.asc()).paginate(page=page, per_page=per_page, error_out=False)
     
     operations = pagination.items
     total_operations = pagination.total
     total_pages = pagination.pages
     current_page = pagination.page
     
-    operations_data = [{
-        'operation_name': operation.operation_name,
-        'status': operation.status,
-        'start_time': operation.start_time.isoformat() if operation.start_time else None,
-        'end_time': operation.end_time.isoformat() if operation.end_time else None,
-        'duration': operation.duration,
-        'result_path': operation.result_path,
-        'error_message': operation.error_message
-    } for operation in operations]
+    operations_data = [video_operation_item(operation) for operation in operations]
 
     return jsonify({
         'video_id': video.id,
@@ -172,21 +458,135 @@ def get_video_operations_controller(video_id, page=1, per_page=10):
         'per_page': per_page
     }), 200
 
-def abort_video_processing_controller(task_id): 
+def abort_video_processing_controller(task_id):
+    """
+    Ask the worker to stop a job. A running job kills its encoders at the next checkpoint; a job
+    that has not started yet is marked aborted right away and skipped by the worker.
+    """
     task = process_video_task.AsyncResult(task_id)
     task.abort()
+
+    # The job's video and the identical requests attached to it share the task
+    videos = Video.query.filter_by(task_id=task_id, status=Video.STATUS_QUEUED).all()
+    for video in videos:
+        video.status = Video.STATUS_ABORTED
+    db.session.commit()
+    for video in videos:
+        invalidate_video(video.id)
+        publish_event(video.id, EVENT_ABORTED, status=Video.STATUS_ABORTED)
+
     return jsonify({'message': 'Video Processing Aborted'}), 200
     
 
 def get_video_status_controller(video_id):
     video = Video.query.get_or_404(video_id)
-    return jsonify({
+    data = {
         'video_id': video.id,
         'filename': video.filename,
         'status': video.status,
         'created_at': video.created_at.isoformat(),
         'updated_at': video.updated_at.isoformat()
-    }), 200
+    }
+    if video.status == Video.STATUS_COMPLETED:
+        data['download_urls'] = [
+            url_for('video.download_video_route', video_id=video.id, index=index) if path else None
+            for index, path in enumerate(output_paths(video.processed_path))
+        ]
+        playlist_url = hls_url(video.processed_path)
+        if playlist_url:
+            data['hls_url'] = playlist_url
+    if video.preview_status:
+        data['preview_status'] = video.preview_status
+    if video.preview_status == Video.STATUS_COMPLETED:
+        data['previews'] = {
+            'poster': preview_url(video.poster_path),
+            'sprite': preview_url(video.sprite_path),
+            'sprite_vtt': preview_url(video.sprite_vtt_path),
+            'proxy': preview_url(video.proxy_path),
+        }
+    return jsonify(data), 200
+
+
+def download_video_controller(video_id, index=0):
+    """
+    Download an output of a completed video; index selects one of several outputs, like clips.
+
+    Access is checked here, the bytes are sent by nginx.
+    """
+    video = Video.query.get_or_404(video_id)
+    if video.status != Video.STATUS_COMPLETED:
+        return jsonify({'error': 'Video has not been processed', 'status': video.status}), 409
+
+    paths = output_paths(video.processed_path)
+    if not 0 <= index < len(paths) or not paths[index]:
+        return jsonify({'error': 'Output not found'}), 404
+    path = paths[index]
+    if processed_relative_path(path) is None or not os.path.isfile(path):
+        current_app.logger.warning(f"Output {path} of video {video_id} is not available for download")
+        return jsonify({'error': 'Output not found'}), 404
+
+    # Name the download after the original upload rather than the content-addressed file
+    extension = os.path.splitext(path)[1]
+    suffix = f"_{index + 1}" if len(paths) > 1 else ""
+    download_name = f"{os.path.splitext(video.filename)[0]}_processed{suffix}{extension}"
+    return download_response(path, download_name)
+
+def format_event(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_video_events_controller(video_id):
+    """
+    Stream a video's progress as Server-Sent Events until it completes or fails.
+
+    The database is read once when the stream opens; everything after that comes from the Redis
+    channel the worker publishes to.
+    """
+    video = Video.query.get_or_404(video_id)
+    status = video.status
+    processed_path = video.processed_path
+    # Return the connection to the pool instead of holding it for the life of the stream
+    db.session.close()
+
+    heartbeat = current_app.config['EVENT_STREAM_HEARTBEAT']
+
+    def events():
+        if status == Video.STATUS_COMPLETED:
+            yield format_event({'event': EVENT_COMPLETED, 'video_id': video_id, 'status': status,
+                                'percent': 100, 'processed_path': processed_path})
+            return
+        if status == Video.STATUS_FAILED:
+            yield format_event({'event': EVENT_FAILED, 'video_id': video_id, 'status': status})
+            return
+        if status == Video.STATUS_ABORTED:
+            yield format_event({'event': EVENT_ABORTED, 'video_id': video_id, 'status': status})
+            return
+
+        pubsub = redis_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(PROGRESS_CHANNEL.format(video_id=video_id))
+        try:
+            # Read the latest state after subscribing so no event falls between the two
+            event = last_event(video_id) or {'event': 'status', 'video_id': video_id, 'status': status}
+            yield format_event(event)
+            if event['event'] in FINAL_EVENTS:
+                return
+
+            while True:
+                message = pubsub.get_message(timeout=heartbeat)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(message['data'])
+                yield format_event(event)
+                if event['event'] in FINAL_EVENTS:
+                    return
+        finally:
+            pubsub.close()
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Tell nginx to pass events through as they are written
+    })
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
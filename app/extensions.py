@@ -3,10 +3,22 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from celery import Celery
-from flask import Flask
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready
+from flask import Flask, current_app
+import os
+import redis
 
 db = SQLAlchemy()
 migrate = Migrate()
+_redis_client = None
+
+
+def redis_client():
+    """Shared Redis connection pool for progress events and the response cache."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(current_app.config['REDIS_URL'])
+    return _redis_client
 
 
 def make_celery(app: Flask) -> Celery:
@@ -23,4 +35,25 @@ def make_celery(app: Flask) -> Celery:
                 return self.run(*args, **kwargs)
 
     celery.Task = ContextTask
+
+    @worker_process_init.connect(weak=False)
+    def preload_models(**kwargs):
+        # Captioning workers load the model before taking their first job
+        if app.config['WHISPER_PRELOAD']:
+            from app.services.captioning.wisher import get_model
+            with app.app_context():
+                get_model()
+
+    @worker_ready.connect(weak=False)
+    def start_metrics_exporter(**kwargs):
+        # The main process serves the samples its pool processes write to PROMETHEUS_MULTIPROC_DIR
+        if app.config['WORKER_METRICS_PORT']:
+            from app.services.metrics import start_worker_exporter
+            start_worker_exporter(app.config['WORKER_METRICS_PORT'])
+
+    @worker_process_shutdown.connect(weak=False)
+    def remove_process_metrics(pid=None, **kwargs):
+        from app.services.metrics import worker_process_exited
+        worker_process_exited(pid or os.getpid())
+
     return celery
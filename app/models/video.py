@@ -12,12 +12,39 @@ class Video(db.Model):
     STATUS_PROCESSING = 'processing'
     STATUS_COMPLETED = 'completed'
     STATUS_FAILED = 'failed'
+    STATUS_ABORTED = 'aborted'
+
+    # Videos that still have work scheduled; a small slice of the table once it has grown
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_PROCESSING)
+
+    __table_args__ = (
+        db.Index('ix_videos_status_id', 'status', 'id'),  # Listing filtered by status, ordered by id
+        db.Index('ix_videos_created_at_id', 'created_at', 'id'),
+        # Listing and polling of queued/running videos, without indexing every finished video
+        db.Index('ix_videos_active_status_id', 'status', 'id',
+                 postgresql_where=db.text("status IN ('queued', 'processing')")),
+        # A single queued or running job per content and operation spec; identical requests attach to it
+        # Without its predicate the index would allow a single video per request ever, so it is
+        # declared partial for SQLite as well
+        db.Index('uq_videos_active_job', 'content_hash', 'operations_key', unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'processing')"),
+                 sqlite_where=db.text("status IN ('queued', 'processing')")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)  # The uploaded video file name
-    task_id = db.Column(db.String(255), nullable=True)  # The uploaded video file name
-    status = db.Column(db.String(20), nullable=False, default='pending')  # Status of the video processing (queued, processing, completed, failed)
-    processed_path = db.Column(db.String(255), nullable=True)  # Path to the final processed video
+    task_id = db.Column(db.String(255), nullable=True, index=True)  # The Celery task processing the video
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the uploaded file, also its name on disk
+    status = db.Column(db.String(20), nullable=False, default='pending')  # Status of the video processing (queued, processing, completed, failed, aborted)
+    processed_path = db.Column(db.Text, nullable=True)  # Path (or JSON list of paths) of the processed output
+    operations_key = db.Column(db.String(64), nullable=True)  # Key of the operation spec, set on the video whose job produces the result
+    job_video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=True, index=True)  # Video whose job produces the result of this identical request
+    # Scrubbing previews made at upload time, shared by uploads of the same content
+    preview_status = db.Column(db.String(20), nullable=True)  # Status of the preview job (queued, completed, failed)
+    poster_path = db.Column(db.String(255), nullable=True)  # Poster image
+    sprite_path = db.Column(db.String(255), nullable=True)  # Sprite sheet of keyframe thumbnails
+    sprite_vtt_path = db.Column(db.String(255), nullable=True)  # WebVTT index of the sprite sheet tiles
+    proxy_path = db.Column(db.String(255), nullable=True)  # Small low-resolution MP4 for scrubbing
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Timestamp when the video was uploaded
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Timestamp when the video was last updated
 
@@ -30,18 +57,96 @@ class Video(db.Model):
 
 class VideoOperation(db.Model):
     __tablename__ = 'video_operations'
+    __table_args__ = (
+        # Operations of a video in order: counts, the last operation and the operations listing
+        db.Index('ix_video_operations_video_id_id', 'video_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)  # Reference to the associated video
-    task_id = db.Column(db.String(255), nullable=True)  # The uploaded video file name
+    task_id = db.Column(db.String(255), nullable=True, index=True)  # The Celery task that ran the operation
     operation_name = db.Column(db.String(50), nullable=False)  # Name of the operation (e.g., clip, merge, caption)
     operation_metadata = db.Column(JSON, nullable=True)  # Additional metadata for each operation (e.g., timestamps, aspect ratio)
-    status = db.Column(db.String(20), nullable=False, default='pending')  # Status of the operation (queued, processing, completed, failed)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # Status of the operation (queued, processing, completed, failed, aborted)
     start_time = db.Column(db.DateTime, nullable=True)  # When the operation started
     end_time = db.Column(db.DateTime, nullable=True)  # When the operation finished
     duration = db.Column(db.Integer, nullable=True)  # Time taken for the operation (in seconds)
-    result_path = db.Column(db.String(255), nullable=True)  # Path to the intermediate result of this operation
+    result_path = db.Column(db.Text, nullable=True)  # Path (or JSON list of paths) of the result of this operation
     error_message = db.Column(db.Text, nullable=True)  # Error message if the operation failed
 
     def __repr__(self):
-        return f"<VideoOperation {self.operation_name} - {self.status}>"
\ No newline at end of file
+        return f"<VideoOperation {self.operation_name} - {self.status}>"
+
+
+class ProcessedResult(db.Model):
+    __tablename__ = 'processed_results'
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'operations_key', name='uq_processed_results_content_operations'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the source video
+    operations_key = db.Column(db.String(64), nullable=False)  # SHA-256 of the normalized operation spec
+    processed_path = db.Column(db.Text, nullable=False)  # Path (or JSON list of paths) of the processed output
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProcessedResult {self.content_hash[:12]} - {self.operations_key[:12]}>"
+
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETED = 'completed'
+
+    id = db.Column(db.String(36), primary_key=True)  # Random upload id handed to the client
+    filename = db.Column(db.String(255), nullable=False)  # The name of the file being uploaded
+    total_size = db.Column(db.BigInteger, nullable=False)  # Announced size of the file in bytes
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes written so far; the next chunk starts here
+    hash_state = db.Column(db.LargeBinary, nullable=True)  # SHA-256 state over the received bytes, see storage.sha256_start
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # Status of the upload (uploading, completed)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=True)  # Video created when the upload was finalized
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Finds abandoned uploads to expire
+        db.Index('ix_upload_sessions_status_updated_at', 'status', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f"<UploadSession {self.id} - {self.received}/{self.total_size}>"
+
+
+class MediaProbe(db.Model):
+    __tablename__ = 'media_probes'
+
+    content_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the probed file, shared by identical uploads
+    duration = db.Column(db.Float, nullable=False)  # Length in seconds
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    fps = db.Column(db.Float, nullable=True)
+    video_codec = db.Column(db.String(50), nullable=True)
+    pix_fmt = db.Column(db.String(50), nullable=True)
+    time_base = db.Column(db.String(50), nullable=True)
+    audio_codec = db.Column(db.String(50), nullable=True)  # None when the file has no audio stream
+    keyframes = db.Column(JSON, nullable=False)  # Sorted presentation times of the video keyframes in seconds
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def as_media_info(self):
+        """The probe in the form returned by probe_video, plus the keyframe index."""
+        return {
+            'duration': self.duration,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'video_codec': self.video_codec,
+            'pix_fmt': self.pix_fmt,
+            'time_base': self.time_base,
+            'audio_codec': self.audio_codec,
+            'keyframes': self.keyframes,
+        }
+
+    def __repr__(self):
+        return f"<MediaProbe {self.content_hash[:12]} - {self.width}x{self.height} {self.duration}s>"
@@ -0,0 +1,11 @@
+# app/routes/metrics_routes.py
+
+from flask import Blueprint
+from app.services.metrics import metrics_response
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def metrics_route():
+    return metrics_response()
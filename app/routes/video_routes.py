@@ -1,8 +1,10 @@
 # app/routes/video_routes.py
 
 from flask import Blueprint, request, jsonify, current_app, render_template
-from app.controllers.video_controller import upload_video_controller, get_video_status_controller, abort_video_processing_controller, get_all_videos_controller, get_video_operations_controller
+from app.controllers.video_controller import upload_video_controller, get_video_status_controller, abort_video_processing_controller, get_all_videos_controller, get_video_operations_controller, stream_video_events_controller, download_video_controller
+from app.controllers.upload_controller import create_upload_session_controller, get_upload_session_controller, upload_chunk_controller, complete_upload_controller
 from app.models.video import Video
+from app.services.response_cache import cached_response
 
 video_blueprint = Blueprint('video', __name__)
 
@@ -16,9 +18,30 @@ def upload_video_route():
     return upload_video_controller(request)
 
 
-@video_blueprint.route('/api/video/<int:task_id>', methods=['GET'])
-def get_video_status_route(task_id):
-    return get_video_status_controller(task_id)
+@video_blueprint.route('/api/video/uploads', methods=['POST'])
+def create_upload_session_route():
+    return create_upload_session_controller(request)
+
+
+@video_blueprint.route('/api/video/uploads/<string:upload_id>', methods=['GET'])
+def get_upload_session_route(upload_id):
+    return get_upload_session_controller(upload_id)
+
+
+@video_blueprint.route('/api/video/uploads/<string:upload_id>', methods=['PUT'])
+def upload_chunk_route(upload_id):
+    return upload_chunk_controller(request, upload_id)
+
+
+@video_blueprint.route('/api/video/uploads/<string:upload_id>/complete', methods=['POST'])
+def complete_upload_route(upload_id):
+    return complete_upload_controller(request, upload_id)
+
+
+@video_blueprint.route('/api/video/<int:video_id>', methods=['GET'])
+@cached_response
+def get_video_status_route(video_id):
+    return get_video_status_controller(video_id)
   
 
 @video_blueprint.route('/api/video/abort/<string:task_id>', methods=['POST'])
@@ -26,21 +49,39 @@ def abort_video_processing_route(task_id):
     return abort_video_processing_controller(task_id)
 
 
+@video_blueprint.route('/api/video/<int:video_id>/events', methods=['GET'])
+def stream_video_events_route(video_id):
+    return stream_video_events_controller(video_id)
+
+
+@video_blueprint.route('/api/video/<int:video_id>/download', methods=['GET'])
+def download_video_route(video_id):
+    index = request.args.get('index', 0, type=int)
+    return download_video_controller(video_id, index)
+
+
 @video_blueprint.route('/api/videos', methods=['GET'])
+@cached_response
 def get_all_videos_route():
     status = request.args.get('status')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    # Passing 'after' (empty for the first page) switches to cursor pagination
+    after = request.args.get('after')
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
     
-    return get_all_videos_controller(status, page, per_page)
+    return get_all_videos_controller(status, page, per_page, after, include_total)
 
 
 @video_blueprint.route('/api/video/<int:video_id>/operations', methods=['GET'])
+@cached_response
 def get_all_video_operations_route(video_id):
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    after = request.args.get('after')
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
     
-    return get_video_operations_controller(video_id, page, per_page)
+    return get_video_operations_controller(video_id, page, per_page, after, include_total)
 
 
 @video_blueprint.app_errorhandler(404)
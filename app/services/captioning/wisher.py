@@ -1,31 +1,245 @@
 # app/services/captioning/whisper.py
 
-import whisper
-
-def generate_captions_whisper(video_path):
-    model = whisper.load_model("small")
-    result = model.transcribe(video_path)
-
-    # Check if any text is generated
-    if not result.get('text'):
-        return None
-
-    # Generate the SRT file
-    srt_path = video_path.replace(".mp4", ".srt")
-    with open(srt_path, 'w') as srt_file:
-        for i, segment in enumerate(result['segments']):
-            start = segment['start']
-            end = segment['end']
-            text = segment['text']
-
-            srt_file.write(f"{i+1}\n")
-            srt_file.write(f"{format_timestamp(start)} --> {format_timestamp(end)}\n")
-            srt_file.write(f"{text}\n\n")
-
-    return srt_path
-
-def format_timestamp(seconds):
-    hours, remainder = divmod(seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = seconds * 1000 % 1000
-    return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02},{int(milliseconds):03}"
+import os
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from flask import current_app
+from app.services.videos.ffmpeg_utils import ffmpeg_binary
+from app.services.progress import current_tracker, ProcessingAborted, PASS_TRANSCRIBE
+
+# Whisper works on 30 second windows of 16 kHz mono audio
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+BYTES_PER_SAMPLE = 2
+# Seconds per timestamp token
+TIME_PRECISION = 0.02
+# Chunks whisper considers silent are skipped, with the thresholds its own transcribe() uses
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+CAPTION_FORMATS = ('srt', 'vtt')
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Return the Whisper model of this worker process, loading it on first use.
+
+    Loading takes seconds and hundreds of MB, so it happens once per process and every caption job
+    of the process shares the model.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            import whisper
+            name = current_app.config['WHISPER_MODEL']
+            current_app.logger.info(f"Loading Whisper model {name}")
+            _model = whisper.load_model(name, device=current_app.config['WHISPER_DEVICE'] or None)
+    return _model
+
+
+def iter_audio_chunks(video_path):
+    """
+    Decode only the first audio stream of a video, downmixed to 16 kHz mono, in CHUNK_SECONDS windows.
+
+    The audio is streamed from ffmpeg, so memory stays bounded by one batch whatever the length of
+    the video. Video frames are never decoded.
+
+    Yields:
+        Tuples (offset_seconds, samples) with samples as float32 in [-1, 1].
+    """
+    command = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error", "-i", video_path,
+               "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+    chunk_bytes = SAMPLE_RATE * CHUNK_SECONDS * BYTES_PER_SAMPLE
+    tracker = current_tracker()
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        if tracker:
+            tracker.add_process(process, PASS_TRANSCRIBE)
+        try:
+            offset = 0.0
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                samples = np.frombuffer(data[:len(data) - len(data) % BYTES_PER_SAMPLE], np.int16)
+                yield offset, samples.astype(np.float32) / 32768.0
+                offset += len(samples) / SAMPLE_RATE
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            if tracker:
+                tracker.remove_process(process, PASS_TRANSCRIBE)
+
+        if tracker and tracker.aborted:
+            raise ProcessingAborted(f"Processing of video {tracker.video_id} was aborted")
+        if process.returncode != 0:
+            stderr_file.seek(0)
+            raise Exception(f"ffmpeg failed: {stderr_file.read().decode(errors='replace').strip()}")
+
+
+def segments_from_tokens(tokens, tokenizer, offset, chunk_duration):
+    """
+    Split the tokens decoded for one window into timed segments.
+
+    Whisper brackets every segment with timestamp tokens, e.g. <|0.00|> text <|2.40|>. Text after a
+    final unclosed timestamp runs to the end of the window.
+
+    Returns:
+        List of (start, end, text) tuples in seconds from the start of the video.
+    """
+    segments = []
+    start = None
+    text_tokens = []
+
+    def add_segment(end):
+        text = tokenizer.decode(text_tokens).strip()
+        if text:
+            segment_start = min(start or 0.0, chunk_duration)
+            segments.append((offset + segment_start, offset + max(segment_start, min(end, chunk_duration)), text))
+
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if start is not None and text_tokens:
+                add_segment(time)
+                start, text_tokens = None, []
+            else:
+                start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+
+    if text_tokens:
+        add_segment(chunk_duration)
+    return segments
+
+
+def transcribe_batch(model, chunks, language=None):
+    """
+    Transcribe a batch of audio windows with a single batched decode.
+
+    Parameters:
+        model: The Whisper model.
+        chunks (list): (offset_seconds, samples) tuples from iter_audio_chunks.
+        language (str): Language code, detected per window when omitted.
+
+    Returns:
+        List of (start, end, text) tuples.
+    """
+    import torch
+    import whisper
+    from whisper.tokenizer import get_tokenizer
+
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(samples)), model.dims.n_mels)
+        for _, samples in chunks
+    ]).to(model.device)
+    options = whisper.DecodingOptions(task="transcribe", language=language, without_timestamps=False,
+                                      fp16=model.device.type != "cpu")
+    results = whisper.decode(model, mels, options)
+
+    segments = []
+    for (offset, samples), result in zip(chunks, results):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            continue
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                  language=result.language, task="transcribe")
+        segments += segments_from_tokens(result.tokens, tokenizer, offset, len(samples) / SAMPLE_RATE)
+    return segments
+
+
+def transcribe_audio(video_path, language=None):
+    """
+    Transcribe the audio of a video in batches of CAPTION_BATCH_SIZE windows.
+
+    Progress is reported to the job's tracker after every batch, which is also an abort checkpoint.
+
+    Returns:
+        List of (start, end, text) tuples.
+    """
+    model = get_model()
+    batch_size = current_app.config['CAPTION_BATCH_SIZE']
+    tracker = current_tracker()
+    if tracker:
+        tracker.check_aborted(force=True)
+
+    segments = []
+    batch = []
+    for chunk in iter_audio_chunks(video_path):
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            segments += transcribe_batch(model, batch, language)
+            batch = []
+            if tracker:
+                offset, samples = chunk
+                tracker.update("captions", offset + len(samples) / SAMPLE_RATE, kind=PASS_TRANSCRIBE)
+    if batch:
+        segments += transcribe_batch(model, batch, language)
+    return segments
+
+
+def format_timestamp(seconds, separator=','):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02}{separator}{milliseconds:03}"
+
+
+def write_srt(segments, path):
+    cues = [f"{idx + 1}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n"
+            for idx, (start, end, text) in enumerate(segments)]
+    with open(path, 'w', encoding='utf-8') as srt_file:
+        srt_file.write("\n".join(cues))
+
+
+def write_vtt(segments, path):
+    cues = [f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{text}\n"
+            for start, end, text in segments]
+    with open(path, 'w', encoding='utf-8') as vtt_file:
+        vtt_file.write("\n".join(["WEBVTT\n", *cues]))
+
+
+CAPTION_WRITERS = {
+    'srt': write_srt,
+    'vtt': write_vtt,
+}
+
+
+def generate_captions_whisper(video_path, output_name=None, language=None, formats=CAPTION_FORMATS):
+    """
+    Transcribe the audio of a video and write caption files to the processed folder.
+
+    Parameters:
+        video_path (str): The path to the original video file.
+        output_name (str): Base name for the caption files, defaults to the name of the original video.
+        language (str): Language spoken in the video, detected when omitted.
+        formats (list): Caption formats to write, any of 'srt' and 'vtt'.
+
+    Returns:
+        List of paths of the caption files, in the order of formats. A video without speech gets
+        empty caption files.
+    """
+    try:
+        segments = transcribe_audio(video_path, language)
+
+        processed_folder = os.path.join(os.getcwd(), 'processed_videos')
+        os.makedirs(processed_folder, exist_ok=True)
+        base_name = os.path.splitext(output_name or os.path.basename(video_path))[0]
+
+        caption_paths = []
+        for caption_format in formats:
+            caption_path = os.path.join(processed_folder, f"captions_{base_name}.{caption_format}")
+            CAPTION_WRITERS[caption_format](segments, caption_path)
+            caption_paths.append(caption_path)
+        return caption_paths
+
+    except Exception as e:
+        raise Exception(f"Error generating captions: {e}")
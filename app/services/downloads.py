@@ -0,0 +1,70 @@
+import json
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, send_file, Response
+
+mimetypes.add_type('text/vtt', '.vtt')
+mimetypes.add_type('application/x-subrip', '.srt')
+
+
+def output_paths(processed_path):
+    """The outputs of a video: its processed_path, or the paths of a JSON list (None for failed clips)."""
+    if not processed_path:
+        return []
+    try:
+        paths = json.loads(processed_path)
+    except json.JSONDecodeError:
+        return [processed_path]
+    return paths if isinstance(paths, list) else [processed_path]
+
+
+def processed_relative_path(path):
+    """
+    Location of an output relative to the processed folder, or None if it lies outside of it.
+
+    Only files below the processed folder are ever handed to nginx, whatever the database says.
+    """
+    processed_folder = os.path.realpath(current_app.config['PROCESSED_FOLDER'])
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([processed_folder, real_path]) != processed_folder or real_path == processed_folder:
+        return None
+    return os.path.relpath(real_path, processed_folder)
+
+
+def download_response(path, download_name):
+    """
+    Respond with a processed file without sending its bytes from the application.
+
+    Behind nginx the response only carries an X-Accel-Redirect header; nginx serves the file from
+    an internal location with sendfile and answers Range requests itself. Without nginx, e.g. in
+    development, Flask sends the file with conditional and Range support.
+    """
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if not current_app.config['USE_X_ACCEL_REDIRECT']:
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name, conditional=True)
+
+    response = Response(status=200, mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = current_app.config['X_ACCEL_PROCESSED_PREFIX'] + quote(processed_relative_path(path))
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    return response
+
+
+def static_url(path, folder, url_prefix):
+    """Public URL of a file below a folder of the processed folder that nginx serves statically, or None."""
+    relative_path = processed_relative_path(path) if path else None
+    if relative_path is None or not relative_path.startswith(folder + os.sep):
+        return None
+    return url_prefix + quote(relative_path[len(folder + os.sep):])
+
+
+def hls_url(path):
+    """Public URL of an HLS master playlist below the processed folder's hls folder, or None."""
+    if not path or not path.endswith('.m3u8'):
+        return None
+    return static_url(path, 'hls', current_app.config['HLS_URL_PREFIX'])
+
+
+def preview_url(path):
+    """Public URL of a preview file below the processed folder's previews folder, or None."""
+    return static_url(path, 'previews', current_app.config['PREVIEWS_URL_PREFIX'])
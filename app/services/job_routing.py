@@ -0,0 +1,72 @@
+from flask import current_app
+from app.services.videos.create_clips import convert_time_to_seconds
+from app.services.videos.package_hls import split_hls_step, hls_rendition_count
+
+QUEUE_FAST = 'video_fast'
+QUEUE_STANDARD = 'video_standard'
+QUEUE_HEAVY = 'video_heavy'
+# Caption jobs need a loaded Whisper model, which only the captioning workers keep in memory
+QUEUE_CAPTIONING = 'captioning'
+
+# Seconds of encoding work per second of output. Fast trims are remuxed and only re-encode the
+# frames up to the nearest keyframes, everything else decodes and encodes every frame
+COST_FACTOR_COPY = 0.1
+COST_FACTOR_ENCODE = 1.0
+
+
+def output_seconds(step, duration):
+    """Seconds of video a step produces: its ranges for clip and merge, the whole source otherwise."""
+    timestamps = step.get('timestamps')
+    if step.get('name') in ('clip', 'merge') and timestamps:
+        return sum(max(0.0, float(convert_time_to_seconds(t['end'])) - float(convert_time_to_seconds(t['start'])))
+                   for t in timestamps)
+    return duration
+
+
+def estimate_job_cost(operations, duration):
+    """
+    Estimate the encoding work of a job as seconds of video to encode, weighted by operation type.
+
+    Parameters:
+        operations (dict or list): A single operation or the steps of a pipeline, as validated at upload.
+        duration (float): Length of the source video in seconds.
+    """
+    steps = operations if isinstance(operations, list) else [operations]
+    steps, hls_step = split_hls_step(steps)
+    if len(steps) > 1:
+        # A pipeline encodes its output once, whatever the number of steps
+        trim_steps = [step for step in steps if step.get('name') in ('clip', 'merge')]
+        seconds = output_seconds(trim_steps[0], duration) if trim_steps else duration
+        cost = seconds * COST_FACTOR_ENCODE
+    else:
+        step = steps[0]
+        if step.get('name') in ('clip', 'merge') and step.get('trim_mode', 'fast') == 'fast':
+            factor = COST_FACTOR_COPY
+        elif step.get('name') == 'package_hls':
+            factor = COST_FACTOR_ENCODE * hls_rendition_count(step)
+        else:
+            factor = COST_FACTOR_ENCODE
+        seconds = output_seconds(step, duration)
+        cost = seconds * factor
+
+    # Packaging the result encodes it once more for every rendition
+    if hls_step:
+        cost += seconds * COST_FACTOR_ENCODE * hls_rendition_count(hls_step)
+    return cost
+
+
+def choose_queue(cost):
+    """Route a job by its estimated cost so short jobs never wait behind long encodes."""
+    if cost <= current_app.config['FAST_QUEUE_MAX_COST']:
+        return QUEUE_FAST
+    if cost >= current_app.config['HEAVY_QUEUE_MIN_COST']:
+        return QUEUE_HEAVY
+    return QUEUE_STANDARD
+
+
+def job_queue(operations, duration):
+    """Queue of a job: the captioning queue for captions, otherwise the queue matching its cost."""
+    steps = operations if isinstance(operations, list) else [operations]
+    if any(step.get('name') == 'caption' for step in steps):
+        return QUEUE_CAPTIONING
+    return choose_queue(estimate_job_cost(operations, duration))
@@ -0,0 +1,88 @@
+import os
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.video import MediaProbe
+from app.services.videos.ffmpeg_utils import probe_video, get_keyframes
+from app.services.videos.create_clips import convert_time_to_seconds
+from app.services.captioning.wisher import CAPTION_FORMATS
+from app.services.videos.caption_bitmaps import parse_captions, CAPTION_EXTENSIONS
+
+# Seconds an end timestamp may run past the end of the video, for clients that round durations up
+TIMESTAMP_TOLERANCE = 1.0
+
+
+def get_media_probe(content_hash):
+    if not content_hash:
+        return None
+    return MediaProbe.query.get(content_hash)
+
+
+def probe_media(content_hash, path):
+    """
+    Return the stored probe of a file, probing it once if its content has not been seen before.
+
+    Identical uploads share one row, so a re-uploaded file is never probed again.
+
+    Raises:
+        Exception: If the file cannot be probed or has no video stream.
+    """
+    media_probe = get_media_probe(content_hash)
+    if media_probe:
+        return media_probe
+
+    info = probe_video(path)
+    media_probe = MediaProbe(content_hash=content_hash, keyframes=get_keyframes(path), **info)
+    db.session.add(media_probe)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same content was probed by a concurrent upload
+        db.session.rollback()
+        media_probe = MediaProbe.query.get(content_hash)
+    return media_probe
+
+
+def validate_timestamps(steps, duration):
+    """
+    Check the timestamps of every step against the length of the video.
+
+    Raises:
+        Exception: Describing the first invalid range.
+    """
+    for step in steps:
+        for idx, timestamp in enumerate(step.get('timestamps') or []):
+            try:
+                start = float(convert_time_to_seconds(timestamp['start']))
+                end = float(convert_time_to_seconds(timestamp['end']))
+            except (KeyError, TypeError, ValueError):
+                raise Exception(f"Timestamp {idx + 1} of '{step.get('name')}' must have a start and end in seconds or HH:MM:SS.")
+            if start < 0 or end <= start:
+                raise Exception(f"Invalid range {start}-{end} in timestamp {idx + 1} of '{step.get('name')}'.")
+            if start >= duration or end > duration + TIMESTAMP_TOLERANCE:
+                raise Exception(f"Timestamp {idx + 1} of '{step.get('name')}' ({start}-{end}) is outside the video, "
+                                f"which is {duration:.2f} seconds long.")
+
+
+def validate_captions(steps, media_probe, captions_folder):
+    """
+    Check that caption steps have audio to transcribe and ask for known formats, and that
+    burn_captions steps come with a readable SRT or VTT file.
+
+    Raises:
+        Exception: Describing the problem.
+    """
+    for step in steps:
+        if step.get('name') == 'burn_captions':
+            captions_filename = step.get('captions_filename')
+            if (not captions_filename or captions_filename != os.path.basename(captions_filename)
+                    or os.path.splitext(captions_filename)[1] not in CAPTION_EXTENSIONS):
+                raise Exception(f"A caption file ({', '.join(CAPTION_EXTENSIONS)}) is required for burn_captions.")
+            parse_captions(os.path.join(captions_folder, captions_filename))
+            continue
+        if step.get('name') != 'caption':
+            continue
+        if media_probe.audio_codec is None:
+            raise Exception("The video has no audio track to caption.")
+        formats = step.get('formats', list(CAPTION_FORMATS))
+        if not isinstance(formats, list) or not formats or any(f not in CAPTION_FORMATS for f in formats):
+            raise Exception(f"Invalid caption formats. Valid options are: {', '.join(CAPTION_FORMATS)}")
@@ -0,0 +1,168 @@
+import logging
+import os
+import time
+import redis
+from flask import current_app, g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.services.job_routing import QUEUE_FAST, QUEUE_STANDARD, QUEUE_HEAVY, QUEUE_CAPTIONING
+
+# gunicorn and Celery run several processes; with PROMETHEUS_MULTIPROC_DIR set, every process writes
+# its samples there and a scrape merges them. The directory must exist before the first sample
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess, start_http_server, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+# Queues whose backlog is reported; Celery's Redis transport keeps each queue in a list of that name
+CELERY_QUEUES = (QUEUE_FAST, QUEUE_STANDARD, QUEUE_HEAVY, QUEUE_CAPTIONING, 'celery')
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to answer an API request, up to the response headers',
+    ['method', 'route', 'status'])
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries run by an API request',
+    ['route'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Time of a single database query',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+OPERATION_DURATION = Histogram(
+    'video_operation_duration_seconds', 'Time of a video operation from its start until it finished',
+    ['operation', 'status'], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+ENCODE_FPS = Histogram(
+    'video_encode_frames_per_second', 'Frames written per second of wall time by the encoders of a job',
+    ['operation'], buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600))
+ENCODE_REALTIME_FACTOR = Histogram(
+    'video_encode_realtime_factor', 'Seconds of video written per second of wall time by the encoders of a job',
+    ['operation'], buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64))
+OPERATION_INPUT_BYTES = Counter(
+    'video_operation_input_bytes', 'Bytes of source video read by completed jobs', ['operation'])
+OPERATION_OUTPUT_BYTES = Counter(
+    'video_operation_output_bytes', 'Bytes of output written by completed jobs', ['operation'])
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.observe(time.perf_counter() - conn.info['query_start_times'].pop())
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+
+def init_request_metrics(app):
+    """Time every request of the app and count the database queries it runs, labelled by its route."""
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+        g.db_queries = 0
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('request_start_time')
+        if start is not None:
+            # The rule, e.g. /api/video/<int:video_id>, keeps one series per route rather than per URL
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_DURATION.labels(request.method, route, response.status_code).observe(time.perf_counter() - start)
+            HTTP_REQUEST_DB_QUERIES.labels(route).observe(g.get('db_queries', 0))
+        return response
+
+
+class QueueDepthCollector:
+    """Read the number of waiting jobs of every Celery queue from the broker when metrics are scraped."""
+
+    def __init__(self):
+        self.client = None
+
+    def collect(self):
+        depth = GaugeMetricFamily('celery_queue_length', 'Jobs waiting in a Celery queue', labels=['queue'])
+        try:
+            if self.client is None:
+                self.client = redis.Redis.from_url(current_app.config['CELERY_BROKER_URL'])
+            pipe = self.client.pipeline()
+            for queue in CELERY_QUEUES:
+                pipe.llen(queue)
+            for queue, length in zip(CELERY_QUEUES, pipe.execute()):
+                depth.add_metric([queue], length)
+        except Exception as e:
+            logging.warning(f"Could not read Celery queue lengths: {e}")
+        yield depth
+
+
+queue_registry = CollectorRegistry()
+queue_registry.register(QueueDepthCollector())
+
+
+def process_registry():
+    """The samples of every process sharing PROMETHEUS_MULTIPROC_DIR, or of this process alone."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_response():
+    """Prometheus text exposition of the API metrics and the Celery queue lengths."""
+    return Response(generate_latest(process_registry()) + generate_latest(queue_registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def start_worker_exporter(port):
+    """Serve the metrics of every process of this Celery worker on port, from the worker's main process."""
+    start_http_server(port, registry=process_registry())
+    logging.info(f"Serving worker metrics on port {port}")
+
+
+def worker_process_exited(pid):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def job_operation_name(video_operations):
+    """Label of a job: its operation, or pipeline for several steps encoded together."""
+    if not video_operations:
+        return 'unknown'
+    return 'pipeline' if len(video_operations) > 1 else video_operations[0].operation_name
+
+
+def observe_operations(video_operations, status):
+    for video_operation in video_operations:
+        if video_operation.duration is not None:
+            OPERATION_DURATION.labels(video_operation.operation_name, status).observe(video_operation.duration)
+
+
+def observe_encode(operation, tracker):
+    """
+    Record the encode speed of a job from what its encoders reported to the progress tracker.
+
+    Only encode passes count, over the time they ran: stream copies, muxing and the rest of the task
+    would otherwise skew the speed of the encoder.
+    """
+    seconds, frames, encode_time = tracker.encode_totals()
+    if encode_time <= 0 or seconds <= 0:
+        return
+    ENCODE_REALTIME_FACTOR.labels(operation).observe(seconds / encode_time)
+    if frames:
+        ENCODE_FPS.labels(operation).observe(frames / encode_time)
+
+
+def path_size(path):
+    """Size of a file, or of every file below the folder of an HLS playlist."""
+    if not path or not os.path.exists(path):
+        return 0
+    if not path.endswith('.m3u8'):
+        return os.path.getsize(path)
+    total = 0
+    for folder, _, filenames in os.walk(os.path.dirname(path)):
+        total += sum(os.path.getsize(os.path.join(folder, filename)) for filename in filenames)
+    return total
+
+
+def observe_bytes(operation, input_path, output_paths):
+    OPERATION_INPUT_BYTES.labels(operation).inc(path_size(input_path))
+    OPERATION_OUTPUT_BYTES.labels(operation).inc(sum(path_size(path) for path in output_paths))
@@ -0,0 +1,52 @@
+import base64
+import json
+
+
+def encode_cursor(last_id):
+    """Opaque token pointing just after the row with the given id."""
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Return the id an 'after' token points to, or None for the first page.
+
+    Raises:
+        ValueError: If the token was not produced by encode_cursor.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))['id']
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(last_id, int):
+        raise ValueError("Invalid pagination cursor")
+    return last_id
+
+
+def keyset_page(query, id_column, after, per_page, item_id=lambda item: item.id):
+    """
+    Fetch the page of a query that follows the 'after' cursor, ordered by id_column.
+
+    The page is found through the primary key index instead of an OFFSET, so every page costs the
+    same as the first one.
+
+    Parameters:
+        item_id (callable): Returns the id of a fetched row, for queries that select more than a model.
+
+    Returns:
+        Tuple (items, next_cursor); next_cursor is None on the last page.
+    """
+    last_id = decode_cursor(after)
+    if last_id is not None:
+        query = query.filter(id_column > last_id)
+
+    # Fetch one extra row to know whether another page follows
+    items = query.order_by(id_column.asc()).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+
+    items = items[:per_page]
+    return items, encode_cursor(item_id(items[-1]))
@@ -0,0 +1,224 @@
+import json
+import logging
+import threading
+import time
+from app.extensions import redis_client
+
+PROGRESS_CHANNEL = "video_progress:{video_id}"
+PROGRESS_LAST_EVENT = "video_progress_last:{video_id}"
+SEGMENTS_DONE = "video_segments_done:{task_id}"
+
+# Seconds between two progress events of the same job
+PUBLISH_INTERVAL = 0.5
+# How long the last event of a job is kept for clients that connect late
+LAST_EVENT_TTL = 24 * 3600
+# Seconds between two checks whether the job was aborted
+ABORT_CHECK_INTERVAL = 1.0
+
+EVENT_STATUS = 'status'
+EVENT_PROGRESS = 'progress'
+EVENT_COMPLETED = 'completed'
+EVENT_FAILED = 'failed'
+EVENT_ABORTED = 'aborted'
+FINAL_EVENTS = (EVENT_COMPLETED, EVENT_FAILED, EVENT_ABORTED)
+
+# Kinds of ffmpeg pass. Encodes and stream copies write a range of the source once and count
+# towards the progress of the job; a pass joining or muxing parts written by earlier passes would
+# count the same range again, so it is only an abort checkpoint. Transcription counts towards
+# progress too, but like copies it is kept out of the encode speed metrics
+PASS_ENCODE = 'encode'
+PASS_COPY = 'copy'
+PASS_MUX = 'mux'
+PASS_TRANSCRIBE = 'transcribe'
+
+
+class ProcessingAborted(Exception):
+    """Raised inside a job once it has been aborted; the job stops without being retried."""
+
+def publish_event(video_id, event, **data):
+    """
+    Publish an event of a video job and remember it as the job's latest state.
+
+    Progress is best effort: a Redis outage is logged and never fails the job.
+    """
+    message = json.dumps({'event': event, 'video_id': video_id, **data})
+    try:
+        client = redis_client()
+        client.set(PROGRESS_LAST_EVENT.format(video_id=video_id), message, ex=LAST_EVENT_TTL)
+        client.publish(PROGRESS_CHANNEL.format(video_id=video_id), message)
+    except Exception as e:
+        logging.warning(f"Could not publish progress for video_id {video_id}: {e}")
+
+
+def last_event(video_id):
+    message = redis_client().get(PROGRESS_LAST_EVENT.format(video_id=video_id))
+    return json.loads(message) if message else None
+
+
+class ProgressTracker:
+    """
+    Sum the output time written by the encode and copy passes of a job and publish it as a percentage.
+
+    Encoders of one job may run on several threads of the encoder pool, each reporting under its own
+    source key. Progress updates double as abort checkpoints: once abort_check reports the job as
+    aborted, every running ffmpeg process of the job is killed and the encoders raise
+    ProcessingAborted.
+
+    For the encode speed metrics, the output of encode passes is also kept apart from stream copies,
+    together with the wall time during which at least one encoder of the job was running.
+    """
+
+    def __init__(self, video_id, total_seconds, abort_check=None, report_progress=True):
+        self.video_id = video_id
+        self.total_seconds = total_seconds
+        self.report_progress = report_progress
+        self.abort_check = abort_check
+        self.aborted = False
+        self.processed = {}
+        self.frames = {}
+        self.encoded = {}
+        self.encoded_frames = {}
+        self.active_encoders = 0
+        self.encoders_started = None
+        self.encode_time = 0.0
+        self.processes = set()
+        self.outputs = set()
+        self.last_publish = 0.0
+        self.started = time.monotonic()
+        self.last_abort_check = self.started
+        self.lock = threading.Lock()
+
+    def add_process(self, process, kind=PASS_ENCODE):
+        with self.lock:
+            self.processes.add(process)
+            if kind == PASS_ENCODE:
+                if self.active_encoders == 0:
+                    self.encoders_started = time.monotonic()
+                self.active_encoders += 1
+
+    def remove_process(self, process, kind=PASS_ENCODE):
+        with self.lock:
+            self.processes.discard(process)
+            if kind == PASS_ENCODE:
+                self.active_encoders -= 1
+                if self.active_encoders == 0:
+                    self.encode_time += time.monotonic() - self.encoders_started
+
+    def add_output(self, path):
+        """Remember a file written by the job, to be removed if the job is aborted."""
+        with self.lock:
+            self.outputs.add(path)
+
+    def check_aborted(self, force=False):
+        """
+        Raise ProcessingAborted if the job was aborted, killing its ffmpeg processes first.
+
+        The abort state lives in the result backend, so it is only polled every ABORT_CHECK_INTERVAL
+        seconds unless force is set.
+        """
+        if not self.aborted and self.abort_check is not None:
+            now = time.monotonic()
+            if force or now - self.last_abort_check >= ABORT_CHECK_INTERVAL:
+                self.last_abort_check = now
+                try:
+                    aborted = self.abort_check()
+                except Exception as e:
+                    logging.warning(f"Could not check abort state of video_id {self.video_id}: {e}")
+                    aborted = False
+                if aborted:
+                    self.abort()
+        if self.aborted:
+            raise ProcessingAborted(f"Processing of video {self.video_id} was aborted")
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    def encode_totals(self):
+        """
+        Seconds of video and frames written so far by the encode passes of the job, and the wall time
+        during which any of them was running. Encoders running in parallel count their time once.
+        """
+        with self.lock:
+            encode_time = self.encode_time
+            if self.active_encoders:
+                encode_time += time.monotonic() - self.encoders_started
+            return sum(self.encoded.values()), sum(self.encoded_frames.values()), encode_time
+
+    def update(self, source, seconds, frame=None, kind=PASS_ENCODE):
+        self.check_aborted()
+        if kind == PASS_MUX:
+            return
+        with self.lock:
+            self.processed[source] = max(seconds, 0.0)
+            if frame is not None:
+                self.frames[source] = frame
+            if kind == PASS_ENCODE:
+                self.encoded[source] = self.processed[source]
+                if frame is not None:
+                    self.encoded_frames[source] = frame
+            if not self.report_progress:
+                return
+
+            now = time.monotonic()
+            if now - self.last_publish < PUBLISH_INTERVAL:
+                return
+            self.last_publish = now
+            processed_seconds = sum(self.processed.values())
+            frames = sum(self.frames.values())
+
+        percent = None
+        if self.total_seconds:
+            # Muxing and concatenation passes follow the encode, so 100 is only sent on completion
+            percent = round(min(99.0, 100.0 * processed_seconds / self.total_seconds), 1)
+        publish_event(self.video_id, EVENT_PROGRESS, percent=percent,
+                      processed_seconds=round(processed_seconds, 2), frame=frames)
+
+
+# A worker process runs one task at a time, so the job being processed is module state shared with
+# the encoder pool threads
+_current_tracker = None
+
+
+def current_tracker():
+    return _current_tracker
+
+
+def start_tracking(video_id, total_seconds, abort_check=None, report_progress=True):
+    """
+    Report the progress of every ffmpeg pass run for the given video until stop_tracking.
+
+    Parameters:
+        abort_check (callable): Returns True once the job has been aborted, e.g. the task's is_aborted.
+        report_progress (bool): Publish progress events; when False the tracker only handles aborts.
+    """
+    global _current_tracker
+    _current_tracker = ProgressTracker(video_id, total_seconds, abort_check, report_progress)
+    return _current_tracker
+
+
+def stop_tracking():
+    global _current_tracker
+    _current_tracker = None
+
+
+def publish_segment_done(video_id, task_id, segment_count):
+    """
+    Count a finished segment of a split job and publish the share of segments done.
+
+    Segments run on different workers, so the count is kept in Redis under the id of the job's task.
+    """
+    try:
+        client = redis_client()
+        key = SEGMENTS_DONE.format(task_id=task_id)
+        done = client.incr(key)
+        client.expire(key, LAST_EVENT_TTL)
+    except Exception as e:
+        logging.warning(f"Could not count finished segment of video_id {video_id}: {e}")
+        return
+    publish_event(video_id, EVENT_PROGRESS, percent=round(min(99.0, 100.0 * done / segment_count), 1),
+                  segments_done=done, segments=segment_count)
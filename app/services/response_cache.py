@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+from flask import request, current_app, Response
+from werkzeug.http import http_date
+from app.extensions import redis_client
+
+LISTING_VERSION = "response_cache_version:videos"
+VIDEO_VERSION = "response_cache_version:video:{video_id}"
+CACHE_ENTRY = "response_cache:{version_key}:{version}:{path}?{query}"
+
+
+def invalidate_video(video_id):
+    """
+    Drop the cached responses for a video and for the video listing.
+
+    Entries are keyed by a version counter, so bumping the counter makes every old entry unreachable;
+    they expire on their own.
+    """
+    try:
+        client = redis_client()
+        pipe = client.pipeline()
+        pipe.incr(VIDEO_VERSION.format(video_id=video_id))
+        pipe.incr(LISTING_VERSION)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Could not invalidate cached responses for video_id {video_id}: {e}")
+
+
+def cache_entry_key(version_key, version):
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    return CACHE_ENTRY.format(version_key=version_key, version=version, path=request.path, query=query)
+
+
+def build_response(entry):
+    response = Response(entry['body'], status=200, mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.headers['Last-Modified'] = http_date(entry['last_modified'])
+    # Clients may keep the response but must revalidate it, which is a cheap 304 when unchanged
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def cached_response(view):
+    """
+    Serve a GET route from Redis until the video it describes changes.
+
+    Routes with a video id in their URL are invalidated with that video; routes without one (the
+    listing) with any video. Responses carry an ETag and Last-Modified so unchanged reads end in a
+    304 without touching the database. Only 200 responses are stored, and a Redis outage falls back
+    to the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        video_id = kwargs.get('video_id')
+        version_key = VIDEO_VERSION.format(video_id=video_id) if video_id is not None else LISTING_VERSION
+
+        try:
+            client = redis_client()
+            version = int(client.get(version_key) or 0)
+            key = cache_entry_key(version_key, version)
+            cached = client.get(key)
+        except Exception as e:
+            logging.warning(f"Response cache unavailable: {e}")
+            return view(*args, **kwargs)
+
+        if cached:
+            return build_response(json.loads(cached))
+
+        result = view(*args, **kwargs)
+        response = current_app.make_response(result)
+        if response.status_code != 200:
+            return response
+
+        body = response.get_data(as_text=True)
+        entry = {
+            'body': body,
+            'etag': hashlib.sha1(body.encode()).hexdigest(),
+            'last_modified': time.time(),
+        }
+        try:
+            client.set(key, json.dumps(entry), ex=current_app.config['RESPONSE_CACHE_TTL'])
+        except Exception as e:
+            logging.warning(f"Could not store cached response: {e}")
+        return build_response(entry)
+
+    return wrapper
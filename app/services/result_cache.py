@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.video import Video, ProcessedResult
+from app.services.videos.create_clips import convert_time_to_seconds
+
+
+def normalize_operations(operations):
+    """
+    Return a canonical JSON form of an operation spec.
+
+    Timestamps are converted to seconds and keys are sorted, so equivalent requests map to the same
+    cache entry. Logos are stored by content hash, so logo_filename already identifies the logo.
+    """
+    def normalize_step(step):
+        step = dict(step)
+        if 'timestamps' in step:
+            step['timestamps'] = [
+                {'start': float(convert_time_to_seconds(t['start'])), 'end': float(convert_time_to_seconds(t['end']))}
+                for t in step['timestamps']
+            ]
+        return step
+
+    steps = operations if isinstance(operations, list) else [operations]
+    return json.dumps([normalize_step(step) for step in steps], sort_keys=True, separators=(',', ':'))
+
+
+def operations_key(operations):
+    return hashlib.sha256(normalize_operations(operations).encode()).hexdigest()
+
+
+def result_outputs_exist(processed_path):
+    """Check that every output of a stored result (a path or a JSON list of paths) is still on disk."""
+    if not processed_path:
+        return False
+    try:
+        paths = json.loads(processed_path)
+    except json.JSONDecodeError:
+        paths = [processed_path]
+    if not isinstance(paths, list):
+        paths = [processed_path]
+    return all(path and os.path.exists(path) for path in paths)
+
+
+def find_cached_result(content_hash, operations):
+    """Return the ProcessedResult for this content and operation spec if its outputs still exist."""
+    result = ProcessedResult.query.filter_by(
+        content_hash=content_hash,
+        operations_key=operations_key(operations),
+    ).first()
+    if result and result_outputs_exist(result.processed_path):
+        return result
+    return None
+
+
+def find_running_job(content_hash, operations):
+    """Return the queued or running video whose job produces the result of this content and operation spec."""
+    if not content_hash:
+        return None
+    return Video.query.filter(
+        Video.content_hash == content_hash,
+        Video.operations_key == operations_key(operations),
+        Video.status.in_(Video.ACTIVE_STATUSES),
+    ).first()
+
+
+def store_result(content_hash, operations, processed_path):
+    """Remember the result of a job, replacing the result stored for the same request before."""
+    key = operations_key(operations)
+    result = ProcessedResult.query.filter_by(content_hash=content_hash, operations_key=key).first()
+    if result is None:
+        db.session.add(ProcessedResult(content_hash=content_hash, operations_key=key, processed_path=processed_path))
+        try:
+            db.session.commit()
+            return
+        except IntegrityError:
+            # Stored by a concurrent job for the same content and operations
+            db.session.rollback()
+            result = ProcessedResult.query.filter_by(content_hash=content_hash, operations_key=key).first()
+    result.processed_path = processed_path
+    db.session.commit()
+
+
+def upload_in_use(content_hash, exclude_video_id=None):
+    """
+    Check whether queued or running videos, other than the given one, need this content-addressed upload.
+
+    A job waiting to be retried is queued again, so its upload is kept until its final failure.
+
+    Videos whose previews are still queued need it too, the given one included.
+    """
+    if not content_hash:
+        return False
+    processing = Video.status.in_(Video.ACTIVE_STATUSES)
+    if exclude_video_id is not None:
+        processing = db.and_(processing, Video.id != exclude_video_id)
+    query = Video.query.filter(
+        Video.content_hash == content_hash,
+        db.or_(processing, Video.preview_status == Video.STATUS_QUEUED),
+    )
+    return query.count() > 0
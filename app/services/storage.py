@@ -0,0 +1,193 @@
+import ctypes
+import ctypes.util
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from app.services.downloads import output_paths
+
+CHUNK_SIZE = 1024 * 1024
+
+# sizeof(SHA256_CTX) of OpenSSL: eight state words, the bit count, a 64 byte block and two counters
+SHA256_STATE_SIZE = 112
+
+
+def save_content_addressed(stream, folder, extension):
+    """
+    Write a stream to disk while hashing it and store it under its SHA-256 digest.
+
+    The data is hashed as it is written, so the file is never read a second time. If a file with the
+    same content already exists it is reused and the new copy is discarded.
+
+    Parameters:
+        stream: A binary file-like object to read from.
+        folder (str): The folder to store the file in.
+        extension (str): Extension of the stored file, including the dot.
+
+    Returns:
+        Tuple (content_hash, path).
+    """
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        content_hash = digest.hexdigest()
+        path = os.path.join(folder, f"{content_hash}{extension}")
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return content_hash, path
+
+
+@functools.lru_cache(maxsize=None)
+def libcrypto():
+    """OpenSSL's libcrypto, which Python's hashlib is built on, or None when it cannot be loaded."""
+    path = ctypes.util.find_library('crypto')
+    if not path:
+        return None
+    try:
+        lib = ctypes.CDLL(path)
+        lib.SHA256_Init.argtypes = [ctypes.c_char_p]
+        lib.SHA256_Update.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_size_t]
+        lib.SHA256_Final.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+    except (OSError, AttributeError):
+        return None
+    return lib
+
+
+def sha256_start():
+    """
+    Start a SHA-256 whose state can be stored and resumed in another process.
+
+    hashlib objects cannot be serialized, but OpenSSL's SHA256_CTX is a plain struct, so the digest
+    of a chunked upload is carried from one chunk request to the next in the database.
+
+    Returns:
+        The state as bytes, or None when libcrypto is not available.
+    """
+    lib = libcrypto()
+    if lib is None:
+        return None
+    context = ctypes.create_string_buffer(SHA256_STATE_SIZE)
+    lib.SHA256_Init(context)
+    return context.raw
+
+
+def sha256_update(state, data):
+    """Return the state of sha256_start after also hashing data."""
+    context = ctypes.create_string_buffer(state, SHA256_STATE_SIZE)
+    libcrypto().SHA256_Update(context, data, len(data))
+    return context.raw
+
+
+def sha256_hexdigest(state):
+    context = ctypes.create_string_buffer(state, SHA256_STATE_SIZE)
+    digest = ctypes.create_string_buffer(32)
+    libcrypto().SHA256_Final(digest, context)
+    return digest.raw.hex()
+
+
+def hash_file(path):
+    """Return the SHA-256 digest of a file on disk, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        while True:
+            chunk = source_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def move_content_addressed(path, folder, extension, content_hash=None):
+    """
+    Move a file that is already on disk to its content-addressed location.
+
+    The file is read once to hash it, unless its hash is passed in, and then renamed, so its data is
+    never copied.
+
+    Returns:
+        Tuple (content_hash, path).
+    """
+    content_hash = content_hash or hash_file(path)
+    target_path = os.path.join(folder, f"{content_hash}{extension}")
+    if os.path.exists(target_path):
+        os.remove(path)
+    else:
+        os.replace(path, target_path)
+    return content_hash, target_path
+
+
+def shared_path(path, work_name, final_name):
+    """Shared location of an output a job wrote under its own name; HLS outputs are named by their folder."""
+    folder, filename = os.path.split(path)
+    if filename.endswith('.m3u8'):
+        parent, name = os.path.split(folder)
+        return os.path.join(parent, name.replace(work_name, final_name), filename)
+    return os.path.join(folder, filename.replace(work_name, final_name))
+
+
+def shared_output_path(processed_path, work_name, final_name):
+    """
+    The shared locations of the outputs a job wrote under its own name, without moving anything.
+
+    Parameters:
+        processed_path (str): A path or a JSON list of paths, as stored on a video.
+        work_name (str): Part of the output names unique to the job.
+        final_name (str): What work_name is replaced with in the shared names.
+
+    Returns:
+        processed_path with the shared names, in the same form.
+    """
+    if not processed_path:
+        return processed_path
+    paths = output_paths(processed_path)
+    if paths == [processed_path]:
+        return shared_path(processed_path, work_name, final_name)
+    return json.dumps([shared_path(path, work_name, final_name) if path else path for path in paths])
+
+
+def publish_outputs(processed_path, work_name, final_name):
+    """
+    Move the outputs of a job from the names it wrote them under to their shared names.
+
+    Identical requests name their outputs alike, so a job writes them under names of its own and
+    renames them once they are complete. Readers of the shared names never see a partial file, and
+    an older copy is replaced as a whole; an HLS playlist moves with the folder of its renditions.
+
+    Returns:
+        processed_path with the shared names, in the same form.
+    """
+    for path in output_paths(processed_path):
+        if not path:
+            continue
+        target = shared_path(path, work_name, final_name)
+        if not path.endswith('.m3u8'):
+            os.replace(path, target)
+            continue
+
+        folder, target_folder = os.path.dirname(path), os.path.dirname(target)
+        if os.path.isdir(target_folder):
+            # A folder cannot be renamed over another one, so the old one is moved aside first
+            stale_folder = f"{target_folder}_{work_name}_stale"
+            os.replace(target_folder, stale_folder)
+            os.replace(folder, target_folder)
+            shutil.rmtree(stale_folder, ignore_errors=True)
+        else:
+            os.replace(folder, target_folder)
+    return shared_output_path(processed_path, work_name, final_name)
@@ -1,55 +1,43 @@
-from moviepy.editor import VideoFileClip, ImageClip, CompositeVideoClip
 import os
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video
+from app.services.videos.pipeline import build_pipeline_command
 
-def add_logo_to_video(video_path, logo_path, position):
+def add_logo_to_video(video_path, logo_path, position, output_name=None, media_info=None, scale=None, opacity=1.0, profile=None):
     """
     Add a logo to the video throughout its duration.
-    
+
+    The logo is resized, faded and alpha-premultiplied once and cached by its content hash; ffmpeg's
+    overlay filter then blends only the logo's bounding box into each frame.
+
     Parameters:
     - video_path: Path to the video file.
-    - logo_path: Path to the logo image file.
-    - position: Tuple or string specifying the position of the logo. For example: ('right', 'bottom'), ('center', 'top')
+    - logo_path: Path to the logo image file, stored under its content hash.
+    - position: One of top_left, top_right, bottom_left, bottom_right or center.
+    - output_name: Base name for the processed file, defaults to the name of the video file.
+    - media_info: Stored probe of the video; the file is probed when omitted.
+    - scale: Logo height as a fraction of the frame height, 50 pixels when omitted.
+    - opacity: Opacity of the logo between 0 and 1, fully opaque when None.
+    - profile: Encoder settings from encoding_profile, the default profile when omitted.
     """
     try:
-        video_path = os.path.join(os.getcwd(), video_path.lstrip('/'))
-        logo_path = os.path.join(os.getcwd(), logo_path.lstrip('/'))
-        
-        video = VideoFileClip(video_path)
-        logo = ImageClip(logo_path).set_duration(video.duration).resize(height=50)  # Resize logo to fit
-
-        # Set the logo position
-        if isinstance(position, str):
-            position = position.lower()
-            if position == 'top_left':
-                position = ('left', 'top')
-            elif position == 'top_right':
-                position = ('right', 'top')
-            elif position == 'bottom_left':
-                position = ('left', 'bottom')
-            elif position == 'bottom_right':
-                position = ('right', 'bottom')
-            elif position == 'center':
-                position = ('center', 'center')
-            else:
-                position = ('right', 'bottom')  # Default position if unknown
-        
-        logo = logo.set_position(position).margin(right=30, bottom=30, top=30, left=30)
-
-        # Overlay the logo on the video
-        final_video = CompositeVideoClip([video, logo])
+        probe = media_info or probe_video(video_path)
+        step = {
+            'name': 'add_logo',
+            'logo_filename': os.path.basename(logo_path),
+            'position': position,
+            'scale': scale,
+            'opacity': opacity,
+        }
 
         # Define the output path in the processed folder
         processed_folder = os.path.join(os.getcwd(), 'processed_videos')
         os.makedirs(processed_folder, exist_ok=True)
-        output_filename = f"processed_logo_{os.path.basename(video_path)}"
+        output_filename = f"processed_logo_{output_name or os.path.basename(video_path)}"
         output_path = os.path.join(processed_folder, output_filename)
 
-        # Save the output video
-        final_video.write_videofile(output_path, codec="libx264", audio_codec="aac")
-        
-        if os.path.exists(logo_path):
-            os.remove(logo_path)
-            
+        run_ffmpeg(build_pipeline_command(video_path, [step], probe, os.path.dirname(logo_path), output_path, profile=profile))
+
+        # Logos are stored by content hash and shared between uploads, so they are kept
         return output_path
 
     except Exception as e:
@@ -0,0 +1,36 @@
+import os
+from flask import current_app
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video
+from app.services.videos.pipeline import build_pipeline_command
+
+
+def burn_captions(video_path, step, output_name=None, media_info=None, profile=None):
+    """
+    Burn the cues of an SRT or VTT file into a video.
+
+    Each distinct caption is rendered to a bitmap once and the bitmaps reach ffmpeg as one timed image
+    stream, blended by a single overlay in the same filter graph as the pipeline, so the video is
+    decoded and encoded a single time.
+
+    Parameters:
+        video_path (str): The path to the original video file.
+        step (dict): The burn_captions operation, with the captions_filename of the stored caption file.
+        output_name (str): Base name for the processed file, defaults to the name of the original video.
+        media_info (dict): Stored probe of the video; the file is probed when omitted.
+        profile (dict): Encoder settings from encoding_profile, the default profile when omitted.
+
+    Returns:
+        Path of the processed video.
+    """
+    try:
+        probe = media_info or probe_video(video_path)
+
+        processed_folder = os.path.join(os.getcwd(), 'processed_videos')
+        os.makedirs(processed_folder, exist_ok=True)
+        output_path = os.path.join(processed_folder, f"processed_captions_{output_name or os.path.basename(video_path)}")
+
+        run_ffmpeg(build_pipeline_command(video_path, [step], probe, current_app.config['LOGO_FOLDER'], output_path, profile=profile))
+        return output_path
+
+    except Exception as e:
+        raise Exception(f"Error burning captions: {e}")
@@ -0,0 +1,280 @@
+import functools
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from flask import current_app
+from PIL import Image, ImageDraw, ImageFont
+
+# Caption size relative to the frame: font height, widest line and distance from the bottom edge
+FONT_SCALE = 0.05
+MAX_WIDTH_SCALE = 0.9
+BOTTOM_MARGIN_SCALE = 0.06
+BOX_PADDING_SCALE = 0.4
+LINE_SPACING_SCALE = 0.2
+STROKE_SCALE = 0.06
+TEXT_COLOR = (255, 255, 255, 255)
+STROKE_COLOR = (0, 0, 0, 255)
+BOX_COLOR = (0, 0, 0, 140)
+CLEAR_COLOR = (0, 0, 0, 0)
+
+CAPTION_EXTENSIONS = ('.srt', '.vtt')
+
+CUE_TIMING = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})')
+MARKUP = re.compile(r'<[^>]*>|\{\\[^}]*\}')
+
+
+def parse_timestamp(value):
+    """Seconds of an SRT (00:01:02,500) or VTT (01:02.500 or 00:01:02.500) timestamp."""
+    parts = value.replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    minutes = int(parts[-2])
+    hours = int(parts[-3]) if len(parts) == 3 else 0
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_captions(path):
+    """
+    Read the cues of an SRT or VTT file.
+
+    Formatting tags are removed; blocks without a timing line (the VTT header, NOTE and STYLE
+    blocks) are skipped.
+
+    Returns:
+        List of (start, end, text) tuples sorted by start time.
+
+    Raises:
+        Exception: If the file holds no cue.
+    """
+    with open(path, encoding='utf-8-sig', errors='replace') as caption_file:
+        content = caption_file.read().replace('\r\n', '\n').replace('\r', '\n')
+
+    cues = []
+    for block in re.split(r'\n\s*\n', content):
+        lines = block.strip().split('\n')
+        for idx, line in enumerate(lines):
+            timing = CUE_TIMING.search(line)
+            if not timing:
+                continue
+            start, end = parse_timestamp(timing.group(1)), parse_timestamp(timing.group(2))
+            text = '\n'.join(MARKUP.sub('', text_line).strip() for text_line in lines[idx + 1:]).strip()
+            if text and end > start:
+                cues.append((start, end, text))
+            break
+
+    if not cues:
+        raise Exception("The caption file has no cues.")
+    return sorted(cues)
+
+
+def map_cues(cues, ranges):
+    """
+    Move cues from the source timeline to the output of a trim.
+
+    Parameters:
+        cues (list): (start, end, text) tuples on the source timeline.
+        ranges (list): (start, end) ranges of the source joined into the output, or [(None, None)]
+            for the whole source.
+    """
+    if ranges == [(None, None)]:
+        return cues
+    mapped = []
+    output_offset = 0.0
+    for range_start, range_end in ranges:
+        for start, end, text in cues:
+            start, end = max(start, range_start), min(end, range_end)
+            if end > start:
+                mapped.append((output_offset + start - range_start, output_offset + end - range_start, text))
+        output_offset += range_end - range_start
+    return mapped
+
+
+@functools.lru_cache(maxsize=16)
+def load_font(font_path, size):
+    try:
+        return ImageFont.truetype(font_path, size)
+    except OSError:
+        current_app.logger.warning(f"Caption font {font_path} not found, using the default font")
+        return ImageFont.load_default()
+
+
+def wrap_text(text, font, max_width, stroke_width):
+    """Break the text into lines no wider than max_width, keeping the line breaks of the cue."""
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and font.getbbox(candidate, stroke_width=stroke_width)[2] > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def render_caption(text, frame_width, frame_height, bitmap_folder):
+    """
+    Rasterize a caption once as an RGBA bitmap sized for the frame.
+
+    Bitmaps are stored under a hash of their text and layout, so a cue that repeats, or a caption
+    file burned into another video of the same size, reuses the file instead of rendering it again.
+
+    Returns:
+        Path of the PNG bitmap.
+    """
+    font_path = current_app.config['CAPTION_FONT']
+    font_size = max(12, round(frame_height * FONT_SCALE))
+    max_width = round(frame_width * MAX_WIDTH_SCALE)
+
+    key = hashlib.sha256(json.dumps([text, font_size, max_width, font_path]).encode()).hexdigest()
+    bitmap_path = os.path.join(bitmap_folder, f"{key}.png")
+    if os.path.exists(bitmap_path):
+        return bitmap_path
+
+    font = load_font(font_path, font_size)
+    padding = round(font_size * BOX_PADDING_SCALE)
+    spacing = round(font_size * LINE_SPACING_SCALE)
+    stroke_width = max(1, round(font_size * STROKE_SCALE))
+    text = wrap_text(text, font, max_width - 2 * padding, stroke_width)
+
+    measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox((0, 0), text, font=font, spacing=spacing,
+                                                          align='center', stroke_width=stroke_width)
+    # Even dimensions keep the overlay aligned to chroma samples of 4:2:0 video
+    width = math.ceil(right - left) + 2 * padding
+    height = math.ceil(bottom - top) + 2 * padding
+    width, height = width + width % 2, height + height % 2
+
+    image = Image.new('RGBA', (width, height), BOX_COLOR)
+    draw = ImageDraw.Draw(image)
+    draw.multiline_text((padding - left, padding - top), text, font=font, fill=TEXT_COLOR, spacing=spacing,
+                        align='center', stroke_width=stroke_width, stroke_fill=STROKE_COLOR)
+    save_atomically(bitmap_folder, bitmap_path, lambda temp_file: image.save(temp_file, format='PNG'))
+    return bitmap_path
+
+
+def save_atomically(folder, path, write):
+    """Write a file through write(file) under a temporary name and rename it to path when complete."""
+    # Workers may render the same caption at once; the rename makes the finished file appear atomically
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            write(temp_file)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def caption_timeline(cues):
+    """
+    Split cues into consecutive intervals that each show one caption.
+
+    Where cues overlap, the interval shows their texts stacked in the order the cues start, so a
+    single image stream can carry every caption.
+
+    Returns:
+        List of (start, end, text) tuples that do not overlap, sorted by start time.
+    """
+    cues = sorted(cues)
+    bounds = sorted({time for start, end, _ in cues for time in (start, end)})
+    timeline = []
+    active = []
+    next_cue = 0
+    for start, end in zip(bounds, bounds[1:]):
+        while next_cue < len(cues) and cues[next_cue][0] <= start:
+            active.append(cues[next_cue])
+            next_cue += 1
+        active = [cue for cue in active if cue[1] > start]
+        if not active:
+            continue
+        text = '\n'.join(cue_text for _, _, cue_text in active)
+        if timeline and timeline[-1][1] == start and timeline[-1][2] == text:
+            timeline[-1] = (timeline[-1][0], end, text)
+        else:
+            timeline.append((start, end, text))
+    return timeline
+
+
+def canvas_bitmap(bitmap_path, width, height, bitmap_folder):
+    """
+    Place a caption bitmap, bottom centered, on a transparent canvas of the given size.
+
+    Every frame of the caption stream must have the same size, otherwise ffmpeg rebuilds the filter
+    graph whenever the caption changes. Without bitmap_path the canvas stays empty.
+    """
+    name = os.path.splitext(os.path.basename(bitmap_path))[0] if bitmap_path else 'clear'
+    canvas_path = os.path.join(bitmap_folder, f"{name}_{width}x{height}.png")
+    if os.path.exists(canvas_path):
+        return canvas_path
+
+    canvas = Image.new('RGBA', (width, height), CLEAR_COLOR)
+    if bitmap_path:
+        with Image.open(bitmap_path) as bitmap:
+            canvas.paste(bitmap, ((width - bitmap.width) // 2, height - bitmap.height))
+    save_atomically(bitmap_folder, canvas_path, lambda temp_file: canvas.save(temp_file, format='PNG'))
+    return canvas_path
+
+
+def caption_track(captions_path, frame_width, frame_height, ranges=((None, None),)):
+    """
+    Render the captions of a file as one timed image stream for a single overlay filter.
+
+    Every distinct caption is rasterized once. The stream is an ffconcat list of same-sized
+    canvases, each shown for its interval and an empty canvas between cues, so ffmpeg decodes one
+    image per caption change and blends one overlay per frame, however many cues the file holds.
+    Lists and canvases are stored under a hash of their content and shared between jobs.
+
+    Parameters:
+        captions_path (str): SRT or VTT file, timed against the source video.
+        frame_width (int), frame_height (int): Size of the frames the captions are burned into.
+        ranges (list): Source ranges that make up the output, as built by the pipeline.
+
+    Returns:
+        Path of the ffconcat list, or None when no cue falls within the ranges.
+    """
+    bitmap_folder = os.path.join(current_app.config['CAPTIONS_FOLDER'], 'bitmaps')
+    timeline = caption_timeline(map_cues(parse_captions(captions_path), list(ranges)))
+    if not timeline:
+        return None
+
+    bitmaps = {text: render_caption(text, frame_width, frame_height, bitmap_folder) for _, _, text in timeline}
+    sizes = []
+    for bitmap_path in bitmaps.values():
+        with Image.open(bitmap_path) as bitmap:
+            sizes.append(bitmap.size)
+    width, height = max(size[0] for size in sizes), max(size[1] for size in sizes)
+    clear_path = canvas_bitmap(None, width, height, bitmap_folder)
+
+    entries = []
+    position = 0.0
+    for start, end, text in timeline:
+        if start > position:
+            entries.append((clear_path, start - position))
+        entries.append((canvas_bitmap(bitmaps[text], width, height, bitmap_folder), end - start))
+        position = end
+    # The demuxer ignores the duration of the last file, so the stream ends on an empty canvas
+    entries.append((clear_path, None))
+    lines = ["ffconcat version 1.0"]
+    for path, duration in entries:
+        escaped = path.replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        if duration is not None:
+            lines.append(f"duration {duration:.6f}")
+    content = "\n".join(lines) + "\n"
+
+    list_path = os.path.join(bitmap_folder, f"{hashlib.sha256(content.encode()).hexdigest()}.ffconcat")
+    if not os.path.exists(list_path):
+        save_atomically(bitmap_folder, list_path, lambda temp_file: temp_file.write(content.encode()))
+    return list_path
+
+
+def caption_y_offset(frame_height):
+    return round(frame_height * BOTTOM_MARGIN_SCALE)
@@ -1,67 +1,42 @@
-from moviepy.editor import VideoFileClip
-from PIL import Image
-from flask import current_app
 import os
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video
+from app.services.videos.pipeline import build_pipeline_command, ASPECT_MODE_CROP
 
-def change_aspect_ratio(video_path, aspect_ratio):
+def change_aspect_ratio(video_path, aspect_ratio, output_name=None, media_info=None, mode=ASPECT_MODE_CROP, resolution=None, profile=None):
     """
     Function to change the aspect ratio of the video and save the processed video in the processed folder.
+
+    The frame is cropped to the centered region with the target ratio, or letterboxed with black bars
+    in 'letterbox' mode, and scaled to the optional resolution by a single ffmpeg filter chain, so
+    the video is decoded and encoded once.
+
+    Parameters:
+        video_path (str): The path to the original video file.
+        aspect_ratio (str): One of 16:9, 9:16, 1:1 or 4:3.
+        output_name (str): Base name for the processed file, defaults to the name of the original video.
+        media_info (dict): Stored probe of the video; the file is probed when omitted.
+        mode (str): 'crop' or 'letterbox'.
+        resolution (str): Output size as WIDTHxHEIGHT, e.g. 1080x1920; the source scale is kept when omitted.
+        profile (dict): Encoder settings from encoding_profile, the default profile when omitted.
+
+    Returns:
+        Path of the processed video.
     """
     try:
-        # Load the video file
-        video = VideoFileClip(video_path)
-        
-        # Determine the target aspect ratio
-        if aspect_ratio == "16:9":
-            target_width, target_height = 16, 9
-        elif aspect_ratio == "9:16":
-            target_width, target_height = 9, 16
-        elif aspect_ratio == "1:1":
-            target_width, target_height = 1, 1
-        elif aspect_ratio == "4:3":
-            target_width, target_height = 4, 3
-        else:
-            raise ValueError(f"Invalid aspect ratio: {aspect_ratio}")
-
-        # Calculate new dimensions
-        original_width, original_height = video.size
-        target_aspect_ratio = target_width / target_height
-        original_aspect_ratio = original_width / original_height
-
-        if original_aspect_ratio > target_aspect_ratio:
-            # Video is wider than target aspect ratio; crop sides
-            new_width = int(target_height * original_aspect_ratio)
-            new_height = original_height
-        else:
-            # Video is taller than target aspect ratio; crop top and bottom
-            new_width = original_width
-            new_height = int(target_width / original_aspect_ratio)
-
-        # Create the resized video
-        resized_video = video.resize(newsize=(new_width, new_height))
-
-        # Center crop to target aspect ratio
-        x_center = new_width // 2
-        y_center = new_height // 2
-        crop_x1 = x_center - (target_width // 2)
-        crop_y1 = y_center - (target_height // 2)
-        crop_x2 = crop_x1 + target_width
-        crop_y2 = crop_y1 + target_height
-
-        cropped_video = resized_video.crop(x1=crop_x1, y1=crop_y1, x2=crop_x2, y2=crop_y2)
+        probe = media_info or probe_video(video_path)
+        step = {'name': 'change_aspect_ratio', 'aspect_ratio': aspect_ratio, 'mode': mode, 'resolution': resolution}
 
         # Processed folder path
-        processed_folder = os.path.join(os.getcwd(), 'processed')  # You can pass from Flask's config
+        processed_folder = os.path.join(os.getcwd(), 'processed_videos')
         os.makedirs(processed_folder, exist_ok=True)
 
         # Save the processed video
-        original_filename = os.path.basename(video_path)
+        original_filename = output_name or os.path.basename(video_path)
         processed_filename = f"processed_aspect_ratio_{aspect_ratio}_{original_filename}"
         processed_clip_path = os.path.join(processed_folder, processed_filename)
-        cropped_video.write_videofile(processed_clip_path, codec="libx264")
+        run_ffmpeg(build_pipeline_command(video_path, [step], probe, None, processed_clip_path, profile=profile))
 
-        return {"processed_clip_path": processed_clip_path}
+        return processed_clip_path
 
     except Exception as e:
-        print(f"Error changing aspect ratio: {e}")
-        return {"error": str(e)}
+        raise Exception(f"Error changing aspect ratio: {e}")
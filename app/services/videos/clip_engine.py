@@ -0,0 +1,75 @@
+from app.services.videos.ffmpeg_utils import run_ffmpeg, video_encode_args
+
+
+def group_ranges(clips):
+    """
+    Sort the requested clips and merge overlapping or touching ranges.
+
+    Parameters:
+        clips (list): Dictionaries with 'start', 'end' and 'path' keys.
+
+    Returns:
+        List of groups, each a dictionary with the covered 'start'/'end' and its member 'clips'.
+    """
+    groups = []
+    for clip in sorted(clips, key=lambda c: (c['start'], c['end'])):
+        if groups and clip['start'] <= groups[-1]['end']:
+            groups[-1]['end'] = max(groups[-1]['end'], clip['end'])
+            groups[-1]['clips'].append(clip)
+        else:
+            groups.append({'start': clip['start'], 'end': clip['end'], 'clips': [clip]})
+    return groups
+
+
+def build_single_pass_command(video_path, groups, has_audio, profile):
+    """
+    Build the ffmpeg arguments that decode every covered range once and feed all encoders.
+
+    Each group is opened as its own input with an input seek, so gaps between groups are skipped
+    instead of decoded. Frames of a group are split to one trim per clip inside the filter graph.
+    """
+    input_args = []
+    filters = []
+    output_args = []
+
+    for group_index, group in enumerate(groups):
+        input_args += ["-ss", f"{group['start']:.6f}", "-t", f"{group['end'] - group['start']:.6f}", "-i", video_path]
+
+        count = len(group['clips'])
+        video_labels = [f"[g{group_index}v{i}]" for i in range(count)]
+        filters.append(f"[{group_index}:v:0]split={count}{''.join(video_labels)}")
+        if has_audio:
+            audio_labels = [f"[g{group_index}a{i}]" for i in range(count)]
+            filters.append(f"[{group_index}:a:0]asplit={count}{''.join(audio_labels)}")
+
+        for clip_index, clip in enumerate(group['clips']):
+            start = clip['start'] - group['start']
+            end = clip['end'] - group['start']
+            label = f"g{group_index}c{clip_index}"
+            filters.append(f"{video_labels[clip_index]}trim=start={start:.6f}:end={end:.6f},setpts=PTS-STARTPTS[{label}v]")
+            output_args += ["-map", f"[{label}v]"]
+            if has_audio:
+                filters.append(f"{audio_labels[clip_index]}atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS[{label}a]")
+                output_args += ["-map", f"[{label}a]"]
+            output_args += [*video_encode_args(profile), clip['path']]
+
+    return [*input_args, "-filter_complex", ";".join(filters), *output_args]
+
+
+def encode_clips_single_pass(video_path, clips, has_audio, profile):
+    """
+    Re-encode several clips of one source with a single ffmpeg process.
+
+    Decode work scales with the duration covered by the clips rather than with the number of clips,
+    because overlapping ranges are decoded once and shared by all encoders.
+
+    Parameters:
+        video_path (str): The path to the original video file.
+        clips (list): Dictionaries with 'start' and 'end' in seconds and the output 'path'.
+        has_audio (bool): Whether the source has an audio stream to carry over.
+        profile (dict): Encoder settings from encoding_profile.
+    """
+    if not clips:
+        return
+    groups = group_ranges(clips)
+    run_ffmpeg(build_single_pass_command(video_path, groups, has_audio, profile))
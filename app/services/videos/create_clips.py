@@ -1,46 +1,93 @@
-from moviepy.video.io.VideoFileClip import VideoFileClip
 import os
 from flask import current_app
+from app.services.videos.ffmpeg_utils import probe_video, get_keyframes, encoding_profile
+from app.services.videos.trim import choose_trim_mode, smart_cut_matches_source, copy_segment, smart_cut, TRIM_MODE_COPY, TRIM_MODE_SMART_CUT, TRIM_MODE_REENCODE
+from app.services.videos.clip_engine import group_ranges, encode_clips_single_pass
+from app.services.videos.encoder_pool import run_encode_jobs
 
-def create_clips(video_path, clips_info):
+def create_clips(video_path, clips_info, trim_mode='fast', output_name=None, media_info=None, profile=None):
     """
     Function to create video clips from a video file.
 
+    Clips that can be cut around keyframes are remuxed or smart cut on their own. Clips that need a
+    full re-encode are produced together from a single decode of each covered range. Independent jobs
+    run in parallel on the encoder pool, and a failing clip does not fail the others.
+
     Parameters:
         video_path (str): The path to the original video file.
         clips_info (list): A list of dictionaries, each containing 'start' and 'end' times in seconds or HH:MM:SS format.
-    
+        trim_mode (str): 'fast' remuxes (or smart cuts) around keyframes where possible, 're_encode' always re-encodes.
+        output_name (str): Base name for the generated files, defaults to the name of the original video.
+        media_info (dict): Stored probe of the video with its keyframe index; the file is probed when omitted.
+        profile (dict): Encoder settings from encoding_profile, the default profile when omitted.
+
     Returns:
-        List of paths of the generated clips.
+        List of dictionaries with the 'path' of each generated clip, the 'mode' used to cut it and an
+        'error' message if that clip failed, in the order of clips_info.
     """
     try:
         # Processed folder path
         processed_folder = os.path.join(os.getcwd(), 'processed_videos')  # You can pass from Flask's config
         os.makedirs(processed_folder, exist_ok=True)
-        
-        # Load the video file
-        video = VideoFileClip(video_path)
+
+        probe = media_info or probe_video(video_path)
+        profile = profile or encoding_profile()
+        if trim_mode == 'fast':
+            keyframes = media_info['keyframes'] if media_info else get_keyframes(video_path)
+            tolerance = current_app.config['CLIP_KEYFRAME_TOLERANCE']
+            smart_cut_allowed = smart_cut_matches_source(video_path, probe, profile, processed_folder)
+
         clips = []
-        clip_paths = []
 
-        # Create clips based on provided timestamps
+        # Plan every clip based on provided timestamps
         for idx, clip_info in enumerate(clips_info):
-            start_time = clip_info['start']
-            end_time = clip_info['end']
-            
             # Convert time format if in HH:MM:SS
-            start_time = convert_time_to_seconds(start_time)
-            end_time = convert_time_to_seconds(end_time)
+            start_time = float(convert_time_to_seconds(clip_info['start']))
+            end_time = float(convert_time_to_seconds(clip_info['end']))
 
-            # Extract the clip from the original video
-            clip = video.subclip(start_time, end_time)
-            original_filename = os.path.basename(video_path)
-            processed_filename = f"clip_{idx + 1}_{original_filename}.mp4"
+            original_filename = output_name or os.path.basename(video_path)
+            processed_filename = f"clip_{idx + 1}_{os.path.splitext(original_filename)[0]}.mp4"
             processed_clip_path = os.path.join(processed_folder, processed_filename)
-            clip.write_videofile(processed_clip_path, codec="libx264")
-            clip_paths.append(processed_clip_path)
 
-        return clip_paths
+            if start_time < 0 or end_time <= start_time:
+                # Invalid range; reported for this clip only
+                clips.append({'path': None, 'mode': None, 'error': f"Invalid clip range {start_time}-{end_time}"})
+                continue
+
+            if trim_mode == 'fast':
+                mode, start_time, end_time = choose_trim_mode(start_time, end_time, keyframes, probe, tolerance, smart_cut_allowed)
+            else:
+                mode = TRIM_MODE_REENCODE
+
+            clips.append({'path': processed_clip_path, 'mode': mode, 'start': start_time, 'end': end_time, 'error': None})
+
+        # Clips that are cut on their own and groups of clips sharing one decode are independent
+        # jobs, so they are encoded concurrently on the encoder pool
+        jobs = []
+        job_clips = []
+        for clip in clips:
+            if clip['mode'] == TRIM_MODE_COPY:
+                jobs.append(lambda clip=clip: copy_segment(video_path, clip['start'], clip['end'], clip['path']))
+                job_clips.append([clip])
+            elif clip['mode'] == TRIM_MODE_SMART_CUT:
+                jobs.append(lambda clip=clip: smart_cut(video_path, clip['start'], clip['end'], keyframes, probe, clip['path'], profile))
+                job_clips.append([clip])
+
+        has_audio = probe['audio_codec'] is not None
+        for group in group_ranges([clip for clip in clips if clip['mode'] == TRIM_MODE_REENCODE]):
+            jobs.append(lambda group=group: encode_clips_single_pass(video_path, group['clips'], has_audio, profile))
+            job_clips.append(group['clips'])
+
+        for (_, error), members in zip(run_encode_jobs(jobs), job_clips):
+            for clip in members:
+                if error:
+                    clip['error'] = str(error)
+                    # Drop partial output of the failed clip
+                    if os.path.exists(clip['path']):
+                        os.remove(clip['path'])
+                    clip['path'] = None
+
+        return [{'path': clip['path'], 'mode': clip['mode'], 'error': clip['error']} for clip in clips]
 
     except Exception as e:
         # Raise the exception to be handled by the parent function
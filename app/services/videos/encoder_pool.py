@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+
+def run_encode_jobs(jobs, pool_size=None):
+    """
+    Run independent encode jobs concurrently on a bounded pool.
+
+    Every job spawns its own ffmpeg process, so the pool threads only wait on subprocesses. A thread
+    pool is used because Celery's prefork children are daemonic and cannot start a multiprocessing pool.
+
+    Parameters:
+        jobs (list): Zero-argument callables. They must not rely on the Flask application context.
+        pool_size (int): Maximum number of concurrent encoders, defaults to ENCODER_POOL_SIZE.
+
+    Returns:
+        List of (result, error) tuples in the order of jobs; error is None when the job succeeded.
+    """
+    if pool_size is None:
+        pool_size = current_app.config['ENCODER_POOL_SIZE']
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(pool_size, len(jobs) or 1))) as executor:
+        futures = [executor.submit(job) for job in jobs]
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, e))
+    return results
@@ -0,0 +1,230 @@
+import itertools
+import json
+import os
+import subprocess
+import tempfile
+from flask import current_app
+from moviepy.config import get_setting
+from app.services.progress import current_tracker, ProcessingAborted, PASS_ENCODE, PASS_COPY, PASS_MUX
+
+# Keys of the passes reporting to a tracker; ids of finished Popen objects are reused
+_pass_ids = itertools.count()
+
+
+def ffmpeg_binary():
+    """Return the ffmpeg executable used by moviepy so both paths share one binary."""
+    return get_setting("FFMPEG_BINARY")
+
+
+def ffprobe_binary():
+    return os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+
+def run_ffmpeg(args, kind=PASS_ENCODE):
+    """
+    Run ffmpeg with the given arguments.
+
+    While a job's progress is tracked, ffmpeg writes its progress to stdout and the output time is
+    reported to the job as it advances. Each report is also an abort checkpoint; an aborted job's
+    ffmpeg is killed and ProcessingAborted is raised.
+
+    Parameters:
+        args (list): Arguments passed to ffmpeg after the global flags.
+        kind (str): PASS_ENCODE, PASS_COPY for a stream copy of a range of the source, or PASS_MUX
+            for a pass joining or muxing outputs of earlier passes, which is not counted as progress.
+
+    Raises:
+        ProcessingAborted: If the job was aborted before or while ffmpeg ran.
+        Exception: If ffmpeg exits with a non-zero status.
+    """
+    command = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error", "-y", *[str(arg) for arg in args]]
+    tracker = current_tracker()
+    if tracker is None:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        returncode, errors = result.returncode, result.stderr
+    else:
+        returncode, errors = run_with_progress(command, tracker, kind)
+    if returncode != 0:
+        raise Exception(f"ffmpeg failed: {errors.decode(errors='replace').strip()}")
+
+
+def run_with_progress(command, tracker, kind=PASS_ENCODE):
+    """Run an ffmpeg command, feeding its -progress output to the tracker. Returns (returncode, stderr)."""
+    # Do not start new work, e.g. the next segment, for a job that has been aborted
+    tracker.check_aborted(force=True)
+    tracker.add_output(command[-1])
+
+    command = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+    # stderr goes to a file so a chatty failure cannot fill the pipe while stdout is being read
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        tracker.add_process(process, kind)
+        try:
+            source = next(_pass_ids)
+            out_time, frame = 0.0, None
+            for line in process.stdout:
+                key, _, value = line.decode(errors='replace').strip().partition("=")
+                if key == "out_time_us" and value.isdigit():
+                    out_time = int(value) / 1_000_000
+                elif key == "frame" and value.isdigit():
+                    frame = int(value)
+                elif key == "progress":
+                    # Every progress block ends with progress=continue or progress=end
+                    tracker.update(source, out_time, frame, kind)
+        except ProcessingAborted:
+            process.kill()
+            raise
+        finally:
+            process.wait()
+            tracker.remove_process(process, kind)
+
+        if tracker.aborted:
+            # Killed because another encoder of the job noticed the abort
+            raise ProcessingAborted(f"Processing of video {tracker.video_id} was aborted")
+        stderr_file.seek(0)
+        return process.returncode, stderr_file.read()
+
+
+def run_ffprobe(args):
+    command = [ffprobe_binary(), "-v", "error", *[str(arg) for arg in args]]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout.decode(errors='replace')
+
+
+def probe_video(video_path):
+    """
+    Read container and stream information without decoding any frames.
+
+    Returns:
+        dict with duration, width, height, fps, video_codec, pix_fmt, time_base and audio_codec
+        (audio_codec is None when the file has no audio stream).
+    """
+    output = run_ffprobe([
+        "-show_entries",
+        "format=duration:stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,time_base",
+        "-of", "json",
+        video_path,
+    ])
+    data = json.loads(output)
+    streams = data.get("streams", [])
+    video_stream = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio_stream = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video_stream is None:
+        raise Exception(f"No video stream found in {video_path}")
+
+    num, _, den = video_stream.get("r_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den) if den and float(den) else 0.0
+
+    return {
+        "duration": float(data.get("format", {}).get("duration", 0.0)),
+        "width": video_stream.get("width"),
+        "height": video_stream.get("height"),
+        "fps": fps,
+        "video_codec": video_stream.get("codec_name"),
+        "pix_fmt": video_stream.get("pix_fmt"),
+        "time_base": video_stream.get("time_base"),
+        "audio_codec": audio_stream.get("codec_name") if audio_stream else None,
+    }
+
+
+def get_keyframes(video_path):
+    """
+    Return the sorted presentation times (in seconds) of the video keyframes.
+
+    Only packet headers are read, so this is cheap even for long files.
+    """
+    output = run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ])
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def codec_parameters(video_path):
+    """
+    Codec, profile, level and a hash of the decoder configuration of the first video stream.
+
+    For H.264 in MP4 the configuration is the avcC box holding the SPS and PPS.
+    """
+    output = run_ffprobe([
+        "-show_data_hash", "SHA256",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,profile,level,extradata_hash",
+        "-of", "json",
+        video_path,
+    ])
+    streams = json.loads(output).get("streams", [])
+    if not streams:
+        raise Exception(f"No video stream found in {video_path}")
+    stream = streams[0]
+    return stream.get("codec_name"), stream.get("profile"), stream.get("level"), stream.get("extradata_hash")
+
+
+def count_frames(video_path, start, end):
+    """Return the number of video frames presented in [start, end), reading only that interval."""
+    output = run_ffprobe([
+        "-read_intervals", f"{max(start - 1, 0):.6f}%{end + 1:.6f}",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time",
+        "-of", "csv=p=0",
+        video_path,
+    ])
+    count = 0
+    for line in output.splitlines():
+        pts_time = line.strip().rstrip(",")
+        if pts_time not in ("", "N/A") and start - 1e-6 <= float(pts_time) < end - 1e-6:
+            count += 1
+    return count
+
+
+def encoding_profile(name=None):
+    """
+    Encoder settings of a profile of ENCODING_PROFILES, the default profile when name is None.
+
+    The settings are a plain dict, so they can be handed to encoder pool jobs and subtasks.
+
+    Raises:
+        Exception: If there is no profile with that name.
+    """
+    profiles = current_app.config['ENCODING_PROFILES']
+    name = name or current_app.config['DEFAULT_ENCODING_PROFILE']
+    if name not in profiles:
+        raise Exception(f"Invalid encoding profile. Valid options are: {', '.join(profiles)}")
+    return {'name': name, 'threads': current_app.config['ENCODER_THREADS'], **profiles[name]}
+
+
+def requested_profile_name(steps):
+    """
+    The encoding_profile of a request, given on any of its steps, or None for the default profile.
+
+    Raises:
+        Exception: If steps ask for different profiles; a job is encoded with a single profile.
+    """
+    names = {step['encoding_profile'] for step in steps if step.get('encoding_profile')}
+    if len(names) > 1:
+        raise Exception("All steps of a request must use the same encoding profile.")
+    return names.pop() if names else None
+
+
+def video_codec_args(profile, pix_fmt=None):
+    """Video encoder arguments of a profile; pix_fmt overrides the profile's pixel format."""
+    return ["-c:v", profile['video_codec'], "-preset", profile['preset'], "-crf", profile['crf'],
+            "-pix_fmt", pix_fmt or profile['pix_fmt'], "-threads", profile['threads']]
+
+
+def audio_codec_args(profile):
+    return ["-c:a", profile['audio_codec'], "-b:a", profile['audio_bitrate']]
+
+
+def video_encode_args(profile):
+    """Encoder arguments for video and audio that have to be re-encoded."""
+    return [*video_codec_args(profile), *audio_codec_args(profile)]
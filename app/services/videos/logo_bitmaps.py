@@ -0,0 +1,61 @@
+import os
+import tempfile
+from PIL import Image, ImageChops
+
+# Logo height in pixels when no scale is requested
+LOGO_HEIGHT = 50
+
+
+def logo_height(frame_height, scale=None):
+    """Height of the logo: scale is a fraction of the frame height, LOGO_HEIGHT pixels by default."""
+    height = round(frame_height * float(scale)) if scale else LOGO_HEIGHT
+    return max(2, height - height % 2)
+
+
+def prepare_logo(logo_folder, logo_filename, height, opacity=1.0):
+    """
+    Resize a logo, apply its opacity and premultiply its alpha once, ready for ffmpeg's overlay.
+
+    Logos are stored by content hash, so the prepared bitmap is keyed by that hash, the height and
+    the exact opacity. A brand logo used by many jobs is decoded and resampled a single time.
+
+    Parameters:
+        logo_folder (str): Folder holding the uploaded logo; prepared bitmaps go in its prepared subfolder.
+        logo_filename (str): File name of the logo, its content hash plus extension.
+        height (int): Height of the prepared logo in pixels.
+        opacity (float): Opacity between 0 and 1 applied on top of the logo's own alpha.
+
+    Returns:
+        Path of the prepared PNG. Its colors are premultiplied by alpha.
+    """
+    logo_hash = os.path.splitext(logo_filename)[0]
+    prepared_folder = os.path.join(logo_folder, 'prepared')
+    # Keyed by the exact opacity; any difference changes some alpha values of the bitmap
+    prepared_path = os.path.join(prepared_folder, f"{logo_hash}_{height}_{float(opacity)!r}.png")
+    if os.path.exists(prepared_path):
+        return prepared_path
+
+    with Image.open(os.path.join(logo_folder, logo_filename)) as source:
+        logo = source.convert('RGBA')
+    width = max(2, round(logo.width * height / logo.height))
+    # Even dimensions keep the overlay aligned to chroma samples of 4:2:0 video
+    logo = logo.resize((width + width % 2, height), Image.LANCZOS)
+
+    red, green, blue, alpha = logo.split()
+    if opacity < 1:
+        alpha = alpha.point(lambda value: round(value * opacity))
+    logo = Image.merge('RGBA', (ImageChops.multiply(red, alpha), ImageChops.multiply(green, alpha),
+                                ImageChops.multiply(blue, alpha), alpha))
+
+    # Workers may prepare the same logo at once; the rename makes the finished file appear atomically
+    os.makedirs(prepared_folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=prepared_folder, suffix='.png')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            logo.save(temp_file, format='PNG')
+        os.replace(temp_path, prepared_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return prepared_path
@@ -1,48 +1,148 @@
 import os
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from moviepy.editor import concatenate_videoclips
+import shutil
+import tempfile
+from flask import current_app
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video, get_keyframes, encoding_profile, audio_codec_args, PASS_MUX
+from app.services.videos.trim import choose_trim_mode, smart_cut_matches_source, copy_segment, smart_cut_video, reencode_segment, write_concat_list, TRIM_MODE_COPY, TRIM_MODE_SMART_CUT, TRIM_MODE_REENCODE
+from app.services.videos.encoder_pool import run_encode_jobs
 
-def merge_clips(video_path, clips_info):
+MERGE_MODE_CONCAT = 'concat'
+MERGE_MODE_REENCODE = 're_encode'
+
+def merge_clips(video_path, clips_info, trim_mode='fast', output_name=None, media_info=None, profile=None):
     """
     Function to merge video clips based on timestamps and save the merged clip in the processed folder.
     The number of clips is limited to 10.
+
+    In 'fast' mode every segment is remuxed or smart cut like a clip and the segments are joined with
+    the concat demuxer, so the merge costs little more than copying the data. The segments are only
+    re-encoded when they cannot be joined losslessly. The audio is cut from the source and encoded
+    once while muxing.
+
+    The stored probe and keyframe index of the video can be passed as media_info to skip probing it.
+    Re-encoded segments and the audio use the encoder settings of profile, the default profile when omitted.
+
+    Returns:
+        Dictionary with the merged 'path', the 'mode' used for the merge (concat or re_encode) and the
+        'segment_modes' used to cut each segment.
     """
     try:
         # Ensure no more than 10 clips are processed
         if len(clips_info) > 10:
             return {"error": "Cannot merge more than 10 clips"}
 
-        # Load the video file
-        video = VideoFileClip(video_path)
-        clips = []
+        probe = media_info or probe_video(video_path)
+        profile = profile or encoding_profile()
 
         # Processed folder path
         processed_folder = os.path.join(os.getcwd(), 'processed_videos')  # You can pass from Flask's config
         os.makedirs(processed_folder, exist_ok=True)
 
-        # Iterate over clip_info and create subclips
-        for idx, clip_info in enumerate(clips_info):
-            start_time = convert_time_to_seconds(clip_info['start'])
-            end_time = convert_time_to_seconds(clip_info['end'])
+        if trim_mode == 'fast':
+            keyframes = media_info['keyframes'] if media_info else get_keyframes(video_path)
+            tolerance = current_app.config['CLIP_KEYFRAME_TOLERANCE']
+            smart_cut_allowed = smart_cut_matches_source(video_path, probe, profile, processed_folder)
 
-            # Extract the clip and add to the list
-            clip = video.subclip(start_time, end_time)
-            clips.append(clip)
+        segments = []
+        for clip_info in clips_info:
+            start_time = float(convert_time_to_seconds(clip_info['start']))
+            end_time = float(convert_time_to_seconds(clip_info['end']))
+            if start_time < 0 or end_time <= start_time:
+                raise Exception(f"Invalid clip range {start_time}-{end_time}")
 
-        # Merge the clips
-        merged_clip = concatenate_videoclips(clips)
+            if trim_mode == 'fast':
+                mode, start_time, end_time = choose_trim_mode(start_time, end_time, keyframes, probe, tolerance, smart_cut_allowed)
+            else:
+                mode = TRIM_MODE_REENCODE
+            segments.append({'start': start_time, 'end': end_time, 'mode': mode})
 
-        # Save the merged clip
-        original_filename = os.path.basename(video_path)
-        processed_filename = f"processed_merge_{original_filename}"
-        processed_clip_path = os.path.join(processed_folder, processed_filename)
-        merged_clip.write_videofile(processed_clip_path, codec="libx264")
+        work_dir = tempfile.mkdtemp(prefix='merge_', dir=processed_folder)
+        try:
+            for idx, segment in enumerate(segments):
+                segment['path'] = os.path.join(work_dir, f"segment_{idx + 1}.mp4")
 
-        return processed_clip_path
+            cut_segments(video_path, segments, keyframes if trim_mode == 'fast' else None, probe, profile)
+            if all(segment['mode'] == TRIM_MODE_REENCODE for segment in segments):
+                merge_mode = MERGE_MODE_REENCODE
+            else:
+                merge_mode = MERGE_MODE_CONCAT
+
+            # Segments that did not end up with the same codec parameters cannot be joined without
+            # re-encoding, e.g. copied MPEG-4 segments next to re-encoded H.264 ones
+            if not segments_compatible([segment['path'] for segment in segments]):
+                for segment in segments:
+                    segment['mode'] = TRIM_MODE_REENCODE
+                cut_segments(video_path, segments, None, probe, profile)
+                merge_mode = MERGE_MODE_REENCODE
+
+            # Save the merged clip
+            original_filename = output_name or os.path.basename(video_path)
+            processed_filename = f"processed_merge_{original_filename}"
+            processed_clip_path = os.path.join(processed_folder, processed_filename)
+            concat_with_source_audio(video_path, segments, probe, work_dir, processed_clip_path, profile)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return {
+            'path': processed_clip_path,
+            'mode': merge_mode,
+            'segment_modes': [segment['mode'] for segment in segments],
+        }
 
     except Exception as e:
         raise Exception(f"Error merging video: {e}")
 
+def cut_segments(video_path, segments, keyframes, probe, profile):
+    """
+    Write the video of every segment to its 'path' in parallel on the encoder pool.
+    """
+    jobs = []
+    for segment in segments:
+        if segment['mode'] == TRIM_MODE_COPY:
+            jobs.append(lambda segment=segment: copy_segment(
+                video_path, segment['start'], segment['end'], segment['path'], include_audio=False))
+        elif segment['mode'] == TRIM_MODE_SMART_CUT:
+            jobs.append(lambda segment=segment: smart_cut_video(
+                video_path, segment['start'], segment['end'], keyframes, probe, segment['path'], profile))
+        else:
+            jobs.append(lambda segment=segment: reencode_segment(
+                video_path, segment['start'], segment['end'], segment['path'], profile, probe))
+
+    # Report every failed segment, not just the first one
+    errors = [f"segment {idx + 1}: {error}"
+              for idx, (_, error) in enumerate(run_encode_jobs(jobs)) if error]
+    if errors:
+        raise Exception("; ".join(errors))
+
+def segments_compatible(segment_paths):
+    """Check that all segments can be joined by the concat demuxer without re-encoding."""
+    signatures = set()
+    for path in segment_paths:
+        info = probe_video(path)
+        signatures.add((info['video_codec'], info['width'], info['height'], info['pix_fmt']))
+    return len(signatures) <= 1
+
+def concat_with_source_audio(video_path, segments, probe, work_dir, output_path, profile):
+    """
+    Join the video of the segment files and add the matching audio ranges of the source.
+    """
+    list_path = os.path.join(work_dir, 'segments.txt')
+    write_concat_list([segment['path'] for segment in segments], list_path)
+
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if probe['audio_codec'] is not None:
+        count = len(segments)
+        labels = "".join(f"[s{i}]" for i in range(count))
+        filters = [f"[1:a:0]asplit={count}{labels}"]
+        for i, segment in enumerate(segments):
+            filters.append(f"[s{i}]atrim=start={segment['start']:.6f}:end={segment['end']:.6f},asetpts=PTS-STARTPTS[a{i}]")
+        filters.append(f"{''.join(f'[a{i}]' for i in range(count))}concat=n={count}:v=0:a=1[aout]")
+        args += ["-i", video_path, "-filter_complex", ";".join(filters),
+                 "-map", "0:v:0", "-map", "[aout]", "-c:v", "copy", *audio_codec_args(profile)]
+    else:
+        args += ["-map", "0:v:0", "-c:v", "copy"]
+    run_ffmpeg([*args, output_path], PASS_MUX)
+
 def convert_time_to_seconds(time_str):
     """Converts a HH:MM:SS string to seconds."""
     if isinstance(time_str, str) and ':' in time_str:
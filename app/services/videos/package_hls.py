@@ -0,0 +1,202 @@
+import os
+import shutil
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video, encoding_profile
+from app.services.videos.encoder_pool import run_encode_jobs
+
+# Rendition ladder: height -> (video bitrate, max rate, buffer size), in kbit/s
+HLS_LADDER = {
+    1080: (5000, 5350, 7500),
+    720: (2800, 3000, 4200),
+    480: (1400, 1500, 2100),
+    360: (800, 860, 1200),
+}
+HLS_DEFAULT_RENDITIONS = 3
+HLS_MAX_RENDITIONS = 3
+HLS_AUDIO_BITRATE = 128
+# Seconds per segment; every rendition has a keyframe at each segment boundary so players can switch
+HLS_SEGMENT_SECONDS = 6
+HLS_MASTER_PLAYLIST = 'master.m3u8'
+HLS_INIT_SEGMENT = 'init.mp4'
+
+# Operations with a single video output, whose result a trailing package_hls step can package
+HLS_SOURCE_OPERATIONS = ('clip', 'merge', 'change_aspect_ratio', 'add_logo', 'burn_captions')
+
+
+def validate_hls_options(step):
+    """Check the optional list of rendition heights of a package_hls step."""
+    renditions = step.get('renditions')
+    if renditions is None:
+        return
+    if (not isinstance(renditions, list) or not 1 <= len(renditions) <= HLS_MAX_RENDITIONS
+            or len(set(renditions)) != len(renditions) or any(height not in HLS_LADDER for height in renditions)):
+        raise Exception(f"Renditions must be up to {HLS_MAX_RENDITIONS} distinct heights out of "
+                        f"{', '.join(str(height) for height in HLS_LADDER)}.")
+
+
+def hls_renditions(step, source_height):
+    """
+    Heights to package, highest first.
+
+    By default the highest ladder rungs that do not upscale the source; a source smaller than every
+    rung is packaged once at its own height.
+    """
+    requested = step.get('renditions')
+    if requested:
+        return sorted(requested, reverse=True)
+    heights = [height for height in sorted(HLS_LADDER, reverse=True) if height <= (source_height or 0)]
+    if not heights:
+        return [(source_height or min(HLS_LADDER)) // 2 * 2]
+    return heights[:HLS_DEFAULT_RENDITIONS]
+
+
+def rendition_bitrates(height):
+    """Bitrates of a height, using the nearest rung at or above it for heights off the ladder."""
+    rung = min((h for h in HLS_LADDER if h >= height), default=max(HLS_LADDER))
+    return HLS_LADDER[rung]
+
+
+def encode_rendition(video_path, probe, height, rendition_dir, profile):
+    """
+    Encode one rendition into HLS segments and its media playlist.
+
+    The bitrates come from the ladder; the profile only sets the encoder speed and threads.
+
+    Returns:
+        The RFC 6381 codec string of the encoded video, e.g. avc1.64002a.
+    """
+    os.makedirs(rendition_dir, exist_ok=True)
+    bitrate, maxrate, bufsize = rendition_bitrates(height)
+    args = [
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-vf", f"scale=-2:{height}",
+        "-c:v", "libx264", "-profile:v", "high", "-pix_fmt", "yuv420p",
+        "-preset", profile['preset'], "-threads", profile['threads'],
+        "-b:v", f"{bitrate}k", "-maxrate", f"{maxrate}k", "-bufsize", f"{bufsize}k",
+        # Keyframes on segment boundaries only, at the same times in every rendition
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})", "-sc_threshold", "0",
+    ]
+    if probe['audio_codec'] is not None:
+        args += ["-map", "0:a:0", "-c:a", "aac", "-b:a", f"{HLS_AUDIO_BITRATE}k", "-ac", "2"]
+    args += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        # Fragmented MP4 (CMAF) segments, which DASH players can use as well
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", HLS_INIT_SEGMENT,
+        "-hls_segment_filename", os.path.join(rendition_dir, "segment_%05d.m4s"),
+        os.path.join(rendition_dir, "index.m3u8"),
+    ]
+    run_ffmpeg(args)
+    return video_codec_string(os.path.join(rendition_dir, HLS_INIT_SEGMENT))
+
+
+def video_codec_string(init_path):
+    """
+    RFC 6381 codec string of the H.264 stream of an init segment, from its avcC box.
+
+    libx264 picks the level from the frame size and rate, e.g. 4.2 for 1080p60, so the playlist
+    states the profile and level that were actually encoded.
+    """
+    with open(init_path, 'rb') as init_file:
+        data = init_file.read()
+    index = data.find(b'avcC')
+    if index < 0 or len(data) < index + 8:
+        raise Exception(f"No H.264 configuration found in {init_path}")
+    # The box starts with its version, then the profile, the constraint flags and the level
+    profile, constraints, level = data[index + 5:index + 8]
+    return f"avc1.{profile:02x}{constraints:02x}{level:02x}"
+
+
+def write_master_playlist(path, probe, heights, video_codecs):
+    """
+    Write the multivariant playlist listing every rendition, highest bandwidth first.
+
+    video_codecs holds the codec string of the video of each rendition, in the order of heights.
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for height, video_codec in zip(heights, video_codecs):
+        width = round(probe['width'] * height / probe['height'] / 2) * 2
+        bandwidth = (rendition_bitrates(height)[1] + (HLS_AUDIO_BITRATE if probe['audio_codec'] else 0)) * 1000
+        codecs = f"{video_codec},mp4a.40.2" if probe['audio_codec'] else video_codec
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height},CODECS="{codecs}"')
+        lines.append(f"{height}p/index.m3u8")
+    with open(path, 'w') as playlist:
+        playlist.write("\n".join(lines) + "\n")
+
+
+def package_hls(video_path, step, output_name=None, media_info=None, profile=None):
+    """
+    Package a video as HLS: a ladder of renditions in 6 second segments and a master playlist.
+
+    The renditions are encoded in parallel on the encoder pool. Players start on the first segment
+    of the rendition that suits them, so the time to first frame does not depend on the video length.
+
+    Parameters:
+        video_path (str): The video to package, the upload or the output of a previous operation.
+        step (dict): The package_hls operation, with optional renditions (heights).
+        output_name (str): Base name for the HLS folder, defaults to the name of the video.
+        media_info (dict): Stored probe of the video; the file is probed when omitted.
+        profile (dict): Encoder settings from encoding_profile, the default profile when omitted.
+
+    Returns:
+        Path of the master playlist.
+    """
+    try:
+        probe = media_info or probe_video(video_path)
+        heights = hls_renditions(step, probe['height'])
+        profile = profile or encoding_profile()
+
+        name = os.path.splitext(output_name or os.path.basename(video_path))[0]
+        output_dir = os.path.join(os.getcwd(), 'processed_videos', 'hls', name)
+        # A retried job starts from scratch rather than mixing segments of two runs
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+
+        try:
+            jobs = [lambda height=height: encode_rendition(video_path, probe, height, os.path.join(output_dir, f"{height}p"), profile)
+                    for height in heights]
+            results = run_encode_jobs(jobs)
+            errors = [f"{height}p: {error}" for height, (_, error) in zip(heights, results) if error]
+            if errors:
+                raise Exception("; ".join(errors))
+
+            master_path = os.path.join(output_dir, HLS_MASTER_PLAYLIST)
+            write_master_playlist(master_path, probe, heights, [video_codec for video_codec, _ in results])
+        except Exception:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            raise
+        return master_path
+
+    except Exception as e:
+        raise Exception(f"Error packaging HLS: {e}")
+
+
+def split_hls_step(steps):
+    """Separate a trailing package_hls step from the operations whose result it packages."""
+    if len(steps) > 1 and steps[-1].get('name') == 'package_hls':
+        return steps[:-1], steps[-1]
+    return steps, None
+
+
+def hls_rendition_count(step):
+    return len(step.get('renditions') or []) or HLS_DEFAULT_RENDITIONS
+
+
+def validate_hls_steps(steps):
+    """
+    Check that package_hls is a job on its own, or the last step after operations that produce a
+    single video.
+    """
+    video_steps, hls_step = split_hls_step(steps)
+    for step in steps:
+        if step.get('name') == 'package_hls':
+            validate_hls_options(step)
+    if len(steps) > 1 and any(step.get('name') == 'package_hls' for step in video_steps):
+        raise Exception("package_hls must be the last step.")
+    if hls_step and len(video_steps) == 1:
+        step = video_steps[0]
+        if step.get('name') not in HLS_SOURCE_OPERATIONS or (step.get('name') == 'clip' and len(step.get('timestamps') or []) != 1):
+            raise Exception("package_hls can only follow an operation that produces a single video.")
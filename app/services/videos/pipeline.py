@@ -0,0 +1,277 @@
+import os
+from flask import current_app
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video, video_encode_args, encoding_profile
+from app.services.videos.create_clips import convert_time_to_seconds
+from app.services.videos.logo_bitmaps import prepare_logo, logo_height
+from app.services.videos.caption_bitmaps import caption_track, caption_y_offset
+
+# Stages of the filter graph, in the order they are applied
+STAGE_TRIM = 0
+STAGE_CROP = 1
+STAGE_OVERLAY = 2
+STAGE_CAPTIONS = 3
+
+OPERATION_STAGES = {
+    'clip': STAGE_TRIM,
+    'merge': STAGE_TRIM,
+    'change_aspect_ratio': STAGE_CROP,
+    'add_logo': STAGE_OVERLAY,
+    'burn_captions': STAGE_CAPTIONS,
+}
+
+ASPECT_RATIOS = {
+    "16:9": (16, 9),
+    "9:16": (9, 16),
+    "1:1": (1, 1),
+    "4:3": (4, 3),
+}
+
+# change_aspect_ratio either crops the frame to the ratio or fits it inside with black bars
+ASPECT_MODE_CROP = 'crop'
+ASPECT_MODE_LETTERBOX = 'letterbox'
+ASPECT_MODES = (ASPECT_MODE_CROP, ASPECT_MODE_LETTERBOX)
+
+LOGO_MARGIN = 30
+
+LOGO_POSITIONS = {
+    'top_left': (f"{LOGO_MARGIN}", f"{LOGO_MARGIN}"),
+    'top_right': (f"W-w-{LOGO_MARGIN}", f"{LOGO_MARGIN}"),
+    'bottom_left': (f"{LOGO_MARGIN}", f"H-h-{LOGO_MARGIN}"),
+    'bottom_right': (f"W-w-{LOGO_MARGIN}", f"H-h-{LOGO_MARGIN}"),
+    'center': ("(W-w)/2", "(H-h)/2"),
+}
+
+
+def validate_pipeline(steps):
+    """
+    Check that a list of operations can be compiled into a single filter graph.
+
+    Every stage may appear once and the steps must follow the graph order: clip or merge first,
+    then change_aspect_ratio, then add_logo, then burn_captions.
+    """
+    last_stage = -1
+    for step in steps:
+        name = step.get('name')
+        if name not in OPERATION_STAGES:
+            raise Exception(f"Operation '{name}' cannot be used in a pipeline.")
+        stage = OPERATION_STAGES[name]
+        if stage <= last_stage:
+            raise Exception("Pipeline steps must be ordered clip/merge, change_aspect_ratio, add_logo, burn_captions and used once each.")
+        last_stage = stage
+
+        timestamps = step.get('timestamps', [])
+        if name == 'clip' and len(timestamps) != 1:
+            raise Exception("A clip step in a pipeline takes exactly one timestamp.")
+        if name == 'merge' and not 2 <= len(timestamps) <= 10:
+            raise Exception("A merge step takes between two and ten timestamps.")
+        if name == 'change_aspect_ratio':
+            validate_aspect_ratio_options(step)
+        if name == 'add_logo':
+            validate_logo_options(step)
+        if name == 'burn_captions' and not step.get('captions_filename'):
+            raise Exception("A caption file is required for the burn_captions step.")
+
+
+def validate_logo_options(step):
+    """Check the logo file and the optional scale (fraction of the frame height) and opacity of an add_logo step."""
+    if not step.get('logo_filename'):
+        raise Exception("A logo file is required for the add_logo step.")
+    for option in ('scale', 'opacity'):
+        value = step.get(option)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 1:
+            raise Exception(f"The logo {option} must be a number greater than 0 and at most 1.")
+
+
+def parse_resolution(resolution):
+    """Width and height of a 'WIDTHxHEIGHT' resolution such as '1080x1920'."""
+    width, _, height = str(resolution).lower().partition('x')
+    return int(width), int(height)
+
+
+def validate_aspect_ratio_options(step):
+    """Check the aspect ratio, mode and optional output resolution of a change_aspect_ratio step."""
+    aspect_ratio = step.get('aspect_ratio')
+    if aspect_ratio not in ASPECT_RATIOS:
+        raise Exception(f"Invalid aspect ratio. Valid options are: {', '.join(ASPECT_RATIOS)}")
+    if step.get('mode', ASPECT_MODE_CROP) not in ASPECT_MODES:
+        raise Exception(f"Invalid aspect ratio mode. Valid options are: {', '.join(ASPECT_MODES)}")
+
+    resolution = step.get('resolution')
+    if resolution is None:
+        return
+    try:
+        width, height = parse_resolution(resolution)
+    except ValueError:
+        raise Exception("The resolution must be given as WIDTHxHEIGHT, e.g. 1080x1920.")
+    ratio_width, ratio_height = ASPECT_RATIOS[aspect_ratio]
+    if not (2 <= width <= 7680 and 2 <= height <= 7680) or width % 2 or height % 2:
+        raise Exception("The resolution must have even dimensions of at most 7680 pixels.")
+    if width * ratio_height != height * ratio_width:
+        raise Exception(f"The resolution {width}x{height} does not have the aspect ratio {aspect_ratio}.")
+
+
+def crop_dimensions(width, height, aspect_ratio):
+    """Largest centered crop of a width x height frame with the requested aspect ratio."""
+    ratio_width, ratio_height = ASPECT_RATIOS[aspect_ratio]
+    if width * ratio_height > height * ratio_width:
+        # Source is wider than the target; crop the sides
+        crop_width, crop_height = height * ratio_width // ratio_height, height
+    else:
+        # Source is taller than the target; crop top and bottom
+        crop_width, crop_height = width, width * ratio_height // ratio_width
+    # libx264 needs even dimensions
+    return crop_width - crop_width % 2, crop_height - crop_height % 2
+
+
+def letterbox_dimensions(width, height, aspect_ratio):
+    """Smallest frame with the requested aspect ratio that holds a width x height frame."""
+    ratio_width, ratio_height = ASPECT_RATIOS[aspect_ratio]
+    if width * ratio_height > height * ratio_width:
+        # Source is wider than the target; add bars above and below
+        box_width, box_height = width, -(-width * ratio_height // ratio_width)
+    else:
+        # Source is taller than the target; add bars on the sides
+        box_width, box_height = -(-height * ratio_width // ratio_height), height
+    return box_width + box_width % 2, box_height + box_height % 2
+
+
+def aspect_ratio_filter(width, height, step):
+    """
+    Filter that brings a width x height frame to the aspect ratio, mode and resolution of a step.
+
+    Cropping cuts the centered region with the target ratio, letterboxing scales the whole frame to
+    fit and pads it with black bars. Either is then scaled to the requested resolution, if any, in
+    the same filter chain.
+
+    Returns:
+        Tuple (filter, output_width, output_height).
+    """
+    aspect_ratio = step['aspect_ratio']
+    resolution = step.get('resolution')
+    if step.get('mode', ASPECT_MODE_CROP) == ASPECT_MODE_LETTERBOX:
+        box_width, box_height = parse_resolution(resolution) if resolution else letterbox_dimensions(width, height, aspect_ratio)
+        chain = [f"scale={box_width}:{box_height}:force_original_aspect_ratio=decrease:force_divisible_by=2",
+                 f"pad={box_width}:{box_height}:(ow-iw)/2:(oh-ih)/2:black"]
+        output_width, output_height = box_width, box_height
+    else:
+        crop_width, crop_height = crop_dimensions(width, height, aspect_ratio)
+        chain = [f"crop={crop_width}:{crop_height}"]
+        output_width, output_height = crop_width, crop_height
+        if resolution:
+            output_width, output_height = parse_resolution(resolution)
+            chain.append(f"scale={output_width}:{output_height}")
+    # Square pixels, so players show the frame with the requested ratio
+    chain.append("setsar=1")
+    return ",".join(chain), output_width, output_height
+
+
+def build_pipeline_command(video_path, steps, probe, logo_folder, output_path, include_audio=True, profile=None):
+    """
+    Compile the steps into ffmpeg arguments that decode and encode the source once.
+
+    With include_audio=False only the video is written, for segments whose audio is added when they
+    are joined. The output is encoded with the settings of profile, the default profile when omitted.
+    """
+    has_audio = include_audio and probe['audio_codec'] is not None
+    steps_by_stage = {OPERATION_STAGES[step['name']]: step for step in steps}
+
+    input_args = []
+    filters = []
+
+    # Trim: every range is its own input with an input seek, joined by the concat filter
+    trim_step = steps_by_stage.get(STAGE_TRIM)
+    if trim_step:
+        ranges = [(float(convert_time_to_seconds(t['start'])), float(convert_time_to_seconds(t['end'])))
+                  for t in trim_step['timestamps']]
+    else:
+        ranges = [(None, None)]
+
+    for start, end in ranges:
+        if start is not None:
+            input_args += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}"]
+        input_args += ["-i", video_path]
+    input_count = len(ranges)
+
+    if len(ranges) > 1:
+        streams = "".join(f"[{i}:v:0]" + (f"[{i}:a:0]" if has_audio else "") for i in range(len(ranges)))
+        audio_out = "[a0]" if has_audio else ""
+        filters.append(f"{streams}concat=n={len(ranges)}:v=1:a={1 if has_audio else 0}[v0]{audio_out}")
+        video_label, audio_label = "[v0]", "[a0]"
+    else:
+        filters.append("[0:v:0]null[v0]")
+        video_label, audio_label = "[v0]", "0:a:0?"
+
+    # Crop/resize
+    frame_width, frame_height = probe['width'], probe['height']
+    crop_step = steps_by_stage.get(STAGE_CROP)
+    if crop_step:
+        aspect_filter, frame_width, frame_height = aspect_ratio_filter(probe['width'], probe['height'], crop_step)
+        filters.append(f"{video_label}{aspect_filter}[v1]")
+        video_label = "[v1]"
+
+    # Overlay: the logo is resized and premultiplied once, ffmpeg only blends its bounding box
+    overlay_step = steps_by_stage.get(STAGE_OVERLAY)
+    if overlay_step:
+        # Validation lets "opacity": null through as "not given"
+        opacity = overlay_step.get('opacity')
+        logo_path = prepare_logo(logo_folder, overlay_step['logo_filename'],
+                                 logo_height(frame_height, overlay_step.get('scale')),
+                                 1.0 if opacity is None else float(opacity))
+        input_args += ["-i", logo_path]
+        x, y = LOGO_POSITIONS.get(str(overlay_step.get('position', 'bottom_right')).lower(), LOGO_POSITIONS['bottom_right'])
+        filters.append(f"{video_label}[{input_count}:v:0]overlay=x={x}:y={y}:alpha=premultiplied[v2]")
+        video_label = "[v2]"
+        input_count += 1
+
+    # Captions: every distinct caption is rasterized once and all of them arrive as one timed image
+    # stream, so a single overlay blends them whatever the number of cues
+    caption_step = steps_by_stage.get(STAGE_CAPTIONS)
+    if caption_step:
+        captions_path = os.path.join(current_app.config['CAPTIONS_FOLDER'], caption_step['captions_filename'])
+        list_path = caption_track(captions_path, frame_width, frame_height, ranges)
+        # A segment may fall entirely between cues
+        if list_path:
+            input_args += ["-f", "concat", "-safe", "0", "-i", list_path]
+            # Once the stream ends on its empty canvas, frames pass through without blending
+            filters.append(f"{video_label}[{input_count}:v:0]overlay=x=(W-w)/2:y=H-h-{caption_y_offset(frame_height)}"
+                           f":eof_action=pass[v3]")
+            video_label = "[v3]"
+            input_count += 1
+
+    output_args = ["-map", video_label]
+    if has_audio:
+        output_args += ["-map", audio_label]
+    encode_args = video_encode_args(profile or encoding_profile())
+    return [*input_args, "-filter_complex", ";".join(filters), *output_args, *encode_args, output_path]
+
+
+def run_pipeline(video_path, steps, logo_folder, output_name=None, media_info=None, profile=None):
+    """
+    Apply an ordered list of operations to a video in a single decode/encode pass.
+
+    Parameters:
+        video_path (str): The path to the original video file.
+        steps (list): Operation dictionaries, validated with validate_pipeline.
+        logo_folder (str): Folder holding the logo referenced by an add_logo step.
+        output_name (str): Base name for the processed file, defaults to the name of the original video.
+        media_info (dict): Stored probe of the video; the file is probed when omitted.
+        profile (dict): Encoder settings from encoding_profile, the default profile when omitted.
+
+    Returns:
+        Path of the processed video.
+    """
+    try:
+        validate_pipeline(steps)
+        probe = media_info or probe_video(video_path)
+
+        processed_folder = os.path.join(os.getcwd(), 'processed_videos')
+        os.makedirs(processed_folder, exist_ok=True)
+        output_path = os.path.join(processed_folder, f"processed_pipeline_{output_name or os.path.basename(video_path)}")
+
+        run_ffmpeg(build_pipeline_command(video_path, steps, probe, logo_folder, output_path, profile=profile))
+        return output_path
+
+    except Exception as e:
+        raise Exception(f"Error running operation pipeline: {e}")
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from app.services.videos.ffmpeg_utils import run_ffmpeg, probe_video, get_keyframes
+from app.services.captioning.wisher import format_timestamp
+
+# The poster is the first keyframe after this fraction of the video, past intros and black frames
+POSTER_POSITION = 0.1
+# Sprite sheet of SPRITE_COLUMNS columns, one tile per keyframe at least SPRITE_MIN_INTERVAL seconds
+# apart; long videos get a longer interval so the sheet never holds more than SPRITE_MAX_TILES tiles
+SPRITE_THUMB_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_TILES = 100
+SPRITE_MIN_INTERVAL = 2.0
+PROXY_HEIGHT = 360
+PROXY_AUDIO_BITRATE = 64
+# Tolerance when comparing the frame times ffmpeg sees with the probed keyframe times
+TIME_EPSILON = 0.001
+
+PREVIEW_FILES = {
+    'poster': 'poster.jpg',
+    'sprite': 'sprite.jpg',
+    'sprite_vtt': 'sprite.vtt',
+    'proxy': 'proxy.mp4',
+}
+
+
+def previews_folder(content_hash):
+    return os.path.join(os.getcwd(), 'processed_videos', 'previews', content_hash)
+
+
+def find_previews(content_hash):
+    """Paths of the previews already generated for this content, or None if any of them is missing."""
+    folder = previews_folder(content_hash)
+    previews = {kind: os.path.join(folder, name) for kind, name in PREVIEW_FILES.items()}
+    if all(os.path.isfile(path) for path in previews.values()):
+        return previews
+    return None
+
+
+def poster_time(keyframes, duration):
+    return next((time for time in keyframes if time >= duration * POSTER_POSITION), keyframes[-1])
+
+
+def sprite_times(keyframes, interval):
+    """Keyframes the sprite filter selects: the first one, then each one at least interval after the last pick."""
+    times = []
+    for time in keyframes:
+        if not times or time - times[-1] >= interval - TIME_EPSILON:
+            times.append(time)
+    return times
+
+
+def write_sprite_index(path, times, duration, thumb_width, thumb_height):
+    """Write the WebVTT index mapping every stretch of the video to its tile of the sprite sheet."""
+    cues = []
+    for idx, start in enumerate(times):
+        end = times[idx + 1] if idx + 1 < len(times) else max(duration, start)
+        x, y = idx % SPRITE_COLUMNS * thumb_width, idx // SPRITE_COLUMNS * thumb_height
+        cues.append(f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n"
+                    f"{PREVIEW_FILES['sprite']}#xywh={x},{y},{thumb_width},{thumb_height}\n")
+    with open(path, 'w', encoding='utf-8') as vtt_file:
+        vtt_file.write("\n".join(["WEBVTT\n", *cues]))
+
+
+def generate_previews(video_path, content_hash, media_info=None):
+    """
+    Make the scrubbing previews of an upload in one pass that decodes only its keyframes.
+
+    A poster image, a sprite sheet with a WebVTT index of its tiles and a small proxy MP4 are written
+    to the previews folder of the content. The proxy shows the keyframes at their own times, with the
+    audio, which is enough to find cut points without downloading the source. Identical uploads
+    share the previews, so content that already has them is not decoded again.
+
+    Parameters:
+        video_path (str): The uploaded video.
+        content_hash (str): SHA-256 of the upload, naming its previews folder.
+        media_info (dict): Stored probe of the video with its keyframes; the file is probed when omitted.
+
+    Returns:
+        dict with the paths of the poster, sprite, sprite_vtt and proxy.
+    """
+    try:
+        existing = find_previews(content_hash)
+        if existing:
+            return existing
+
+        probe = media_info or {**probe_video(video_path), 'keyframes': get_keyframes(video_path)}
+        keyframes = probe['keyframes'] or [0.0]
+        duration = probe['duration']
+
+        interval = max(SPRITE_MIN_INTERVAL, duration / SPRITE_MAX_TILES)
+        times = sprite_times(keyframes, interval)[:SPRITE_MAX_TILES]
+        columns = min(SPRITE_COLUMNS, len(times))
+        rows = -(-len(times) // SPRITE_COLUMNS)
+        thumb_height = max(2, round(SPRITE_THUMB_WIDTH * probe['height'] / probe['width'] / 2) * 2)
+        proxy_height = min(PROXY_HEIGHT, probe['height'] - probe['height'] % 2)
+
+        filters = ";".join([
+            "[0:v:0]split=3[poster_in][sprite_in][proxy_in]",
+            f"[poster_in]select='gte(t,{poster_time(keyframes, duration) - TIME_EPSILON:.6f})'[poster]",
+            f"[sprite_in]select='isnan(prev_selected_t)+gte(t-prev_selected_t,{interval - TIME_EPSILON:.6f})',"
+            f"scale={SPRITE_THUMB_WIDTH}:{thumb_height},tile={columns}x{rows}[sprite]",
+            f"[proxy_in]scale=-2:{proxy_height}[proxy]",
+        ])
+
+        folder = previews_folder(content_hash)
+        os.makedirs(folder, exist_ok=True)
+        # Written next to the final files and moved in place, so a concurrent job for the same
+        # content never sees half-written previews
+        work_dir = tempfile.mkdtemp(prefix='previews_', dir=folder)
+        try:
+            work_paths = {kind: os.path.join(work_dir, name) for kind, name in PREVIEW_FILES.items()}
+            run_ffmpeg([
+                # Frames between keyframes are not decoded at all
+                "-skip_frame:v", "nokey",
+                "-i", video_path,
+                "-filter_complex", filters,
+                "-map", "[poster]", "-frames:v", "1", "-update", "1", work_paths['poster'],
+                "-map", "[sprite]", "-frames:v", "1", "-update", "1", work_paths['sprite'],
+                "-map", "[proxy]", "-map", "0:a:0?",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "30", "-fps_mode", "vfr",
+                "-c:a", "aac", "-b:a", f"{PROXY_AUDIO_BITRATE}k", "-ac", "1",
+                "-movflags", "+faststart", work_paths['proxy'],
+            ])
+            write_sprite_index(work_paths['sprite_vtt'], times, duration, SPRITE_THUMB_WIDTH, thumb_height)
+
+            previews = {}
+            for kind, name in PREVIEW_FILES.items():
+                previews[kind] = os.path.join(folder, name)
+                os.replace(work_paths[kind], previews[kind])
+            return previews
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    except Exception as e:
+        raise Exception(f"Error generating previews: {e}")
@@ -0,0 +1,71 @@
+import os
+from app.services.videos.ffmpeg_utils import run_ffmpeg, audio_codec_args, PASS_MUX
+from app.services.videos.pipeline import build_pipeline_command
+from app.services.videos.trim import write_concat_list
+
+# Operations that encode the whole source and can be split into independently encoded segments
+SEGMENTABLE_OPERATIONS = ('change_aspect_ratio', 'add_logo', 'burn_captions')
+
+
+def plan_segments(duration, keyframes, segment_duration):
+    """
+    Split a video into ranges of about segment_duration seconds that start on keyframes.
+
+    Every range can be encoded from an input seek without decoding anything before it, and the
+    encoded ranges join back into the full video without gaps or overlaps.
+
+    Returns:
+        List of (start, end) tuples covering [0, duration].
+    """
+    boundaries = [0.0]
+    target = segment_duration
+    for keyframe in keyframes:
+        # Leave the last segment at least a quarter of the usual length
+        if keyframe >= target and duration - keyframe >= segment_duration / 4:
+            boundaries.append(keyframe)
+            target = keyframe + segment_duration
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def encode_segment(video_path, step, probe, logo_folder, start, end, output_path, profile):
+    """
+    Apply a whole-video operation to one segment of the source, without audio.
+
+    The segment goes through the same filter graph and encoding profile as the single-pass
+    pipeline, so segments and unsplit encodes look the same.
+    """
+    steps = [{'name': 'clip', 'timestamps': [{'start': start, 'end': end}]}, step]
+    run_ffmpeg(build_pipeline_command(video_path, steps, probe, logo_folder, output_path, include_audio=False, profile=profile))
+    return output_path
+
+
+def stitch_segments(video_path, segment_paths, probe, work_dir, output_path, profile):
+    """
+    Join encoded segments with the concat demuxer and add the audio of the source.
+
+    The video is copied, not re-encoded; only the audio track is encoded, in one pass.
+    """
+    list_path = os.path.join(work_dir, 'segments.txt')
+    write_concat_list(segment_paths, list_path)
+
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if probe['audio_codec'] is not None:
+        args += ["-i", video_path, "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", *audio_codec_args(profile)]
+    else:
+        args += ["-map", "0:v:0", "-c:v", "copy"]
+    run_ffmpeg([*args, output_path], PASS_MUX)
+    return output_path
+
+
+def segmented_output_path(step, output_name):
+    """Path of the joined result, named like the output of the unsplit operation."""
+    processed_folder = os.path.join(os.getcwd(), 'processed_videos')
+    os.makedirs(processed_folder, exist_ok=True)
+    if step['name'] == 'add_logo':
+        filename = f"processed_logo_{output_name}"
+    elif step['name'] == 'burn_captions':
+        filename = f"processed_captions_{output_name}"
+    else:
+        filename = f"processed_aspect_ratio_{step['aspect_ratio']}_{output_name}"
+    return os.path.join(processed_folder, filename)
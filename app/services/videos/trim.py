@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+from app.services.videos.ffmpeg_utils import run_ffmpeg, count_frames, codec_parameters, video_encode_args, video_codec_args, audio_codec_args, PASS_COPY, PASS_MUX
+
+TRIM_MODE_COPY = 'copy'
+TRIM_MODE_SMART_CUT = 'smart_cut'
+TRIM_MODE_REENCODE = 're_encode'
+
+# Codecs we can re-encode the GOP edges with so that they concatenate cleanly with copied packets
+SMART_CUT_VIDEO_CODECS = {'h264'}
+
+
+def choose_trim_mode(start, end, keyframes, probe, tolerance, smart_cut_allowed=True):
+    """
+    Decide how a [start, end) range can be cut out of the source.
+
+    A stream copy only needs to start on a keyframe, as copy_segment limits the number of frames it
+    writes. Smart cuts are skipped when smart_cut_allowed is False, see smart_cut_matches_source.
+
+    Returns a tuple (mode, start, end) where start may have been snapped to a keyframe and end to
+    the end of the video.
+    """
+    duration = probe['duration']
+    snapped_start = snap_to_keyframe(start, keyframes, tolerance)
+    snapped_end = duration if end >= duration - tolerance else end
+
+    if snapped_start is not None and snapped_end > snapped_start:
+        return TRIM_MODE_COPY, snapped_start, snapped_end
+
+    inner = [k for k in keyframes if start <= k <= end]
+    if smart_cut_allowed and probe['video_codec'] in SMART_CUT_VIDEO_CODECS and len(inner) >= 2:
+        return TRIM_MODE_SMART_CUT, start, end
+
+    return TRIM_MODE_REENCODE, start, end
+
+
+def snap_to_keyframe(time, keyframes, tolerance):
+    """Return the keyframe closest to time if it is within tolerance, otherwise None."""
+    if not keyframes:
+        return None
+    closest = min(keyframes, key=lambda k: abs(k - time))
+    return closest if abs(closest - time) <= tolerance else None
+
+
+def smart_cut_matches_source(video_path, probe, profile, work_folder):
+    """
+    Check that GOP edges encoded with profile can be joined with packets copied from the source.
+
+    An MP4 track holds a single avcC, so the re-encoded edges must share the profile, level, SPS and
+    PPS of the source, which only holds for sources encoded by libx264 with the same settings. One
+    frame is encoded the way smart_cut_video encodes the edges to compare them.
+    """
+    if probe['video_codec'] not in SMART_CUT_VIDEO_CODECS:
+        return False
+    work_dir = tempfile.mkdtemp(prefix='smart_cut_check_', dir=work_folder)
+    try:
+        sample_path = os.path.join(work_dir, 'sample.mp4')
+        # The sample is not part of the output, so it does not count towards progress
+        run_ffmpeg(["-i", video_path, "-map", "0:v:0", "-frames:v", "1", "-an",
+                    *video_codec_args(profile, pix_fmt=probe['pix_fmt']), sample_path], PASS_MUX)
+        return codec_parameters(sample_path) == codec_parameters(video_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def copy_segment(video_path, start, end, output_path, include_audio=True):
+    """
+    Remux [start, end) without re-encoding. start must be a keyframe.
+
+    Stream copy cuts on decode timestamps, which would keep reordered frames presented after end,
+    so the number of video frames is limited explicitly.
+    """
+    frames = count_frames(video_path, start, end)
+    audio_args = ["-map", "0:a:0?"] if include_audio else ["-an"]
+    run_ffmpeg([
+        "-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}", "-frames:v", frames,
+        "-map", "0:v:0", *audio_args, "-c", "copy",
+        "-avoid_negative_ts", "make_zero", output_path,
+    ], PASS_COPY)
+
+
+def reencode_segment(video_path, start, end, output_path, profile, probe=None):
+    """
+    Re-encode [start, end) frame accurately with the settings of an encoding profile.
+
+    When probe is given only the video is encoded, keeping the pixel format and time base of the
+    source so the segment can be concatenated with packets copied from the same source.
+    """
+    args = ["-ss", f"{start:.6f}", "-i", video_path, "-t", f"{end - start:.6f}", "-map", "0:v:0"]
+    if probe:
+        args += ["-an", *video_codec_args(profile, pix_fmt=probe['pix_fmt'])]
+        if probe.get('time_base'):
+            args += ["-video_track_timescale", probe['time_base'].partition('/')[2]]
+    else:
+        args += ["-map", "0:a:0?", *video_encode_args(profile)]
+    run_ffmpeg([*args, output_path])
+
+
+def write_concat_list(segment_paths, list_path):
+    with open(list_path, 'w') as list_file:
+        for path in segment_paths:
+            escaped = path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+
+def smart_cut_video(video_path, start, end, keyframes, probe, output_path, profile):
+    """
+    Re-encode only the partial GOPs at each edge of [start, end) and copy everything in between.
+
+    Only the video stream is written to output_path.
+    """
+    inner = [k for k in keyframes if start <= k <= end]
+    first_keyframe, last_keyframe = inner[0], inner[-1]
+
+    work_dir = tempfile.mkdtemp(prefix='smart_cut_', dir=os.path.dirname(output_path))
+    try:
+        segments = []
+        if first_keyframe > start:
+            head_path = os.path.join(work_dir, 'head.mp4')
+            reencode_segment(video_path, start, first_keyframe, head_path, profile, probe)
+            segments.append(head_path)
+
+        middle_path = os.path.join(work_dir, 'middle.mp4')
+        copy_segment(video_path, first_keyframe, last_keyframe, middle_path, include_audio=False)
+        segments.append(middle_path)
+
+        if end > last_keyframe:
+            tail_path = os.path.join(work_dir, 'tail.mp4')
+            reencode_segment(video_path, last_keyframe, end, tail_path, profile, probe)
+            segments.append(tail_path)
+
+        list_path = os.path.join(work_dir, 'segments.txt')
+        write_concat_list(segments, list_path)
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-map", "0:v:0", "-c", "copy", output_path], PASS_MUX)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def smart_cut(video_path, start, end, keyframes, probe, output_path, profile):
+    """
+    Smart cut [start, end) and add the audio of that range.
+
+    The audio track is encoded once over the whole range; that is cheap and avoids gaps at the
+    segment joins.
+    """
+    video_only_path = f"{output_path}.video.mp4"
+    try:
+        smart_cut_video(video_path, start, end, keyframes, probe, video_only_path, profile)
+        run_ffmpeg([
+            "-i", video_only_path,
+            "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", video_path,
+            "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", *audio_codec_args(profile), output_path,
+        ], PASS_MUX)
+    finally:
+        if os.path.exists(video_only_path):
+            os.remove(video_only_path)
+
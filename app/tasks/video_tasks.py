@@ -5,18 +5,316 @@ from app.models.video import Video, VideoOperation
 import os
 import logging
 from flask import current_app
-from celery import shared_task
-from celery.contrib.abortable import AbortableTask
+from celery import shared_task, chord
+from celery.contrib.abortable import AbortableTask, AbortableAsyncResult
 from datetime import datetime
 import json  # For JSON serialization
+import shutil
+import tempfile
 from app.services.videos.create_clips import create_clips
 from app.services.videos.merge_clips import merge_clips
 from app.services.videos.change_aspect_ratio import change_aspect_ratio
 from app.services.videos.add_logo import add_logo_to_video
+from app.services.videos.pipeline import run_pipeline
+from app.services.videos.burn_captions import burn_captions
+from app.services.videos.package_hls import package_hls, split_hls_step, hls_rendition_count
+from app.services.videos.previews import generate_previews
+from app.services.captioning.wisher import generate_captions_whisper, CAPTION_FORMATS
+from app.services.videos.segmented_encode import plan_segments, encode_segment, stitch_segments, segmented_output_path, SEGMENTABLE_OPERATIONS
+from app.services.videos.ffmpeg_utils import probe_video, encoding_profile, requested_profile_name
+from app.services.videos.pipeline import OPERATION_STAGES, STAGE_TRIM, ASPECT_MODE_CROP, validate_aspect_ratio_options
+from app.services.videos.create_clips import convert_time_to_seconds
+from app.services.result_cache import operations_key, store_result, upload_in_use
+from app.services.storage import publish_outputs, shared_output_path
+from app.services.media_probe import get_media_probe
+from app.services.response_cache import invalidate_video
+from app.services.downloads import output_paths
+from app.services.metrics import observe_operations, observe_encode, observe_bytes, job_operation_name
+from app.services.progress import publish_event, publish_segment_done, start_tracking, stop_tracking, ProcessingAborted, EVENT_STATUS, EVENT_COMPLETED, EVENT_FAILED, EVENT_ABORTED
+from app.services.job_routing import QUEUE_FAST, QUEUE_STANDARD
+
+# Attempts of a job after the first one failed
+PROCESS_MAX_RETRIES = 3
+
+def expected_output_seconds(upload_path, steps, media_info=None, hls_step=None):
+    """
+    Length of video the job will encode: the requested ranges, or the whole source, once more for
+    every HLS rendition.
+    """
+    seconds = None
+    for step in steps:
+        if OPERATION_STAGES.get(step.get('name')) == STAGE_TRIM and step.get('timestamps'):
+            try:
+                seconds = sum(max(0.0, float(convert_time_to_seconds(t['end'])) - float(convert_time_to_seconds(t['start'])))
+                              for t in step['timestamps'])
+            except (KeyError, TypeError, ValueError):
+                return None
+            break
+    if seconds is None:
+        seconds = (media_info or probe_video(upload_path))['duration']
+
+    if hls_step:
+        return seconds * (1 + hls_rendition_count(hls_step))
+    if steps and steps[0].get('name') == 'package_hls':
+        return seconds * hls_rendition_count(steps[0])
+    return seconds
+
+
+def job_videos(video_id):
+    """The video a job was queued for and the videos of identical requests attached to it."""
+    return Video.query.filter(db.or_(Video.id == video_id, Video.job_video_id == video_id)).all()
+
+def set_job_status(video_id, status, event, processed_path=None, **data):
+    """Set the status of every video of a job and publish the event to the subscribers of each of them."""
+    videos = job_videos(video_id)
+    for video in videos:
+        video.status = status
+        if processed_path is not None:
+            video.processed_path = processed_path
+    db.session.commit()
+    if processed_path is not None:
+        data['processed_path'] = processed_path
+    for video in videos:
+        invalidate_video(video.id)
+        publish_event(video.id, event, status=status, **data)
+    return videos
+
+def mark_completed(video, video_operations, operations, upload_path, cacheable=True):
+    """Record a finished job, remember its result and release the upload."""
+    # Update the operation log entries with success details
+    end_time = datetime.utcnow()
+    for video_operation in video_operations:
+        video_operation.status = 'completed'
+        video_operation.end_time = end_time
+        video_operation.duration = (video_operation.end_time - video_operation.start_time).total_seconds()
+    db.session.commit()
+    observe_operations(video_operations, 'completed')
+    observe_bytes(job_operation_name(video_operations), upload_path, output_paths(video.processed_path))
+
+    # Update the status of the video and of identical requests waiting for it to 'completed'
+    set_job_status(video.id, Video.STATUS_COMPLETED, EVENT_COMPLETED, processed_path=video.processed_path, percent=100)
+
+    # Remember the result so identical requests can reuse it
+    if video.content_hash and cacheable:
+        store_result(video.content_hash, operations, video.processed_path)
+
+    # Clean up the upload path unless another job still needs the same content
+    if os.path.exists(upload_path) and not upload_in_use(video.content_hash, video.id):
+        os.remove(upload_path)
+
+    logging.info(f'Completed processing for video_id: {video.id}')
+
+def mark_failed(video_id, video_operations, error, retrying=False, upload_path=None):
+    """
+    Record a failed attempt of a job.
+
+    A job that will be retried goes back to queued, so it keeps its claim on the result and its
+    upload. Only the final failure marks the videos failed and releases the upload.
+    """
+    logging.error(f'Error processing video_id: {video_id} - {error}')
+    # The failed attempt may have left a broken transaction behind
+    db.session.rollback()
+
+    # Update the operation log entries with failure details
+    for video_operation in video_operations:
+        video_operation.status = 'failed'
+        video_operation.error_message = str(error)
+        video_operation.end_time = datetime.utcnow()
+        video_operation.duration = (video_operation.end_time - video_operation.start_time).total_seconds() if video_operation.start_time else None
+    if video_operations:
+        db.session.commit()
+    observe_operations(video_operations, 'failed')
+
+    if retrying:
+        set_job_status(video_id, Video.STATUS_QUEUED, EVENT_STATUS, error=str(error))
+        return
+
+    # Mark the video and identical requests waiting for it as failed
+    set_job_status(video_id, Video.STATUS_FAILED, EVENT_FAILED, error=str(error))
+    video = Video.query.get(video_id)
+    if video and upload_path and os.path.exists(upload_path) and not upload_in_use(video.content_hash, video.id):
+        os.remove(upload_path)
+
+def mark_aborted(video_id, video_operations, upload_path, outputs=(), work_name=None):
+    """
+    Record an aborted job and remove the partial files it wrote. Aborted jobs are not retried.
+
+    Only outputs named with the job's work_name are removed; the shared names may hold the result
+    of another job for the same request.
+    """
+    end_time = datetime.utcnow()
+    for video_operation in video_operations:
+        video_operation.status = Video.STATUS_ABORTED
+        video_operation.end_time = end_time
+        video_operation.duration = (end_time - video_operation.start_time).total_seconds() if video_operation.start_time else None
+
+    set_job_status(video_id, Video.STATUS_ABORTED, EVENT_ABORTED)
+    observe_operations(video_operations, 'aborted')
+    video = Video.query.get(video_id)
+
+    for path in outputs:
+        if work_name and work_name in path and os.path.isfile(path):
+            os.remove(path)
+    if video and os.path.exists(upload_path) and not upload_in_use(video.content_hash, video.id):
+        os.remove(upload_path)
+    logging.info(f'Aborted processing for video_id: {video_id}')
+
+def should_split(operation_name, media_info):
+    """Whether a job takes the split/encode/stitch path: a whole-video encode of a long source."""
+    return (operation_name in SEGMENTABLE_OPERATIONS and media_info is not None
+            and media_info['duration'] >= current_app.config['SEGMENT_ENCODE_MIN_DURATION'])
+
+def dispatch_segments(task_id, video, step, upload_path, media_info, output_name, work_name=None, final_name=None):
+    """
+    Encode the segments of a job as a chord of subtasks; its callback joins them and completes the job.
+
+    The segments and the result are written to the processed folder, which every worker shares. The
+    result is written under work_name and renamed with final_name once it is complete.
+
+    Segments are short, but each is a full re-encode, and the stitch remuxes the whole video and
+    encodes its audio, so both run on the standard pool. Routed by cost, a long job would fill the
+    fast pool with them and make short trims wait. Only the error callback, which just records the
+    failure, runs on the fast queue.
+    """
+    segments = plan_segments(media_info['duration'], media_info['keyframes'], current_app.config['SEGMENT_DURATION'])
+    processed_folder = os.path.join(os.getcwd(), 'processed_videos')
+    os.makedirs(processed_folder, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"segments_{video.id}_", dir=processed_folder)
+    output_path = segmented_output_path(step, output_name or os.path.basename(upload_path))
+
+    header = [
+        encode_segment_task.s(video.id, task_id, upload_path, step, media_info, start, end,
+                              os.path.join(work_dir, f"segment_{idx + 1:04d}.mp4"), len(segments))
+        .set(queue=QUEUE_STANDARD)
+        for idx, (start, end) in enumerate(segments)
+    ]
+    callback = stitch_segments_task.s(video.id, task_id, upload_path, step, media_info, work_dir, output_path,
+                                      work_name, final_name).set(queue=QUEUE_STANDARD)
+    callback = callback.on_error(segments_failed_task.s(video.id, task_id, upload_path, work_dir, output_path,
+                                                        work_name).set(queue=QUEUE_FAST))
+    try:
+        chord(header)(callback)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    logging.info(f'Split video_id {video.id} into {len(segments)} segments')
+
+def job_aborted(task_id):
+    """
+    Whether the job started by the given process_video_task was aborted.
+
+    The abort state lives in the result backend; like ProgressTracker.check_aborted, a job whose
+    state cannot be read is treated as running rather than failed over a short outage.
+    """
+    try:
+        return AbortableAsyncResult(task_id).is_aborted()
+    except Exception as e:
+        logging.warning(f"Could not check abort state of task {task_id}: {e}")
+        return False
+
+def job_operations(video_id, task_id):
+    return VideoOperation.query.filter_by(video_id=video_id, task_id=task_id).all()
+
+@shared_task(bind=True)
+def encode_segment_task(self, video_id, task_id, upload_path, step, media_info, start, end, output_path, segment_count):
+    """Encode one segment of a split job. Checks the job's abort state like the job itself would."""
+    tracker = start_tracking(video_id, end - start, abort_check=lambda: job_aborted(task_id), report_progress=False)
+    try:
+        encode_segment(upload_path, step, media_info, current_app.config['LOGO_FOLDER'], start, end, output_path,
+                       encoding_profile(step.get('encoding_profile')))
+        observe_encode(step['name'], tracker)
+        publish_segment_done(video_id, task_id, segment_count)
+        return output_path
+    except Exception as e:
+        if isinstance(e, ProcessingAborted) or tracker.aborted:
+            raise ProcessingAborted(str(e))
+        raise self.retry(exc=e, countdown=30, max_retries=2)
+    finally:
+        stop_tracking()
+
+@shared_task(bind=True)
+def stitch_segments_task(self, segment_paths, video_id, task_id, upload_path, step, media_info, work_dir, output_path,
+                         work_name=None, final_name=None):
+    """Join the encoded segments of a split job and complete it."""
+    video_operations = job_operations(video_id, task_id)
+    try:
+        if job_aborted(task_id):
+            raise ProcessingAborted(f"Processing of video {video_id} was aborted")
+        stitch_segments(upload_path, segment_paths, media_info, work_dir, output_path,
+                        encoding_profile(step.get('encoding_profile')))
+
+        result_path = publish_outputs(output_path, work_name, final_name) if work_name else output_path
+        video = Video.query.get(video_id)
+        video.processed_path = result_path
+        for video_operation in video_operations:
+            video_operation.result_path = result_path
+            video_operation.operation_metadata = {**step, "segments": len(segment_paths)}
+        mark_completed(video, video_operations, step, upload_path)
+
+    except ProcessingAborted:
+        db.session.rollback()
+        mark_aborted(video_id, video_operations, upload_path, [output_path], work_name)
+    except Exception as e:
+        mark_failed(video_id, video_operations, e, upload_path=upload_path)
+        # Only the file written under the job's own name; once renamed it may be served already
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@shared_task
+def segments_failed_task(request, exc, traceback, video_id, task_id, upload_path, work_dir, output_path, work_name=None):
+    """Error callback of a split job: a segment failed for good or the job was aborted."""
+    video_operations = job_operations(video_id, task_id)
+    if job_aborted(task_id):
+        mark_aborted(video_id, video_operations, upload_path, [output_path], work_name)
+    else:
+        mark_failed(video_id, video_operations, f"Segment encoding failed: {exc}", upload_path=upload_path)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+def link_previews(video, previews):
+    video.poster_path = previews['poster']
+    video.sprite_path = previews['sprite']
+    video.sprite_vtt_path = previews['sprite_vtt']
+    video.proxy_path = previews['proxy']
+    video.preview_status = Video.STATUS_COMPLETED
+
+@shared_task
+def generate_previews_task(video_id, filename):
+    """
+    Make the poster, sprite sheet and proxy of an upload and link them on its video.
+
+    Previews are a convenience for choosing timestamps, so a failure is recorded but never retried
+    and never affects the processing job.
+    """
+    upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    video = Video.query.get(video_id)
+    if not video:
+        logging.error(f'Video with id {video_id} not found')
+        return
+
+    try:
+        media_probe = get_media_probe(video.content_hash)
+        previews = generate_previews(upload_path, video.content_hash, media_probe.as_media_info() if media_probe else None)
+        link_previews(video, previews)
+        logging.info(f'Generated previews for video_id: {video_id}')
+    except Exception as e:
+        logging.error(f'Error generating previews for video_id: {video_id} - {e}')
+        db.session.rollback()
+        video.preview_status = Video.STATUS_FAILED
+    db.session.commit()
+    invalidate_video(video_id)
+
+    # The processing job may have finished first and left the upload to this task
+    if os.path.exists(upload_path) and not upload_in_use(video.content_hash):
+        os.remove(upload_path)
 
 @shared_task(bind=True, base=AbortableTask)
 def process_video_task(self, video_id, filename, operations):
-    video_operation = None
+    video_operations = []
+    tracker = None
+    upload_path = None
+    work_name = None
     try:
         # Define the upload path
         upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
@@ -27,36 +325,112 @@ def process_video_task(self, video_id, filename, operations):
             logging.error(f'Video with id {video_id} not found')
             return
 
-        # Update video status to 'processing'
-        video.status = Video.STATUS_PROCESSING
-        db.session.commit()
+        # Jobs aborted while they were queued are not started at all
+        if video.status == Video.STATUS_ABORTED or job_aborted(self.request.id):
+            mark_aborted(video_id, video_operations, upload_path)
+            return
+
+        # Update the status of the video and of identical requests waiting for it to 'processing'
+        set_job_status(video_id, Video.STATUS_PROCESSING, EVENT_STATUS)
 
-        # Create a new operation log entry in the VideoOperation table
-        video_operation = VideoOperation(
-            video_id=video.id,
-            task_id=self.request.id,  # Store the Celery task ID
-            operation_name=operations.get("name"),
-            operation_metadata=operations,
-            status='processing',
-            start_time=datetime.utcnow()
-        )
-        db.session.add(video_operation)
+        # A list of operations is applied as one pipeline in a single decode/encode pass
+        steps = operations if isinstance(operations, list) else [operations]
+        if len(steps) == 1:
+            operations = steps[0]
+
+        # Create a new operation log entry in the VideoOperation table for every step
+        for step in steps:
+            video_operations.append(VideoOperation(
+                video_id=video.id,
+                task_id=self.request.id,  # Store the Celery task ID
+                operation_name=step.get("name"),
+                operation_metadata=step,
+                status='processing',
+                start_time=datetime.utcnow()
+            ))
+        db.session.add_all(video_operations)
         db.session.commit()
+        invalidate_video(video_id)
+        video_operation = video_operations[0]
+
+        # Every encode of the job uses the encoder settings of the requested profile
+        profile = encoding_profile(requested_profile_name(steps))
+
+        # A package_hls step after other operations packages their result once they are done; the
+        # full request still names and caches the result
+        requested_operations = operations
+        steps, hls_step = split_hls_step(steps)
+        if hls_step:
+            operations = steps[0] if len(steps) == 1 else steps
 
         # Determine the operation type
-        operation_name = operations.get("name")
-        timestamps = operations.get("timestamps", [])
+        operation_name = "pipeline" if len(steps) > 1 else operations.get("name")
+        timestamps = steps[0].get("timestamps", [])
+
+        # Name outputs after the content and the operation spec so that different requests on the
+        # same content never overwrite each other's results. They are written under names of this job
+        # and renamed once complete, so a job never writes over a result that is being served
+        output_name = final_name = None
+        if video.content_hash:
+            final_name = f"{video.content_hash[:16]}_{operations_key(requested_operations)[:16]}"
+            work_name = f"{final_name}_{self.request.id[:8]}"
+            output_name = f"{work_name}{os.path.splitext(upload_path)[1]}"
+        cacheable = True
+
+        # Probe and keyframe index stored at upload time, so the source is not probed again
+        media_probe = get_media_probe(video.content_hash)
+        media_info = media_probe.as_media_info() if media_probe else None
+
+        # Stream frame-level progress of the encoders to subscribers of this video. The encoders
+        # also poll the abort state and stop as soon as the job is aborted
+        tracker = start_tracking(video_id, expected_output_seconds(upload_path, steps, media_info, hls_step),
+                                 abort_check=self.is_aborted)
         
+        # Long whole-video encodes are split at keyframes and encoded on many workers at once; the
+        # last subtask completes the job
+        if hls_step is None and should_split(operation_name, media_info):
+            dispatch_segments(self.request.id, video, operations, upload_path, media_info, output_name, work_name, final_name)
+            return
+
         # Perform the operation based on the type
-        if operation_name == "clip":
+        if operation_name == "pipeline":
+            result = run_pipeline(upload_path, steps, current_app.config['LOGO_FOLDER'], output_name, media_info, profile)
+            video.processed_path = result
+
+            # Steps share the single pass, so they share its result and timing
+            for step_index, step_operation in enumerate(video_operations[:len(steps)]):
+                step_operation.result_path = result
+                step_operation.operation_metadata = {
+                    **steps[step_index],
+                    "pipeline_step": step_index + 1,
+                    "pipeline_steps": len(steps),
+                }
+
+        elif operation_name == "clip":
             if not timestamps or len(timestamps) < 1:
                 raise Exception("At least one timestamp is required for clipping.")
             if len(timestamps) > 10:
                 raise Exception("Cannot process more than 10 clips.")
             
             # Perform the clipping operation
-            clip_paths = create_clips(upload_path, timestamps)
-            
+            trim_mode = operations.get("trim_mode", "fast")
+            clips = create_clips(upload_path, timestamps, trim_mode, output_name, media_info, profile)
+            clip_paths = [clip['path'] for clip in clips]  # None for clips that failed
+            clip_errors = [clip['error'] for clip in clips]
+
+            # Record how each clip was cut (copy, smart_cut or re_encode) and which clips failed
+            video_operation.operation_metadata = {
+                **operations,
+                "clip_modes": [clip['mode'] for clip in clips],
+                "clip_errors": clip_errors,
+            }
+            failed = [f"clip {idx + 1}: {error}" for idx, error in enumerate(clip_errors) if error]
+            if len(failed) == len(clips):
+                raise Exception("; ".join(failed))
+            if failed:
+                cacheable = False
+                video_operation.error_message = f"{len(failed)} of {len(clips)} clips failed: " + "; ".join(failed)
+
             # Since clip_paths is a list, store it as JSON
             video.processed_path = json.dumps(clip_paths)  # Store list as JSON
             video_operation.result_path = json.dumps(clip_paths)  # Same for VideoOperation
@@ -68,64 +442,85 @@ def process_video_task(self, video_id, filename, operations):
                 raise Exception("Cannot merge more than 10 clips.")
             
             # Perform merging operation
-            merged_clip_result = merge_clips(upload_path, timestamps)
-            video.processed_path = merged_clip_result  # Single path for the merged video
-            video_operation.result_path = merged_clip_result
+            trim_mode = operations.get("trim_mode", "fast")
+            merged_clip_result = merge_clips(upload_path, timestamps, trim_mode, output_name, media_info, profile)
+
+            # Record whether the segments were joined losslessly and how each one was cut
+            video_operation.operation_metadata = {
+                **operations,
+                "merge_mode": merged_clip_result['mode'],
+                "segment_modes": merged_clip_result['segment_modes'],
+            }
+            video.processed_path = merged_clip_result['path']  # Single path for the merged video
+            video_operation.result_path = merged_clip_result['path']
         
         elif operation_name == "change_aspect_ratio":
-            aspect_ratio = operations.get("aspect_ratio")
-            if not aspect_ratio:
-                raise Exception("Aspect ratio must be provided for changing aspect ratio.")
-            valid_aspect_ratios = ["16:9", "9:16", "1:1", "4:3"]
-            if aspect_ratio not in valid_aspect_ratios:
-                raise Exception(f"Invalid aspect ratio. Valid options are: {', '.join(valid_aspect_ratios)}")
-            
+            validate_aspect_ratio_options(operations)
+
             # Perform aspect ratio change
-            change_aspect_ratio(upload_path, aspect_ratio)
-            video.processed_path = upload_path  # Assuming the path remains the same after processing
-            video_operation.result_path = upload_path
+            result = change_aspect_ratio(upload_path, operations["aspect_ratio"], output_name, media_info,
+                                         operations.get("mode", ASPECT_MODE_CROP), operations.get("resolution"), profile)
+            video.processed_path = result
+            video_operation.result_path = result
         
         elif operation_name == "add_logo":
             logo_path = os.path.join(current_app.config['LOGO_FOLDER'], operations.get("logo_filename"))
             position = operations.get("position", "bottom_right")  # Default to 'bottom_right'
             
             # Perform logo addition
-            result = add_logo_to_video(upload_path, logo_path, position)
+            result = add_logo_to_video(upload_path, logo_path, position, output_name, media_info,
+                                       operations.get("scale"), operations.get("opacity", 1.0), profile)
             video.processed_path = result
             video_operation.result_path = result
 
-        # Update the operation log entry with success details
-        video_operation.status = 'completed'
-        video_operation.end_time = datetime.utcnow()
-        video_operation.duration = (video_operation.end_time - video_operation.start_time).total_seconds()
-        db.session.commit()
+        elif operation_name == "burn_captions":
+            result = burn_captions(upload_path, operations, output_name, media_info, profile)
+            video.processed_path = result
+            video_operation.result_path = result
 
-        # Update the video status to 'completed'
-        video.status = Video.STATUS_COMPLETED
-        db.session.commit()
+        elif operation_name == "package_hls":
+            result = package_hls(upload_path, operations, output_name, media_info, profile)
+            video.processed_path = result
+            video_operation.result_path = result
 
-        # Clean up the upload path if needed
-        if os.path.exists(upload_path):
-            os.remove(upload_path)
+        elif operation_name == "caption":
+            # Only the audio is decoded and transcribed, by the model this worker keeps loaded
+            formats = operations.get("formats", list(CAPTION_FORMATS))
+            caption_paths = generate_captions_whisper(upload_path, output_name, operations.get("language"), formats)
+            video.processed_path = json.dumps(caption_paths)
+            video_operation.result_path = json.dumps(caption_paths)
 
-        logging.info(f'Completed processing for video_id: {video_id}')
+        # Package the single video the operations produced; it is replaced by its renditions
+        if hls_step:
+            source_path = output_paths(video.processed_path)[0]
+            result = package_hls(source_path, hls_step, output_name, profile=profile)
+            video_operations[-1].result_path = result
+            video.processed_path = result
+            if os.path.isfile(source_path):
+                os.remove(source_path)
 
-    except Exception as e:
-        logging.error(f'Error processing video_id: {video_id} - {str(e)}')
+        # Operations that report per-item errors, like clips, return normally when aborted
+        tracker.check_aborted(force=True)
 
-        # Update the operation log entry with failure details
-        if video_operation:
-            video_operation.status = 'failed'
-            video_operation.error_message = str(e)
-            video_operation.end_time = datetime.utcnow()
-            video_operation.duration = (video_operation.end_time - video_operation.start_time).total_seconds() if video_operation.start_time else None
-            db.session.commit()
+        if work_name:
+            video.processed_path = publish_outputs(video.processed_path, work_name, final_name)
+            for step_operation in video_operations:
+                step_operation.result_path = shared_output_path(step_operation.result_path, work_name, final_name)
 
-        # Mark the video status as failed
-        video = Video.query.get(video_id)
-        if video:
-            video.status = Video.STATUS_FAILED
-            db.session.commit()
+        observe_encode(job_operation_name(video_operations), tracker)
+        mark_completed(video, video_operations, requested_operations, upload_path, cacheable)
+
+    except Exception as e:
+        # Services wrap errors in their own messages, so the tracker tells whether the job was aborted
+        if isinstance(e, ProcessingAborted) or (tracker and tracker.aborted):
+            db.session.rollback()
+            mark_aborted(video_id, video_operations, upload_path, tracker.outputs if tracker else (), work_name)
+            return
+
+        mark_failed(video_id, video_operations, e, self.request.retries < PROCESS_MAX_RETRIES, upload_path)
 
         # Optionally, raise the error for Celery to retry the task
-        raise self.retry(exc=e, countdown=60, max_retries=3)
+        raise self.retry(exc=e, countdown=60, max_retries=PROCESS_MAX_RETRIES)
+
+    finally:
+        stop_tracking()
@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+
+
+def post_fork(server, worker):
+    """
+    Make psycopg2 wait for Postgres through the gevent hub in every gevent worker.
+
+    gevent patches Python sockets but not libpq, so without this hook each query blocks the whole
+    worker, including every event stream it keeps open. The patch has to be applied before the
+    worker loads the app and opens its first connection.
+    """
+    if server.cfg.worker_class_str == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        worker.log.info("Patched psycopg2 for gevent")
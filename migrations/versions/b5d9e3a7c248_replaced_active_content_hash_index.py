@@ -0,0 +1,32 @@
+"""replaced active content hash index
+
+Revision ID: b5d9e3a7c248
+Revises: a83f5d2c6e10
+Create Date: 2026-10-18 23:27:13.950418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d9e3a7c248'
+down_revision = 'a83f5d2c6e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The full ix_videos_content_hash already serves upload lookups, which also match videos with
+    # queued previews and so cannot use a partial index on the processing status
+    with op.get_context().autocommit_block():
+        op.create_index('ix_videos_active_status_id', 'videos', ['status', 'id'], unique=False,
+                        postgresql_where=sa.text("status IN ('queued', 'processing')"), postgresql_concurrently=True)
+        op.drop_index('ix_videos_active_content_hash', table_name='videos', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_videos_active_content_hash', 'videos', ['content_hash'], unique=False,
+                        postgresql_where=sa.text("status IN ('queued', 'processing')"), postgresql_concurrently=True)
+        op.drop_index('ix_videos_active_status_id', table_name='videos', postgresql_concurrently=True)
@@ -0,0 +1,39 @@
+"""added query indexes
+
+Revision ID: c41d7e2a9f08
+Revises: 9b2e4d1c7a35
+Create Date: 2026-10-18 14:36:05.274119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e2a9f08'
+down_revision = '9b2e4d1c7a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built CONCURRENTLY so a large videos table stays writable while the indexes are created;
+    # that cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_videos_status_id', 'videos', ['status', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_videos_created_at_id', 'videos', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_videos_active_content_hash', 'videos', ['content_hash'], unique=False,
+                        postgresql_where=sa.text("status IN ('queued', 'processing')"), postgresql_concurrently=True)
+        op.create_index(op.f('ix_videos_task_id'), 'videos', ['task_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_video_operations_video_id_id', 'video_operations', ['video_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_video_operations_task_id'), 'video_operations', ['task_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_video_operations_task_id'), table_name='video_operations', postgresql_concurrently=True)
+        op.drop_index('ix_video_operations_video_id_id', table_name='video_operations', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_videos_task_id'), table_name='videos', postgresql_concurrently=True)
+        op.drop_index('ix_videos_active_content_hash', table_name='videos', postgresql_concurrently=True)
+        op.drop_index('ix_videos_created_at_id', table_name='videos', postgresql_concurrently=True)
+        op.drop_index('ix_videos_status_id', table_name='videos', postgresql_concurrently=True)
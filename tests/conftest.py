@@ -0,0 +1,21 @@
+import os
+
+# The app is created when the package is imported; tests run against an in-memory database
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+from app import app as flask_app
+from app.extensions import db
+
+
+@pytest.fixture
+def app():
+    return flask_app
+
+
+@pytest.fixture
+def database(app):
+    db.create_all()
+    yield db
+    db.session.remove()
+    db.drop_all()
@@ -0,0 +1,61 @@
+import pytest
+from app.services.videos.caption_bitmaps import parse_captions, map_cues, caption_timeline
+
+
+def test_parse_captions_reads_srt(tmp_path):
+    path = tmp_path / 'captions.srt'
+    path.write_bytes(
+        b"1\r\n00:00:01,000 --> 00:00:02,500\r\n<i>Hello</i> there\r\n\r\n"
+        b"2\r\n00:00:00,200 --> 00:00:00,800\r\nFirst\r\nline two\r\n\r\n"
+        b"3\r\n00:00:03,000 --> 00:00:04,000\r\n\r\n"
+    )
+
+    assert parse_captions(str(path)) == [(0.2, 0.8, 'First\nline two'), (1.0, 2.5, 'Hello there')]
+
+
+def test_parse_captions_reads_vtt(tmp_path):
+    path = tmp_path / 'captions.vtt'
+    path.write_text(
+        "WEBVTT\n\nNOTE a comment\n\n"
+        "intro\n01:02.500 --> 01:04.000 align:start\nShort timestamps\n\n"
+        "01:00:00.000 --> 01:00:01.000\nLong timestamps\n"
+    )
+
+    assert parse_captions(str(path)) == [(62.5, 64.0, 'Short timestamps'), (3600.0, 3601.0, 'Long timestamps')]
+
+
+def test_parse_captions_rejects_a_file_without_cues(tmp_path):
+    path = tmp_path / 'captions.vtt'
+    path.write_text("WEBVTT\n")
+
+    with pytest.raises(Exception, match="no cues"):
+        parse_captions(str(path))
+
+
+def test_map_cues_moves_cues_onto_the_trimmed_output():
+    cues = [(1.0, 3.0, 'a'), (9.0, 12.0, 'b'), (20.0, 21.0, 'c')]
+
+    mapped = map_cues(cues, [(2.0, 10.0), (11.0, 15.0)])
+
+    assert mapped == [(0.0, 1.0, 'a'), (7.0, 8.0, 'b'), (8.0, 9.0, 'b')]
+
+
+def test_map_cues_keeps_cues_of_the_whole_video():
+    cues = [(1.0, 3.0, 'a')]
+
+    assert map_cues(cues, [(None, None)]) == cues
+
+
+def test_caption_timeline_stacks_overlapping_cues():
+    cues = [(0.0, 10.0, 'long'), (2.0, 3.0, 'short'), (12.0, 13.0, 'later')]
+
+    assert caption_timeline(cues) == [
+        (0.0, 2.0, 'long'),
+        (2.0, 3.0, 'long\nshort'),
+        (3.0, 10.0, 'long'),
+        (12.0, 13.0, 'later'),
+    ]
+
+
+def test_caption_timeline_joins_back_to_back_cues_with_the_same_text():
+    assert caption_timeline([(0.0, 1.0, 'same'), (1.0, 2.0, 'same')]) == [(0.0, 2.0, 'same')]
@@ -0,0 +1,21 @@
+from app.services.videos.clip_engine import group_ranges
+
+
+def test_group_ranges_merges_overlapping_and_touching_clips():
+    clips = [
+        {'start': 30.0, 'end': 40.0, 'path': 'c'},
+        {'start': 0.0, 'end': 10.0, 'path': 'a'},
+        {'start': 10.0, 'end': 15.0, 'path': 'b'},
+        {'start': 35.0, 'end': 38.0, 'path': 'd'},
+    ]
+
+    groups = group_ranges(clips)
+
+    assert [(group['start'], group['end']) for group in groups] == [(0.0, 15.0), (30.0, 40.0)]
+    assert [[clip['path'] for clip in group['clips']] for group in groups] == [['a', 'b'], ['c', 'd']]
+
+
+def test_group_ranges_keeps_separate_clips_apart():
+    groups = group_ranges([{'start': 20.0, 'end': 25.0, 'path': 'b'}, {'start': 0.0, 'end': 5.0, 'path': 'a'}])
+
+    assert [(group['start'], group['end']) for group in groups] == [(0.0, 5.0), (20.0, 25.0)]
@@ -0,0 +1,25 @@
+import pytest
+from app.services.job_routing import estimate_job_cost, COST_FACTOR_COPY
+
+CLIP = {'name': 'clip', 'timestamps': [{'start': '00:00:10', 'end': 40}]}
+
+
+def test_fast_clips_cost_a_fraction_of_their_length():
+    assert estimate_job_cost(CLIP, 600.0) == pytest.approx(30.0 * COST_FACTOR_COPY)
+
+
+def test_re_encoded_clips_cost_their_length():
+    assert estimate_job_cost({**CLIP, 'trim_mode': 're_encode'}, 600.0) == pytest.approx(30.0)
+
+
+def test_whole_video_operations_cost_the_source_length():
+    assert estimate_job_cost({'name': 'add_logo'}, 600.0) == pytest.approx(600.0)
+
+
+def test_pipelines_encode_their_output_once():
+    assert estimate_job_cost([CLIP, {'name': 'add_logo'}, {'name': 'burn_captions'}], 600.0) == pytest.approx(30.0)
+
+
+def test_hls_costs_one_encode_per_rendition():
+    assert estimate_job_cost({'name': 'package_hls', 'renditions': [720, 360]}, 100.0) == pytest.approx(200.0)
+    assert estimate_job_cost([CLIP, {'name': 'package_hls'}], 600.0) == pytest.approx(30.0 * COST_FACTOR_COPY + 90.0)
@@ -0,0 +1,32 @@
+import pytest
+from app.models.video import Video
+from app.services.pagination import keyset_page, decode_cursor
+
+
+def test_keyset_page_walks_every_row_once(database):
+    database.session.add_all([Video(filename=f"video_{idx}.mp4", status=Video.STATUS_COMPLETED) for idx in range(5)])
+    database.session.commit()
+
+    pages = []
+    after = None
+    while True:
+        items, after = keyset_page(Video.query, Video.id, after, 2)
+        pages.append([item.filename for item in items])
+        if after is None:
+            break
+
+    assert pages == [['video_0.mp4', 'video_1.mp4'], ['video_2.mp4', 'video_3.mp4'], ['video_4.mp4']]
+
+
+def test_keyset_page_ends_on_a_full_last_page(database):
+    database.session.add_all([Video(filename=f"video_{idx}.mp4", status=Video.STATUS_COMPLETED) for idx in range(2)])
+    database.session.commit()
+
+    items, after = keyset_page(Video.query, Video.id, None, 2)
+
+    assert len(items) == 2 and after is None
+
+
+def test_decode_cursor_rejects_foreign_tokens():
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
@@ -0,0 +1,23 @@
+from app.services.result_cache import normalize_operations, operations_key
+
+
+def test_equivalent_requests_normalize_to_the_same_spec():
+    single = {'name': 'clip', 'timestamps': [{'start': '00:00:10', 'end': 20}]}
+    listed = [{'timestamps': [{'end': '00:00:20', 'start': 10.0}], 'name': 'clip'}]
+
+    assert normalize_operations(single) == normalize_operations(listed)
+    assert operations_key(single) == operations_key(listed)
+
+
+def test_different_requests_keep_different_specs():
+    first = {'name': 'clip', 'timestamps': [{'start': 10, 'end': 20}]}
+    second = {'name': 'clip', 'timestamps': [{'start': 10, 'end': 21}]}
+
+    assert operations_key(first) != operations_key(second)
+
+
+def test_step_order_is_part_of_the_spec():
+    logo = {'name': 'add_logo', 'logo_filename': 'logo.png'}
+    captions = {'name': 'burn_captions', 'captions_filename': 'captions.srt'}
+
+    assert normalize_operations([logo, captions]) != normalize_operations([captions, logo])
@@ -0,0 +1,20 @@
+from app.services.videos.segmented_encode import plan_segments
+
+
+def test_plan_segments_starts_every_segment_on_a_keyframe():
+    keyframes = [float(second) for second in range(0, 300, 7)]
+
+    segments = plan_segments(300.0, keyframes, 120.0)
+
+    assert segments == [(0.0, 126.0), (126.0, 252.0), (252.0, 300.0)]
+    assert all(start in keyframes for start, _ in segments)
+
+
+def test_plan_segments_merges_a_short_tail_into_the_last_segment():
+    keyframes = [float(second) for second in range(0, 250, 10)]
+
+    assert plan_segments(250.0, keyframes, 120.0) == [(0.0, 120.0), (120.0, 250.0)]
+
+
+def test_plan_segments_keeps_a_short_video_whole():
+    assert plan_segments(90.0, [0.0, 30.0, 60.0], 120.0) == [(0.0, 90.0)]
@@ -0,0 +1,31 @@
+from app.services.videos.trim import choose_trim_mode, TRIM_MODE_COPY, TRIM_MODE_SMART_CUT, TRIM_MODE_REENCODE
+
+PROBE = {'duration': 60.0, 'video_codec': 'h264'}
+KEYFRAMES = [float(second) for second in range(0, 60, 2)]
+TOLERANCE = 0.5
+
+
+def test_copies_a_range_starting_on_a_keyframe_whatever_its_end():
+    assert choose_trim_mode(2.1, 5.3, KEYFRAMES, PROBE, TOLERANCE) == (TRIM_MODE_COPY, 2.0, 5.3)
+
+
+def test_copy_snaps_an_end_near_the_end_of_the_video():
+    assert choose_trim_mode(10.0, 59.8, KEYFRAMES, PROBE, TOLERANCE) == (TRIM_MODE_COPY, 10.0, 60.0)
+
+
+def test_smart_cuts_a_range_starting_between_keyframes():
+    assert choose_trim_mode(3.0, 9.0, KEYFRAMES, PROBE, TOLERANCE) == (TRIM_MODE_SMART_CUT, 3.0, 9.0)
+
+
+def test_re_encodes_when_the_source_does_not_match_the_encoder():
+    assert choose_trim_mode(3.0, 9.0, KEYFRAMES, PROBE, TOLERANCE, smart_cut_allowed=False) == (TRIM_MODE_REENCODE, 3.0, 9.0)
+
+
+def test_re_encodes_codecs_that_cannot_be_smart_cut():
+    probe = {**PROBE, 'video_codec': 'mpeg4'}
+
+    assert choose_trim_mode(3.0, 9.0, KEYFRAMES, probe, TOLERANCE) == (TRIM_MODE_REENCODE, 3.0, 9.0)
+
+
+def test_re_encodes_a_range_within_one_gop():
+    assert choose_trim_mode(3.0, 4.5, KEYFRAMES, PROBE, TOLERANCE) == (TRIM_MODE_REENCODE, 3.0, 4.5)
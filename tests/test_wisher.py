@@ -0,0 +1,109 @@
+import subprocess
+import pytest
+from app.services.captioning import wisher
+from app.services.progress import start_tracking, stop_tracking
+from app.services.videos.caption_bitmaps import parse_captions
+from app.services.videos.ffmpeg_utils import ffmpeg_binary
+
+WORDS = {1: ' Hello', 2: ' world', 3: ' again'}
+
+
+class StubTokenizer:
+    """Whisper tokenizer with a three word vocabulary; ids from timestamp_begin are timestamps."""
+    eot = 50257
+    timestamp_begin = 50364
+
+    def decode(self, tokens):
+        return ''.join(WORDS[token] for token in tokens)
+
+
+def timestamp(seconds):
+    return StubTokenizer.timestamp_begin + round(seconds / wisher.TIME_PRECISION)
+
+
+class StubModel:
+    """Stands in for a Whisper model: every window decodes to one segment naming its offset."""
+
+    def __init__(self):
+        self.batches = []
+
+    def decode(self, chunks):
+        self.batches.append([(offset, len(samples)) for offset, samples in chunks])
+        return [(offset, offset + 1.0, f"window at {offset:.0f}") for offset, _ in chunks]
+
+
+def test_segments_from_tokens_splits_on_timestamp_pairs():
+    tokens = [timestamp(0.0), 1, 2, timestamp(2.4), timestamp(2.4), 3, timestamp(5.0), StubTokenizer.eot]
+
+    segments = wisher.segments_from_tokens(tokens, StubTokenizer(), 30.0, 30.0)
+
+    assert segments == [(30.0, pytest.approx(32.4), 'Hello world'), (pytest.approx(32.4), 35.0, 'again')]
+
+
+def test_segments_from_tokens_runs_unclosed_text_to_end_of_window():
+    tokens = [timestamp(1.0), 1, StubTokenizer.eot]
+
+    assert wisher.segments_from_tokens(tokens, StubTokenizer(), 60.0, 12.5) == [(61.0, 72.5, 'Hello')]
+
+
+def test_segments_from_tokens_clamps_timestamps_to_window():
+    tokens = [timestamp(0.0), 1, timestamp(29.0)]
+
+    assert wisher.segments_from_tokens(tokens, StubTokenizer(), 0.0, 10.0) == [(0.0, 10.0, 'Hello')]
+
+
+def test_transcribe_audio_decodes_windows_in_batches(app, monkeypatch, tmp_path):
+    audio_path = str(tmp_path / 'tone.wav')
+    subprocess.run([ffmpeg_binary(), '-v', 'error', '-f', 'lavfi', '-i', 'sine=duration=70', audio_path], check=True)
+    model = StubModel()
+    monkeypatch.setattr(wisher, '_model', model)
+    monkeypatch.setattr(wisher, 'transcribe_batch', lambda batch_model, chunks, language=None: batch_model.decode(chunks))
+    monkeypatch.setitem(app.config, 'CAPTION_BATCH_SIZE', 2)
+
+    tracker = start_tracking(1, 70.0, report_progress=False)
+    try:
+        segments = wisher.transcribe_audio(audio_path, language='en')
+    finally:
+        stop_tracking()
+
+    window = wisher.SAMPLE_RATE * wisher.CHUNK_SECONDS
+    assert model.batches == [[(0.0, window), (30.0, window)], [(60.0, wisher.SAMPLE_RATE * 10)]]
+    assert [text for _, _, text in segments] == ['window at 0', 'window at 30', 'window at 60']
+    # Progress follows the full batches; transcription is no encode
+    assert tracker.processed == {'captions': 60.0}
+    assert tracker.encode_totals() == (0, 0, 0.0)
+
+
+SEGMENTS = [(0.0, 2.5, 'Hello'), (3661.007, 3662.0, 'Line two')]
+
+
+def test_write_srt(tmp_path):
+    path = tmp_path / 'captions.srt'
+
+    wisher.write_srt(SEGMENTS, str(path))
+
+    assert path.read_text(encoding='utf-8') == (
+        "1\n00:00:00,000 --> 00:00:02,500\nHello\n\n"
+        "2\n01:01:01,007 --> 01:01:02,000\nLine two\n"
+    )
+
+
+def test_write_vtt(tmp_path):
+    path = tmp_path / 'captions.vtt'
+
+    wisher.write_vtt(SEGMENTS, str(path))
+
+    assert path.read_text(encoding='utf-8') == (
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:02.500\nHello\n\n"
+        "01:01:01.007 --> 01:01:02.000\nLine two\n"
+    )
+
+
+@pytest.mark.parametrize('caption_format', wisher.CAPTION_FORMATS)
+def test_written_captions_can_be_burned(tmp_path, caption_format):
+    path = str(tmp_path / f'captions.{caption_format}')
+
+    wisher.CAPTION_WRITERS[caption_format](SEGMENTS, path)
+
+    assert parse_captions(path) == [(0.0, 2.5, 'Hello'), (pytest.approx(3661.007), 3662.0, 'Line two')]